@@ -0,0 +1,291 @@
+"""
+归档输入模块 - 不解压，直接从 ZIP/TAR 中读取图片
+"""
+
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+from PIL import Image
+from config import SUPPORTED_FORMATS
+
+
+# 归档内图片的路径形式为 "归档路径::成员路径"
+MEMBER_SEPARATOR = '::'
+
+# 支持作为输入的归档扩展名
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+# 压缩 TAR 每个归档转存已读成员的临时文件上限（字节），超出后改为重新扫描
+DEFAULT_SPOOL_LIMIT = 256 * 1024 * 1024
+
+
+def is_archive(path: str) -> bool:
+    """是否为支持的归档文件（按扩展名判断）"""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and split_member_path(path) is None
+
+
+def member_path(archive_path: str, member: str) -> str:
+    """拼接归档内图片的路径"""
+    return f"{archive_path}{MEMBER_SEPARATOR}{member}"
+
+
+def split_member_path(path: str) -> Optional[Tuple[str, str]]:
+    """拆分归档内图片的路径，返回 (归档路径, 成员路径)，普通文件返回 None
+
+    只有分隔符前是存在的归档文件时才视为归档成员，文件名本身含 "::" 的
+    普通文件（如 a::b.jpg）不受影响。
+    """
+    index = path.find(MEMBER_SEPARATOR)
+    while index != -1:
+        archive_path = path[:index]
+        if archive_path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(archive_path):
+            return archive_path, path[index + len(MEMBER_SEPARATOR):]
+        index = path.find(MEMBER_SEPARATOR, index + 1)
+    return None
+
+
+def _is_image_member(name: str) -> bool:
+    """成员是否为支持的图片（跳过 macOS 生成的 ._ 资源文件）"""
+    base_name = name.rsplit('/', 1)[-1]
+    return (not base_name.startswith('._') and
+            os.path.splitext(base_name)[1].lower() in SUPPORTED_FORMATS['input'])
+
+
+class _OpenArchive:
+    """一个已打开的归档及其读取状态"""
+
+    def __init__(self, archive, compressed: bool = False):
+        self.archive = archive
+        self.lock = threading.Lock()
+        # TAR 已读到的成员（成员路径 -> TarInfo），按名称读取时不必调用会加载整个索引的 getmember
+        self.members: Dict[str, tarfile.TarInfo] = {}
+        self.done = False
+        # 压缩 TAR 已读取成员的转存位置（成员路径 -> (偏移, 长度)），临时文件在首次读取时创建
+        self.compressed = compressed
+        self.spool = None
+        self.spool_size = 0
+        self.spooled: Dict[str, Tuple[int, int]] = {}
+
+    def close(self):
+        self.archive.close()
+        if self.spool is not None:
+            self.spool.close()
+
+
+class ArchiveReader:
+    """归档读取器类
+
+    保持最近使用的少数归档处于打开状态（ZIP 只读取一次目录），
+    成员内容直接读入内存交给 PIL 解码，不在磁盘上解压。每个归档的读取由各自的锁保护。
+
+    TAR 没有集中的目录，成员只在需要时向后读取：枚举边读边产出，按名称读取时
+    只读到该成员为止，不会加载整个索引。压缩的 TAR（.tar.gz 等）不支持随机访问，
+    向回定位需要从头解压；枚举不转存任何内容，成员被读取时才把内容转存到临时
+    文件，同一图片再次读取（缩略图、预览、导出）直接从临时文件取出。转存总量
+    超过 spool_limit 后不再转存，之后的读取重新解压定位（更慢，但不占更多磁盘）。
+    """
+
+    def __init__(self, max_open: int = 4, spool_limit: int = DEFAULT_SPOOL_LIMIT):
+        self.max_open = max_open
+        self.spool_limit = spool_limit
+        # 归档路径 -> 已打开的归档
+        self._archives: "OrderedDict[str, _OpenArchive]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_archive(self, archive_path: str) -> _OpenArchive:
+        """获取已打开的归档，没有时打开并淘汰最久未用的归档"""
+        key = os.path.abspath(archive_path)
+        with self._lock:
+            entry = self._archives.get(key)
+            if entry is not None:
+                self._archives.move_to_end(key)
+                return entry
+
+            if archive_path.lower().endswith('.zip'):
+                entry = _OpenArchive(zipfile.ZipFile(archive_path))
+            else:
+                archive = tarfile.open(archive_path, 'r:*')
+                # 未压缩的 TAR 直接读取文件，其他情况是解压流
+                entry = _OpenArchive(archive, not isinstance(archive.fileobj, io.BufferedReader))
+            self._archives[key] = entry
+            while len(self._archives) > self.max_open:
+                _, old_entry = self._archives.popitem(last=False)
+                with old_entry.lock:
+                    old_entry.close()
+            return entry
+
+    def _next_member(self, entry: _OpenArchive) -> Optional[tarfile.TarInfo]:
+        """读取 TAR 的下一个成员（调用方持有归档的锁），已到末尾时返回 None"""
+        if entry.done:
+            return None
+        info = entry.archive.next()
+        if info is None:
+            entry.done = True
+            return None
+        entry.members[info.name] = info
+        return info
+
+    def _spool(self, entry: _OpenArchive, member: str, data: bytes):
+        """把压缩 TAR 中读出的成员内容转存到临时文件（调用方持有归档的锁），超出上限时跳过"""
+        if entry.spool_size + len(data) > self.spool_limit:
+            return
+        if entry.spool is None:
+            entry.spool = tempfile.TemporaryFile()
+        entry.spool.seek(entry.spool_size)
+        entry.spool.write(data)
+        entry.spooled[member] = (entry.spool_size, len(data))
+        entry.spool_size += len(data)
+
+    def _find_member(self, entry: _OpenArchive, member: str) -> tarfile.TarInfo:
+        """按名称查找 TAR 成员（调用方持有归档的锁），只向后读到该成员为止"""
+        info = entry.members.get(member)
+        while info is None:
+            next_info = self._next_member(entry)
+            if next_info is None:
+                raise KeyError(f"归档中没有该成员: {member}")
+            if next_info.name == member:
+                info = next_info
+        return info
+
+    @staticmethod
+    def _split(path: str) -> Tuple[str, str]:
+        """拆分成员路径，归档不存在时抛出 FileNotFoundError"""
+        parts = split_member_path(path)
+        if parts is None:
+            raise FileNotFoundError(f"归档不存在: {path}")
+        return parts
+
+    def iter_images(self, archive_path: str) -> Iterator[str]:
+        """惰性枚举归档中的图片，产出 "归档路径::成员路径" """
+        entry = self._get_archive(archive_path)
+        archive = entry.archive
+        if isinstance(archive, zipfile.ZipFile):
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image_member(info.filename):
+                    yield member_path(archive_path, info.filename)
+            return
+
+        index = 0
+        while True:
+            with entry.lock:
+                # TarFile 会记住已读过的成员，只在需要时继续向后读取
+                if index >= len(archive.members) and self._next_member(entry) is None:
+                    return
+                info = archive.members[index]
+            index += 1
+            if info.isfile() and _is_image_member(info.name):
+                yield member_path(archive_path, info.name)
+
+    def read(self, path: str) -> bytes:
+        """读取归档内图片的内容"""
+        archive_path, member = self._split(path)
+        entry = self._get_archive(archive_path)
+        with entry.lock:
+            if isinstance(entry.archive, zipfile.ZipFile):
+                return entry.archive.read(member)
+            if member in entry.spooled:
+                offset, size = entry.spooled[member]
+                entry.spool.seek(offset)
+                return entry.spool.read(size)
+            info = self._find_member(entry, member)
+            # 传入 TarInfo 而不是名称，避免 extractfile 通过 getmember 加载整个索引
+            f = entry.archive.extractfile(info)
+            if f is None:
+                raise KeyError(f"归档成员不是文件: {member}")
+            data = f.read()
+            if entry.compressed:
+                self._spool(entry, member, data)
+            return data
+
+    def exists(self, path: str) -> bool:
+        """归档内是否存在该成员"""
+        parts = split_member_path(path)
+        if parts is None:
+            return False
+        archive_path, member = parts
+        try:
+            entry = self._get_archive(archive_path)
+            with entry.lock:
+                if isinstance(entry.archive, zipfile.ZipFile):
+                    entry.archive.getinfo(member)
+                else:
+                    self._find_member(entry, member)
+            return True
+        except (KeyError, OSError, zipfile.BadZipFile, tarfile.TarError):
+            return False
+
+    def get_mtime(self, path: str) -> float:
+        """获取成员在归档中记录的修改时间"""
+        archive_path, member = self._split(path)
+        entry = self._get_archive(archive_path)
+        with entry.lock:
+            if isinstance(entry.archive, zipfile.ZipFile):
+                return time.mktime(entry.archive.getinfo(member).date_time + (0, 0, -1))
+            return self._find_member(entry, member).mtime
+
+    def close(self):
+        """关闭所有打开的归档"""
+        with self._lock:
+            for entry in self._archives.values():
+                with entry.lock:
+                    entry.close()
+            self._archives.clear()
+
+
+# 全局共享的读取器，解码路径统一通过下面的函数访问图片
+archive_reader = ArchiveReader()
+
+
+def iter_archive_images(archive_path: str) -> Iterator[str]:
+    """惰性枚举归档中的图片"""
+    return archive_reader.iter_images(archive_path)
+
+
+def open_image(path: str) -> Image.Image:
+    """打开图片，支持普通文件和归档内的图片"""
+    if split_member_path(path) is None:
+        return Image.open(path)
+    return Image.open(io.BytesIO(archive_reader.read(path)))
+
+
+def open_source(path: str):
+    """以二进制方式打开图片源文件，返回文件对象"""
+    if split_member_path(path) is None:
+        return open(path, 'rb')
+    return io.BytesIO(archive_reader.read(path))
+
+
+def source_exists(path: str) -> bool:
+    """图片源是否存在"""
+    if split_member_path(path) is None:
+        return os.path.exists(path)
+    return archive_reader.exists(path)
+
+
+def source_mtime(path: str) -> float:
+    """图片源的修改时间"""
+    if split_member_path(path) is None:
+        return os.path.getmtime(path)
+    return archive_reader.get_mtime(path)
+
+
+def source_directory(path: str) -> str:
+    """图片所在目录；归档内的图片视为位于以归档名命名的目录下（用于保持目录结构）"""
+    parts = split_member_path(path)
+    if parts is None:
+        return os.path.dirname(os.path.abspath(path))
+    archive_path, member = parts
+    archive_dir = os.path.abspath(archive_path)
+    for ext in ARCHIVE_EXTENSIONS:
+        if archive_dir.lower().endswith(ext):
+            archive_dir = archive_dir[:-len(ext)]
+            break
+    member_dir = os.path.dirname(member.replace('\\', '/'))
+    return os.path.join(archive_dir, *member_dir.split('/')) if member_dir else archive_dir
@@ -0,0 +1,131 @@
+"""
+归档输出模块 - 把编码好的图片直接从内存流式写入 ZIP/TAR 文件
+"""
+
+import io
+import os
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+from typing import Dict, Optional
+
+
+# 支持的归档格式及扩展名
+ARCHIVE_FORMATS = {
+    'zip': '.zip',
+    'tar': '.tar'
+}
+
+
+class ArchiveWriter:
+    """归档写入器类
+
+    导出线程把编码后的文件内容交给 write()，由后台写入线程依次追加到
+    归档中（write-behind）。ZIP 使用 ZIP_STORED，不再对 JPEG/PNG 重复压缩；
+    TAR 不压缩。队列有上限，写入跟不上时 write() 阻塞，内存占用有界。
+    归档先写到 .part 临时文件，close() 成功后才改名为目标文件。
+    """
+
+    def __init__(self, archive_path: str, archive_format: Optional[str] = None, queue_size: int = 16):
+        if archive_format is None:
+            archive_format = os.path.splitext(archive_path)[1].lstrip('.').lower()
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"不支持的归档格式: {archive_format}")
+        self.archive_path = archive_path
+        self.archive_format = archive_format
+        self.temp_path = archive_path + '.part'
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self.files = 0
+        self.bytes_written = 0
+
+        if archive_format == 'zip':
+            self._archive = zipfile.ZipFile(self.temp_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(self.temp_path, 'w', format=tarfile.PAX_FORMAT)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, name: str, data: bytes, mtime: Optional[float] = None):
+        """提交一个文件（归档内路径使用 / 分隔），写入线程出错时抛出该错误"""
+        self._raise_error()
+        if self._closed:
+            raise ValueError("归档已关闭")
+        self._queue.put((name.replace(os.sep, '/'), data, mtime or time.time()))
+
+    def _run(self):
+        """写入线程"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                # 出错后丢弃剩余文件，只等待关闭
+                continue
+            name, data, mtime = item
+            try:
+                if self.archive_format == 'zip':
+                    info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+                    info.compress_type = zipfile.ZIP_STORED
+                    self._archive.writestr(info, data)
+                else:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    info.mtime = mtime
+                    self._archive.addfile(info, io.BytesIO(data))
+                self.files += 1
+                self.bytes_written += len(data)
+            except BaseException as e:
+                print(f"写入归档失败 {name}: {e}")
+                self._error = e
+
+    def _raise_error(self):
+        """写入线程出错时在调用方线程重新抛出"""
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """等待剩余文件写完并完成归档"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._archive.close()
+        if self._error is not None:
+            self._discard()
+            raise self._error
+        os.replace(self.temp_path, self.archive_path)
+
+    def abort(self):
+        """放弃归档并删除临时文件"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+            self._archive.close()
+        self._discard()
+
+    def _discard(self):
+        """删除临时文件"""
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def get_statistics(self) -> Dict[str, int]:
+        """获取已写入的文件数和字节数"""
+        return {'files': self.files, 'bytes': self.bytes_written, 'pending': self._queue.qsize()}
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
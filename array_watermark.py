@@ -0,0 +1,120 @@
+"""
+数组水印模块 - 直接在 NumPy 数组（HxWxC 或 NxHxWxC，uint8）上合成水印
+"""
+
+from typing import Any, Dict, Tuple
+from PIL import Image
+from watermark_engine import PLACEMENT_KEYS
+from watermark_geometry import WatermarkGeometry
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖，只有数组接口需要
+    np = None
+
+
+def require_numpy():
+    """确认 numpy 可用"""
+    if np is None:
+        raise ImportError("数组接口需要安装 numpy: pip install numpy")
+
+
+class PreparedArrayWatermark:
+    """预处理好的数组水印
+
+    把已旋转的水印图层转换为混合所需的数组（只保留不透明区域），
+    同一水印可以反复合成到任意多帧上，不再创建 PIL 图像。
+    混合公式与 PIL 的 paste(mask) 相同，结果与 WatermarkEngine.paste_watermark 逐像素一致。
+    """
+
+    def __init__(self, layer: Image.Image, watermark_size: Tuple[int, int], watermark_config: Dict[str, Any]):
+        require_numpy()
+        self.watermark_size = watermark_size
+        self.rotation = watermark_config.get('rotation', 0)
+        self.placement = {key: watermark_config[key] for key in PLACEMENT_KEYS if key in watermark_config}
+        self._geometries: Dict[Tuple[int, int], WatermarkGeometry] = {}
+
+        rgba = np.asarray(layer.convert('RGBA'))
+        alpha = rgba[..., 3]
+        rows = np.flatnonzero(alpha.any(axis=1))
+        cols = np.flatnonzero(alpha.any(axis=0))
+        if len(rows) == 0:
+            # 完全透明的水印，不需要合成
+            self.bbox = (0, 0, 0, 0)
+            self._inverse = None
+            self._color = None
+            return
+        top, bottom = rows[0], rows[-1] + 1
+        left, right = cols[0], cols[-1] + 1
+        self.bbox = (int(left), int(top), int(right), int(bottom))
+
+        rgba = rgba[top:bottom, left:right].astype(np.uint16)
+        alpha = rgba[..., 3:4]
+        # PIL: out = DIV255(dst * (255 - a) + src * a)，DIV255(x) = ((x + 128) >> 8 + (x + 128)) >> 8
+        self._inverse = 255 - alpha
+        self._color = rgba * alpha + 128
+
+    def get_geometry(self, image_size: Tuple[int, int]) -> WatermarkGeometry:
+        """获取水印在指定尺寸图片中的几何信息（按尺寸缓存）"""
+        geometry = self._geometries.get(image_size)
+        if geometry is None:
+            geometry = WatermarkGeometry.from_config(
+                image_size, self.watermark_size, dict(self.placement, rotation=self.rotation)
+            )
+            self._geometries[image_size] = geometry
+        return geometry
+
+    def apply(self, array, out=None):
+        """把水印合成到 HxWxC 或 NxHxWxC 的 uint8 数组上
+
+        out 为 None 时原地修改 array；否则结果写入 out（形状和类型必须与 array 相同），
+        array 保持不变。返回写入结果的数组。
+        """
+        require_numpy()
+        if not isinstance(array, np.ndarray) or array.dtype != np.uint8:
+            raise ValueError("只支持 uint8 类型的 numpy 数组")
+        if array.ndim not in (3, 4) or array.shape[-1] not in (3, 4):
+            raise ValueError(f"数组形状应为 HxWxC 或 NxHxWxC（C 为 3 或 4），实际为 {array.shape}")
+        if out is None:
+            out = array
+        else:
+            if not isinstance(out, np.ndarray) or out.shape != array.shape or out.dtype != array.dtype:
+                raise ValueError("输出数组的形状和类型必须与输入相同")
+            if out is not array:
+                np.copyto(out, array)
+
+        if self._color is None:
+            return out
+
+        height, width, channels = array.shape[-3:]
+        x, y = self.get_geometry((width, height)).position
+        left, top, right, bottom = self.bbox
+        # 水印区域与图片求交（PIL 粘贴时同样会裁剪超出部分）
+        x0, y0 = max(0, x + left), max(0, y + top)
+        x1, y1 = min(width, x + right), min(height, y + bottom)
+        if x0 >= x1 or y0 >= y1:
+            return out
+
+        src_x, src_y = x0 - x - left, y0 - y - top
+        inverse = self._inverse[src_y:src_y + y1 - y0, src_x:src_x + x1 - x0]
+        color = self._color[src_y:src_y + y1 - y0, src_x:src_x + x1 - x0, :channels]
+
+        region = out[..., y0:y1, x0:x1, :]
+        blended = region.astype(np.uint16)
+        blended *= inverse
+        blended += color
+        blended += blended >> 8
+        blended >>= 8
+        region[...] = blended
+        return out
+
+
+def passthrough_array(array, out=None):
+    """没有水印时的处理：原地模式直接返回输入，否则复制到输出数组"""
+    require_numpy()
+    if out is None or out is array:
+        return array
+    if not isinstance(out, np.ndarray) or out.shape != array.shape or out.dtype != array.dtype:
+        raise ValueError("输出数组的形状和类型必须与输入相同")
+    np.copyto(out, array)
+    return out
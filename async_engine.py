@@ -0,0 +1,138 @@
+"""
+异步批处理模块 - 在 asyncio 中调度水印任务到线程池或进程池
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Optional, Union
+from config import DEFAULT_SETTINGS
+from output_writer import atomic_write
+from watermark_engine import WatermarkEngine
+
+
+# 执行任务的水印引擎：线程池共用一个，进程池中每个进程一个
+_job_engine: Optional[WatermarkEngine] = None
+
+
+def _get_job_engine() -> WatermarkEngine:
+    """获取当前进程中的水印引擎"""
+    global _job_engine
+    if _job_engine is None:
+        _job_engine = WatermarkEngine(watermark_cache_size=32)
+    return _job_engine
+
+
+def run_job(source: Any, watermark_config: Dict[str, Any], export_config: Dict[str, Any],
+            output_path: Optional[str] = None) -> Union[bytes, str]:
+    """执行一个任务：有 output_path 时原子写入文件并返回路径，否则返回编码后的数据"""
+    data = _get_job_engine().encode(source, watermark_config, export_config)
+    if data is None:
+        raise ValueError("无法处理该图片")
+    if output_path:
+        atomic_write(output_path, data)
+        return output_path
+    return data
+
+
+async def _iterate(jobs: Union[AsyncIterable, Iterable]) -> AsyncIterator:
+    """把普通可迭代对象包装为异步迭代器"""
+    for job in jobs:
+        yield job
+
+
+class AsyncWatermarkEngine:
+    """异步水印引擎类
+
+    process_many() 从（异步）可迭代对象中按需读取任务，同时执行的任务
+    不超过 max_concurrency 个，哪个先完成就先产出哪个结果。任务是字典：
+        source: 图片路径、bytes 或 PIL 图片等（同 WatermarkEngine.encode）
+        output_path: 可选，输出文件路径（所在目录需已存在），不提供时结果为编码数据
+        watermark_config / export_config: 可选，默认使用构造时传入的配置
+    结果也是字典：job、ok、result（路径或数据）、error、elapsed（秒）。
+
+    单个任务超时只会放弃等待（结果中 error 为 'timeout'），已经开始执行的
+    线程/进程会继续运行到结束；取消 process_many（或提前关闭迭代）会取消
+    所有尚未完成的任务。
+    """
+
+    def __init__(self, max_concurrency: int = 4, use_processes: bool = False,
+                 executor: Optional[Executor] = None,
+                 watermark_config: Optional[Dict[str, Any]] = None,
+                 export_config: Optional[Dict[str, Any]] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self._owns_executor = executor is None
+        if executor is None:
+            executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            executor = executor_class(self.max_concurrency)
+        self.executor = executor
+        self.watermark_config = watermark_config or dict(DEFAULT_SETTINGS['watermark'])
+        self.export_config = export_config or dict(DEFAULT_SETTINGS['export'])
+
+    async def process(self, job: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """执行单个任务，返回结果字典（失败和超时不抛出异常）"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        future = loop.run_in_executor(
+            self.executor, run_job, job['source'],
+            job.get('watermark_config') or self.watermark_config,
+            job.get('export_config') or self.export_config,
+            job.get('output_path')
+        )
+        result = {'job': job, 'ok': False, 'result': None, 'error': None}
+        try:
+            result['result'] = await asyncio.wait_for(future, timeout)
+            result['ok'] = True
+        except asyncio.TimeoutError:
+            result['error'] = 'timeout'
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            result['error'] = str(e)
+        result['elapsed'] = time.perf_counter() - start
+        return result
+
+    async def process_many(self, jobs: Union[AsyncIterable, Iterable],
+                           timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """并发执行任务，按完成顺序产出结果；timeout 为单个任务的超时（秒）"""
+        if not hasattr(jobs, '__aiter__'):
+            jobs = _iterate(jobs)
+        iterator = jobs.__aiter__()
+        pending = set()
+        exhausted = False
+        try:
+            while True:
+                # 补足并发数后再等待，任务按需读取，不会一次性读完输入
+                while not exhausted and len(pending) < self.max_concurrency:
+                    try:
+                        job = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(self.process(job, timeout)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def close(self):
+        """关闭自己创建的线程池/进程池，等待仍在执行的任务结束"""
+        if self._owns_executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def aclose(self):
+        """在后台线程中关闭线程池/进程池，等待超时任务结束时不阻塞事件循环"""
+        await asyncio.to_thread(self.close)
+
+    async def __aenter__(self) -> 'AsyncWatermarkEngine':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
@@ -0,0 +1,423 @@
+"""
+性能基准测试脚本
+
+用法:
+    python benchmark.py memory [--count N]
+    python benchmark.py remove [--count N] [--legacy-count N]
+    python benchmark.py preview [--images A.jpg B.png ...] [--session FILE | --events N]
+                                [--size WxH] [--max-p95 MS] [--max-p99 MS] [--check-kinds K1,K2]
+                                [--save-session FILE] [--json FILE] [--photo-frames N]
+    python benchmark.py write [--count N] [--size-kb N] [--workers N] [--dir DIR]
+"""
+
+import os
+import sys
+import argparse
+import hashlib
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from image_manager import ImageItem, ImageManager, STATUS_LOADED
+from preview_stats import PreviewStats, percentile
+from output_writer import OutputWriter, DURABILITY_MODES
+
+
+class LegacyImageItem:
+    """旧版图片项结构（普通对象 + image_info 字典），仅用于内存对比"""
+
+    def __init__(self, file_path, file_hash, size, mode, image_format):
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        self.file_hash = file_hash
+        self.thumbnail = None
+        self.image_info = {
+            'size': size,
+            'mode': mode,
+            'format': image_format
+        }
+        self.status = 'loaded'
+        self.error_message = ''
+
+
+def make_compact_item(file_path, file_hash, size, mode, image_format):
+    """不读取文件直接构造图片项，仅用于基准测试"""
+    item = ImageItem.__new__(ImageItem)
+    item.file_path = file_path
+    item.file_hash = file_hash
+    item.thumbnail_store = None
+    item._thumbnail = None
+    item.width, item.height = size
+    item.mode = sys.intern(mode)
+    item.format = sys.intern(image_format)
+    item.status = STATUS_LOADED
+    item.error_message = ''
+    return item
+
+
+def measure_items(factory, count):
+    """测量构造 count 个图片项的内存占用（字节/项）"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    items = []
+    for i in range(count):
+        file_path = f"D:/photos/shoot_{i // 1000:03d}/IMG_{i:06d}.JPG"
+        file_hash = hashlib.md5(file_path.encode()).hexdigest()
+        # 尺寸元组在真实导入时由 PIL 逐项创建
+        size = (6000 + i % 7, 4000 + i % 5)
+        items.append(factory(file_path, file_hash, size, 'RGB', 'JPEG'))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return total / count, items
+
+
+def bench_memory(args):
+    """对比图片项元数据的内存占用"""
+    print(f"图片项内存占用对比（{args.count} 项）")
+    legacy_bytes, _ = measure_items(LegacyImageItem, args.count)
+    compact_bytes, _ = measure_items(make_compact_item, args.count)
+    print(f"  旧结构:  {legacy_bytes:8.1f} 字节/项")
+    print(f"  新结构:  {compact_bytes:8.1f} 字节/项")
+    print(f"  节省:    {(1 - compact_bytes / legacy_bytes) * 100:8.1f}%")
+
+
+def build_manager(count):
+    """构造含 count 张图片的管理器（不读取文件）"""
+    manager = ImageManager()
+    for i in range(count):
+        file_path = f"D:/photos/IMG_{i:06d}.JPG"
+        item = make_compact_item(file_path, '', (6000, 4000), 'RGB', 'JPEG')
+        manager.images.append(item)
+        manager._track(item)
+    return manager
+
+
+def legacy_remove_selected(images, selected_indices):
+    """旧版逐个删除算法：每删一项都重建选中集合"""
+    for index in sorted(selected_indices, reverse=True):
+        images.pop(index)
+        selected_indices = {i for i in selected_indices if i != index}
+        selected_indices = {i - 1 if i > index else i for i in selected_indices}
+    return images
+
+
+def bench_remove(args):
+    """对比批量删除与旧版逐个删除的耗时"""
+    rng = random.Random(42)
+    for fraction in (0.1, 0.5, 0.9):
+        manager = build_manager(args.count)
+        selected = rng.sample(range(args.count), int(args.count * fraction))
+        manager.selected_indices = selected
+        start = time.perf_counter()
+        removed = manager.remove_selected()
+        batch_time = time.perf_counter() - start
+        assert removed == len(selected) and manager.get_image_count() == args.count - removed
+
+        legacy_selected = set(rng.sample(range(args.legacy_count), int(args.legacy_count * fraction)))
+        images = list(range(args.legacy_count))
+        start = time.perf_counter()
+        legacy_remove_selected(images, legacy_selected)
+        legacy_time = time.perf_counter() - start
+
+        print(f"删除 {fraction:.0%}: 批量删除 {args.count} 项中 {removed} 项 {batch_time * 1000:8.1f} ms | "
+              f"旧算法 {args.legacy_count} 项中 {len(legacy_selected)} 项 {legacy_time * 1000:8.1f} ms")
+
+
+def parse_size(text):
+    """解析 WxH 格式的尺寸"""
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def make_frames(size, count=4):
+    """构造几帧内容不同的画布尺寸图片"""
+    from PIL import Image
+    gradient = Image.linear_gradient('L').resize(size)
+    frames = []
+    for i in range(count):
+        frames.append(Image.merge('RGB', (gradient, gradient.rotate(90 * i).resize(size), gradient.transpose(i % 2))))
+    return frames
+
+
+def measure_photo(size, count):
+    """对比每帧新建 PhotoImage 与复用显示表面的耗时（毫秒），没有图形显示环境时返回 None"""
+    import tkinter as tk
+    from PIL import ImageTk
+    from display_surface import DisplaySurface
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    try:
+        canvas = tk.Canvas(root, width=size[0], height=size[1])
+        canvas.pack()
+        root.update()
+        frames = make_frames(size)
+
+        def run(show_frame):
+            times = []
+            for i in range(count):
+                start = time.perf_counter()
+                show_frame(frames[i % len(frames)])
+                root.update_idletasks()
+                times.append((time.perf_counter() - start) * 1000)
+            return times
+
+        # 旧路径：每帧新建 PhotoImage 并替换画布图片
+        item = canvas.create_image(0, 0, anchor=tk.NW)
+        holder = {}
+
+        def legacy(frame):
+            holder['photo'] = ImageTk.PhotoImage(frame)
+            canvas.itemconfigure(item, image=holder['photo'])
+
+        surface = DisplaySurface()
+        canvas.itemconfigure(item, image=surface.update(frames[0]))
+
+        def reuse(frame):
+            surface.update(frame)
+
+        return {'new_photo': run(legacy), 'surface': run(reuse)}
+    finally:
+        root.destroy()
+
+
+DEFAULT_WATERMARK = {
+    'type': 'text',
+    'text_content': 'Watermark Studio',
+    'font_family': 'Arial',
+    'font_size': 96,
+    'color': '#FFFFFF',
+    'opacity': 80,
+    'position_preset': 'bottom_right',
+    'offset_x': 20,
+    'offset_y': 20,
+    'padding': 10,
+    'rotation': 0
+}
+
+
+def make_sample_images(directory):
+    """生成样例原图：24MP JPEG 和带透明通道的 PNG"""
+    from PIL import Image
+    paths = []
+    for name, size, mode in (('sample_24mp.jpg', (6000, 4000), 'RGB'), ('sample_alpha.png', (3000, 2000), 'RGBA')):
+        gradient = Image.linear_gradient('L').resize(size)
+        bands = [gradient, gradient.transpose(Image.Transpose.ROTATE_180), gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)]
+        if mode == 'RGBA':
+            bands.append(gradient.point(lambda v: 255 - v // 2))
+        path = os.path.join(directory, name)
+        Image.merge(mode, bands).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def make_session(image_count, events, seed=42):
+    """生成合成交互序列：选择图片、拖动滑块、在画布上拖拽水印、松开"""
+    rng = random.Random(seed)
+    session = []
+    config = dict(DEFAULT_WATERMARK)
+    image = 0
+    while len(session) < events:
+        session.append({'type': 'select', 'image': image})
+        image = (image + 1) % image_count
+        # 滑块：字号、透明度、旋转的随机游走
+        for _ in range(20):
+            key, low, high, step = rng.choice((('font_size', 12, 200, 8), ('opacity', 10, 100, 5),
+                                                ('rotation', -180, 180, 10)))
+            config[key] = max(low, min(high, config[key] + rng.randint(-step, step)))
+            session.append({'type': 'config', 'changes': {key: config[key]}})
+        # 拖拽：从起点出发的连续画布位移（预览像素）
+        session.append({'type': 'press'})
+        x = y = 0.0
+        for _ in range(60):
+            x += rng.uniform(-12, 8)
+            y += rng.uniform(-8, 6)
+            session.append({'type': 'drag', 'x': round(x, 1), 'y': round(y, 1)})
+        session.append({'type': 'release'})
+    return session[:events]
+
+
+def replay_session(renderer, images, session, max_size):
+    """按主窗口的预览流程回放交互序列，返回 (统计, CPU 秒数, 墙钟秒数)"""
+    from preview_renderer import drag_offset
+
+    stats = PreviewStats(window=len(session) + 1)
+    config = dict(DEFAULT_WATERMARK)
+    image = images[0]
+    frame = None
+    drag_start = None
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for event in session:
+        start = time.perf_counter()
+        kind = event['type']
+        if kind == 'select':
+            image = images[event['image'] % len(images)]
+            # 新图片：草稿帧 + 清晰帧，分别记录
+            for frame in renderer.render_progressive(image, config, max_size):
+                stats.record_frame(time.perf_counter() - start, frame['timings'],
+                                   'draft' if frame['is_draft'] else 'select')
+            continue
+        if kind == 'config':
+            config.update(event['changes'])
+            frame = renderer.render(image, config, max_size)
+            stats.record_frame(time.perf_counter() - start, frame['timings'], 'config')
+        elif kind == 'press':
+            drag_start = (config['offset_x'], config['offset_y'])
+        elif kind == 'drag' and drag_start is not None and frame is not None:
+            # 拖拽时只移动水印图层，不重新合成
+            config['offset_x'], config['offset_y'] = drag_offset(drag_start, (0, 0), (event['x'], event['y']),
+                                                                 frame['scale'])
+            renderer.place_watermark(frame, config['offset_x'], config['offset_y'])
+            stats.record_frame(time.perf_counter() - start, {}, 'drag')
+        elif kind == 'release':
+            drag_start = None
+            frame = renderer.render(image, config, max_size)
+            stats.record_frame(time.perf_counter() - start, frame['timings'], 'release')
+
+    return stats, time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+
+def bench_preview(args):
+    """无界面回放预览交互，报告帧延迟百分位数和 CPU 时间，超过阈值时返回非零"""
+    from preview_renderer import PreviewRenderer
+    from watermark_engine import WatermarkEngine
+
+    max_size = parse_size(args.size)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        images = args.images or make_sample_images(temp_dir)
+        if args.session:
+            with open(args.session, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+        else:
+            session = make_session(len(images), args.events, args.seed)
+        if args.save_session:
+            with open(args.save_session, 'w', encoding='utf-8') as f:
+                json.dump(session, f, indent=1)
+
+        renderer = PreviewRenderer(WatermarkEngine())
+        stats, cpu_time, wall_time = replay_session(renderer, images, session, max_size)
+
+    summary = stats.summary()
+    print(f"预览回放: {len(images)} 张图片, {len(session)} 个事件, 预览尺寸 {max_size[0]}x{max_size[1]}")
+    print(f"{'类型':10s} {'帧数':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+    for kind in sorted(summary['kinds']):
+        values = stats.get_latencies([kind])
+        print(f"{kind:10s} {len(values):6d} {percentile(values, 50):7.2f}ms {percentile(values, 95):7.2f}ms "
+              f"{percentile(values, 99):7.2f}ms")
+    latency = summary['latency']
+    print(f"{'全部':10s} {summary['window']:6d} {latency['p50']:7.2f}ms {latency['p95']:7.2f}ms {latency['p99']:7.2f}ms")
+    print(f"CPU 时间 {cpu_time:.2f} s, 墙钟时间 {wall_time:.2f} s")
+
+    # 预览帧交给 Tk 显示的耗时：每帧新建 PhotoImage 与复用显示表面
+    photo = {}
+    if args.photo_frames > 0:
+        photo_times = measure_photo(max_size, args.photo_frames)
+        if photo_times is None:
+            print("PhotoImage 对比: 没有图形显示环境，跳过")
+        else:
+            print(f"PhotoImage 每帧耗时（{max_size[0]}x{max_size[1]}，{args.photo_frames} 帧）")
+            for name, label in (('new_photo', "新建 PhotoImage"), ('surface', "复用显示表面")):
+                times = photo_times[name]
+                photo[name] = {'mean': sum(times) / len(times), 'p95': percentile(times, 95)}
+                print(f"  {label:12s} 平均 {photo[name]['mean']:7.2f} ms | p95 {photo[name]['p95']:7.2f} ms")
+
+    if args.json:
+        stats.dump_json(args.json, {'cpu_seconds': cpu_time, 'wall_seconds': wall_time,
+                                    'events': len(session), 'preview_size': list(max_size),
+                                    'photo_ms': photo})
+
+    # 阈值只检查指定类型的帧（默认全部）
+    checked = stats.get_latencies(args.check_kinds.split(',') if args.check_kinds else None)
+    failed = []
+    for name, limit, percent in (('p95', args.max_p95, 95), ('p99', args.max_p99, 99)):
+        value = percentile(checked, percent)
+        if limit is not None and value > limit:
+            failed.append(f"{name} {value:.2f}ms > {limit}ms")
+    if failed:
+        print("FAIL: " + "; ".join(failed))
+        return 1
+    return 0
+
+
+def bench_write(args):
+    """对比直接写入与原子写入在各落盘策略下的吞吐量"""
+    rng = random.Random(42)
+    # 内容不影响写入速度，用随机字节模拟编码好的 JPEG
+    payloads = [rng.randbytes(args.size_kb * 1024) for _ in range(8)]
+    total_mb = args.count * args.size_kb / 1024
+    print(f"输出写入吞吐量（{args.count} 个文件 × {args.size_kb} KB，写入线程 {args.workers}）")
+
+    for mode in ('direct',) + DURABILITY_MODES:
+        with tempfile.TemporaryDirectory(dir=args.dir) as temp_dir:
+            start = time.perf_counter()
+            if mode == 'direct':
+                # 旧方式：导出线程直接写目标文件
+                for i in range(args.count):
+                    with open(os.path.join(temp_dir, f"{i:06d}.jpg"), 'wb') as f:
+                        f.write(payloads[i % len(payloads)])
+                sync_time = 0.0
+            else:
+                writer = OutputWriter(mode, workers=args.workers)
+                for i in range(args.count):
+                    writer.submit(os.path.join(temp_dir, f"{i:06d}.jpg"), payloads[i % len(payloads)])
+                writer.close()
+                assert writer.get_statistics()['files'] == args.count
+                sync_time = writer.sync_time
+            elapsed = time.perf_counter() - start
+        print(f"  {mode:7s} {args.count / elapsed:8.1f} 文件/秒  {total_mb / elapsed:8.1f} MB/秒"
+              f"  (总计 {elapsed:.2f}s，同步线程累计 {sync_time:.2f}s)")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Watermark Studio 性能基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    memory_parser = subparsers.add_parser('memory', help="图片项元数据内存占用")
+    memory_parser.add_argument('--count', type=int, default=100000)
+    memory_parser.set_defaults(func=bench_memory)
+
+    remove_parser = subparsers.add_parser('remove', help="批量删除图片")
+    remove_parser.add_argument('--count', type=int, default=50000)
+    remove_parser.add_argument('--legacy-count', type=int, default=5000,
+                               help="旧算法为 O(n·k)，用较小的列表对比")
+    remove_parser.set_defaults(func=bench_remove)
+
+    preview_parser = subparsers.add_parser('preview', help="回放预览交互（滑块、拖拽）")
+    preview_parser.add_argument('--images', nargs='*', help="样例原图，默认生成 24MP JPEG 和透明 PNG")
+    preview_parser.add_argument('--session', help="回放记录的交互序列（JSON）")
+    preview_parser.add_argument('--save-session', help="把使用的交互序列保存为 JSON")
+    preview_parser.add_argument('--events', type=int, default=400, help="合成交互序列的事件数")
+    preview_parser.add_argument('--seed', type=int, default=42)
+    preview_parser.add_argument('--size', default='1180x780', help="预览尺寸 WxH")
+    preview_parser.add_argument('--max-p95', type=float, help="p95 延迟上限（毫秒）")
+    preview_parser.add_argument('--max-p99', type=float, help="p99 延迟上限（毫秒）")
+    preview_parser.add_argument('--check-kinds', help="阈值检查的帧类型，逗号分隔（如 config,drag,release）")
+    preview_parser.add_argument('--json', help="把统计结果写入 JSON 文件")
+    preview_parser.add_argument('--photo-frames', type=int, default=200,
+                                help="PhotoImage 显示耗时对比的帧数（需要图形显示环境，0 为跳过）")
+    preview_parser.set_defaults(func=bench_preview)
+
+    write_parser = subparsers.add_parser('write', help="输出写入吞吐量（各落盘策略）")
+    write_parser.add_argument('--count', type=int, default=300)
+    write_parser.add_argument('--size-kb', type=int, default=2048, help="每个文件的大小（KB）")
+    write_parser.add_argument('--workers', type=int, default=2, help="写入线程数")
+    write_parser.add_argument('--dir', help="在此目录下测试（默认系统临时目录）")
+    write_parser.set_defaults(func=bench_write)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
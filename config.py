@@ -35,10 +35,16 @@ DEFAULT_SETTINGS = {
         'prefix': 'wm_',
         'suffix': '_watermarked',
         'output_dir': '',
-        'avoid_overwrite_original': True
+        'avoid_overwrite_original': True,
+        'dedupe': False,
+        'layout': 'flat',
+        'archive': '',
+        'durability': 'none'
     },
     'ui': {
         'thumbnail_size': 120,
+        'image_cache_mb': 128,
+        'prefetch_count': 2,
         'preview_size': 800,
         'theme': 'light'
     }
@@ -0,0 +1,50 @@
+"""
+显示表面模块 - 复用同尺寸的 PhotoImage，原地更新预览帧
+"""
+
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageTk
+
+
+class DisplaySurface:
+    """显示表面类
+
+    为每种帧尺寸保留一个 PhotoImage，新帧尺寸不变时直接把像素粘贴到
+    已有的 PhotoImage 中，画布上引用它的图片项会随之刷新，不再为每帧
+    创建和销毁 Tk 图像。只保留最近使用的少数尺寸（如预览帧和拖拽底图）。
+    """
+
+    def __init__(self, max_surfaces: int = 2):
+        self.max_surfaces = max_surfaces
+        self._photos: Dict[Tuple[str, Tuple[int, int]], ImageTk.PhotoImage] = {}
+        self.created = 0
+        self.reused = 0
+
+    def update(self, image: Image.Image) -> ImageTk.PhotoImage:
+        """显示新帧，返回承载它的 PhotoImage（必须在主线程调用）"""
+        mode = 'RGBA' if image.mode == 'RGBA' else 'RGB'
+        if image.mode != mode:
+            image = image.convert(mode)
+        key = (mode, image.size)
+
+        photo = self._photos.pop(key, None)
+        if photo is None:
+            photo = ImageTk.PhotoImage(mode, image.size)
+            self.created += 1
+            while len(self._photos) >= self.max_surfaces:
+                # 淘汰最久未使用的尺寸
+                self._photos.pop(next(iter(self._photos)))
+        else:
+            self.reused += 1
+        photo.paste(image)
+        # 重新插入，保持最近使用的尺寸在末尾
+        self._photos[key] = photo
+        return photo
+
+    def get(self, size: Tuple[int, int], mode: str = 'RGB') -> Optional[ImageTk.PhotoImage]:
+        """获取指定尺寸的现有 PhotoImage"""
+        return self._photos.get((mode, size))
+
+    def clear(self):
+        """释放所有 PhotoImage"""
+        self._photos.clear()
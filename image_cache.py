@@ -0,0 +1,124 @@
+"""
+图片缓存模块 - 按内存上限淘汰的 LRU 缓存
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from PIL import Image
+
+
+# 各图像模式每像素占用的字节数
+MODE_BYTES = {
+    '1': 1, 'L': 1, 'P': 1, 'LA': 2, 'La': 2, 'I;16': 2,
+    'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3,
+    'RGBA': 4, 'RGBa': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4
+}
+
+
+def estimate_image_bytes(image: Image.Image) -> int:
+    """估算解码后图片占用的内存字节数"""
+    width, height = image.size
+    return width * height * MODE_BYTES.get(image.mode, 4)
+
+
+class ImageCache:
+    """线程安全的图片 LRU 缓存，总内存超过上限时淘汰最久未使用的项
+
+    缩略图和预览底图共用同一个缓存和内存上限，键的第一个元素区分用途，
+    例如 ('thumb', 路径, 尺寸) 和 ('preview', 路径, 最大尺寸)。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """获取缓存项，命中时移到最近使用端"""
+        with self._lock:
+            image = self._items.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key: Hashable, image: Any, size: Optional[int] = None):
+        """放入图片（或包含图片的值，此时需给出 size 字节数），必要时淘汰旧项"""
+        if size is None:
+            size = estimate_image_bytes(image)
+        with self._lock:
+            if key in self._items:
+                self._current_bytes -= self._sizes.pop(key)
+                del self._items[key]
+            # 单张超过上限的图片不缓存
+            if size > self.max_bytes:
+                return
+            self._items[key] = image
+            self._sizes[key] = size
+            self._current_bytes += size
+            self._evict()
+
+    def discard(self, key: Hashable):
+        """移除指定缓存项"""
+        with self._lock:
+            if key in self._items:
+                self._current_bytes -= self._sizes.pop(key)
+                del self._items[key]
+
+    def discard_where(self, predicate) -> int:
+        """移除所有满足条件的缓存项"""
+        with self._lock:
+            keys = [key for key in self._items if predicate(key)]
+            for key in keys:
+                self._current_bytes -= self._sizes.pop(key)
+                del self._items[key]
+            return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self._current_bytes = 0
+
+    def set_max_bytes(self, max_bytes: int):
+        """调整内存上限"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的项直到低于上限（调用方持有锁）"""
+        while self._current_bytes > self.max_bytes and self._items:
+            key, _ = self._items.popitem(last=False)
+            self._current_bytes -= self._sizes.pop(key)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            kinds: Dict[str, int] = {}
+            for key in self._items:
+                kind = key[0] if isinstance(key, tuple) and key else 'other'
+                kinds[kind] = kinds.get(kind, 0) + 1
+            return {
+                'items': len(self._items),
+                'kinds': kinds,
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,169 @@
+"""
+图片列表模型 - 增量维护排序和过滤后的行顺序
+"""
+
+import bisect
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from image_manager import ImageManager, ImageItem
+
+
+# 可排序的列
+SORT_COLUMNS = ('order', 'name', 'size')
+
+
+class ImageListModel:
+    """图片列表模型类
+
+    监听 ImageManager 的插入/删除通知，增量更新可见行；排序和过滤使用
+    导入时预先计算好的键，不需要在每次变更时重新遍历图片对象。
+    """
+
+    def __init__(self, image_manager: ImageManager):
+        self.image_manager = image_manager
+        self.sort_column = 'order'
+        self.sort_reverse = False
+        self.filter_text = ''
+        # item_id -> (小写文件名, 像素数)
+        self._keys: Dict[int, Tuple[str, int]] = {}
+        # 升序排列的可见行及其排序键（两个列表一一对应）
+        self._rows: List[int] = []
+        self._row_keys: List[Tuple] = []
+        self._listeners: List[Callable[[], None]] = []
+
+        self._insert_items(image_manager.images)
+        image_manager.add_listener(self._on_manager_event)
+
+    def add_listener(self, callback: Callable[[], None]):
+        """添加行变更监听器"""
+        self._listeners.append(callback)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_id(self, row: int) -> int:
+        """获取指定行的图片ID"""
+        if self.sort_reverse:
+            row = len(self._rows) - 1 - row
+        return self._rows[row]
+
+    def get_ids(self, start: int, stop: int) -> List[int]:
+        """获取 [start, stop) 行的图片ID"""
+        start = max(0, start)
+        stop = min(len(self._rows), stop)
+        return [self.get_id(row) for row in range(start, stop)]
+
+    def get_row(self, item_id: int) -> int:
+        """获取图片所在行，不可见时返回-1"""
+        key = self._make_sort_key(item_id)
+        if key is None:
+            return -1
+        pos = bisect.bisect_left(self._row_keys, key)
+        if pos < len(self._rows) and self._rows[pos] == item_id:
+            return len(self._rows) - 1 - pos if self.sort_reverse else pos
+        return -1
+
+    def get_neighbors(self, item_id: int, count: int) -> List[int]:
+        """获取列表顺序中前后各 count 项的图片ID（由近及远）"""
+        row = self.get_row(item_id)
+        if row < 0:
+            return []
+        neighbors = []
+        for distance in range(1, count + 1):
+            for neighbor in (row + distance, row - distance):
+                if 0 <= neighbor < len(self._rows):
+                    neighbors.append(self.get_id(neighbor))
+        return neighbors
+
+    def sort_by(self, column: str, reverse: Optional[bool] = None):
+        """按列排序，未指定方向时同一列再次排序则反转"""
+        if column not in SORT_COLUMNS:
+            return
+        if reverse is None:
+            reverse = not self.sort_reverse if column == self.sort_column else False
+        if column != self.sort_column:
+            self.sort_column = column
+            self._rebuild_rows()
+        self.sort_reverse = reverse
+        self._emit()
+
+    def set_filter(self, text: str):
+        """按文件名过滤（不区分大小写的子串匹配），被隐藏的图片同时取消选中"""
+        text = text.strip().lower()
+        if text == self.filter_text:
+            return
+        self.filter_text = text
+        self._rebuild_rows()
+        # 看不到的行不应再被"删除选中"等批量操作影响
+        self.image_manager.selected_ids.intersection_update(self._rows)
+        self._emit()
+
+    def _on_manager_event(self, event: str, payload: Any):
+        """处理图片管理器的变更通知"""
+        if event == 'insert':
+            self._insert_items(payload)
+        elif event == 'delete':
+            self._delete_ids(payload)
+        elif event == 'clear':
+            self._keys.clear()
+            self._rows = []
+            self._row_keys = []
+        self._emit()
+
+    def _insert_items(self, items: List[ImageItem]):
+        """增量插入新图片"""
+        new_rows = []
+        for img_item in items:
+            self._keys[img_item.item_id] = (img_item.file_name.lower(), img_item.width * img_item.height)
+            if self._matches(img_item.item_id):
+                new_rows.append((self._make_sort_key(img_item.item_id), img_item.item_id))
+
+        if not new_rows:
+            return
+        # 新图片ID递增，按导入顺序时直接追加；少量插入用二分，大批量则合并后整体排序
+        if len(new_rows) <= 64 or self.sort_column == 'order':
+            for key, item_id in new_rows:
+                pos = bisect.bisect_right(self._row_keys, key)
+                self._row_keys.insert(pos, key)
+                self._rows.insert(pos, item_id)
+        else:
+            merged = sorted(list(zip(self._row_keys, self._rows)) + new_rows)
+            self._row_keys = [key for key, _ in merged]
+            self._rows = [item_id for _, item_id in merged]
+
+    def _delete_ids(self, item_ids: List[int]):
+        """一次遍历删除多张图片"""
+        removed = set(item_ids)
+        for item_id in removed:
+            self._keys.pop(item_id, None)
+        kept = [(key, item_id) for key, item_id in zip(self._row_keys, self._rows) if item_id not in removed]
+        self._row_keys = [key for key, _ in kept]
+        self._rows = [item_id for _, item_id in kept]
+
+    def _rebuild_rows(self):
+        """排序列或过滤条件变化时重建可见行"""
+        rows = sorted(
+            (self._make_sort_key(item_id), item_id)
+            for item_id in self._keys if self._matches(item_id)
+        )
+        self._row_keys = [key for key, _ in rows]
+        self._rows = [item_id for _, item_id in rows]
+
+    def _matches(self, item_id: int) -> bool:
+        """是否满足过滤条件"""
+        return not self.filter_text or self.filter_text in self._keys[item_id][0]
+
+    def _make_sort_key(self, item_id: int) -> Optional[Tuple]:
+        """生成排序键，ID作为次序键保证稳定"""
+        keys = self._keys.get(item_id)
+        if keys is None:
+            return None
+        if self.sort_column == 'name':
+            return (keys[0], item_id)
+        if self.sort_column == 'size':
+            return (keys[1], item_id)
+        return (item_id,)
+
+    def _emit(self):
+        """通知视图刷新"""
+        for callback in list(self._listeners):
+            callback()
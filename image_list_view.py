@@ -0,0 +1,197 @@
+"""
+虚拟化图片列表控件 - Treeview 只保留可见窗口内的行
+"""
+
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, List, Optional
+from image_list_model import ImageListModel
+
+
+class VirtualImageList:
+    """虚拟化图片列表
+
+    Treeview 中只存在固定数量的可见行，滚动时复用这些行并从模型读取
+    对应的数据，因此列表刷新的代价只与窗口高度有关，与图片总数无关。
+    """
+
+    HEADINGS = {'#0': ('name', "文件名"), 'size': ('size', "尺寸")}
+
+    def __init__(self, parent, model: ImageListModel,
+                 on_select: Callable[[List[int], Optional[int]], None]):
+        self.model = model
+        self.on_select = on_select
+        self.offset = 0
+        self.visible_count = 15
+        self._row_iids: List[str] = []
+        self._refresh_pending = False
+        self._syncing_selection = False
+
+        self.tree = ttk.Treeview(parent, columns=("size",), show="tree headings",
+                                 height=self.visible_count, selectmode="extended")
+        for column, (sort_column, text) in self.HEADINGS.items():
+            self.tree.heading(column, text=text, command=lambda c=sort_column: self.model.sort_by(c))
+        self.tree.column("#0", width=150)
+        self.tree.column("size", width=80)
+
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self._on_scrollbar)
+
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<Configure>", self._on_configure)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Up>", lambda e: self._move_focus(-1))
+        self.tree.bind("<Down>", lambda e: self._move_focus(1))
+        self.tree.bind("<Prior>", lambda e: self._move_focus(-self.visible_count))
+        self.tree.bind("<Next>", lambda e: self._move_focus(self.visible_count))
+
+        self.model.add_listener(self.schedule_refresh)
+
+    def schedule_refresh(self):
+        """合并同一轮事件循环内的多次变更，只刷新一次"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.tree.after_idle(self.refresh)
+
+    def refresh(self):
+        """用模型数据填充可见行"""
+        self._refresh_pending = False
+        total = len(self.model)
+        self.offset = max(0, min(self.offset, total - self.visible_count))
+
+        self._ensure_rows()
+        manager = self.model.image_manager
+        item_ids = self.model.get_ids(self.offset, self.offset + self.visible_count)
+        selection = []
+        for i, iid in enumerate(self._row_iids):
+            if i < len(item_ids):
+                img_item = manager.get_item(item_ids[i])
+                if img_item is None:
+                    continue
+                self.tree.item(iid, text=img_item.get_display_name(),
+                               values=(img_item.get_size_text(),), tags=(str(img_item.item_id),))
+                self.tree.move(iid, "", i)
+                if img_item.item_id in manager.selected_ids:
+                    selection.append(iid)
+            else:
+                self.tree.detach(iid)
+
+        # 同步选中状态，避免触发的选择事件被当作用户操作
+        if set(self.tree.selection()) != set(selection):
+            self._syncing_selection = True
+            self.tree.selection_set(selection)
+        self._update_headings()
+        self._update_scrollbar(total)
+
+    def scroll(self, rows: int):
+        """滚动指定行数"""
+        self.scroll_to(self.offset + rows)
+
+    def scroll_to(self, offset: int):
+        """滚动到指定起始行"""
+        offset = max(0, min(offset, len(self.model) - self.visible_count))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def see(self, item_id: int):
+        """确保指定图片可见"""
+        row = self.model.get_row(item_id)
+        if row < 0:
+            return
+        if row < self.offset:
+            self.scroll_to(row)
+        elif row >= self.offset + self.visible_count:
+            self.scroll_to(row - self.visible_count + 1)
+
+    def _ensure_rows(self):
+        """按可见行数创建或删除可复用的行"""
+        while len(self._row_iids) < self.visible_count:
+            iid = f"row{len(self._row_iids)}"
+            self.tree.insert("", "end", iid=iid)
+            self._row_iids.append(iid)
+        while len(self._row_iids) > self.visible_count:
+            self.tree.delete(self._row_iids.pop())
+
+    def _update_scrollbar(self, total: int):
+        """更新滚动条位置"""
+        if total <= 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.offset / total
+        last = min(1.0, (self.offset + self.visible_count) / total)
+        self.scrollbar.set(first, last)
+
+    def _update_headings(self):
+        """在排序列标题上显示排序方向"""
+        arrow = " ▼" if self.model.sort_reverse else " ▲"
+        for column, (sort_column, text) in self.HEADINGS.items():
+            suffix = arrow if self.model.sort_column == sort_column else ""
+            self.tree.heading(column, text=text + suffix)
+
+    def _on_scrollbar(self, *args):
+        """滚动条命令"""
+        total = len(self.model)
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * total))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible_count
+            self.scroll(amount)
+
+    def _on_mousewheel(self, event):
+        """鼠标滚轮"""
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_configure(self, event):
+        """控件尺寸变化时重新计算可见行数"""
+        row_height = self._row_height()
+        # 减去标题行高度
+        count = max(1, (event.height - row_height - 4) // row_height)
+        if count != self.visible_count:
+            self.visible_count = count
+            self.tree.configure(height=count)
+            self.refresh()
+
+    def _row_height(self) -> int:
+        """获取行高"""
+        try:
+            return int(ttk.Style().lookup("Treeview", "rowheight")) or 20
+        except (ValueError, tk.TclError):
+            return 20
+
+    def _move_focus(self, delta: int):
+        """键盘移动当前行，必要时滚动"""
+        manager = self.model.image_manager
+        total = len(self.model)
+        if total == 0:
+            return "break"
+        current_row = self.model.get_row(manager.current_id) if manager.current_id is not None else -1
+        row = max(0, min(total - 1, current_row + delta if current_row >= 0 else 0))
+        item_id = self.model.get_id(row)
+        self.see(item_id)
+        self.on_select([item_id], item_id)
+        self.refresh()
+        return "break"
+
+    def _on_tree_select(self, event):
+        """用户选择变化"""
+        if self._syncing_selection:
+            self._syncing_selection = False
+            return
+        selected_ids = [int(self.tree.item(iid)['tags'][0]) for iid in self.tree.selection()
+                        if self.tree.item(iid)['tags']]
+        if not selected_ids:
+            return
+        focus = self.tree.focus()
+        focus_tags = self.tree.item(focus)['tags'] if focus else None
+        current_id = int(focus_tags[0]) if focus_tags else selected_ids[0]
+        if current_id not in selected_ids:
+            current_id = selected_ids[0]
+        self.on_select(selected_ids, current_id)
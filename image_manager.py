@@ -3,52 +3,99 @@
 """
 
 import os
-from typing import List, Dict, Any, Optional, Tuple
+import sys
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Callable
 from PIL import Image
 from utils import (
     is_supported_image, get_file_hash, create_thumbnail, 
     get_image_files_from_folder, show_error
 )
+from archive_reader import is_archive, iter_archive_images, open_image, source_exists
+from image_cache import ImageCache
+from thumbnail_store import ThumbnailStore
+
+
+# 图片状态
+STATUS_PENDING = 'pending'
+STATUS_LOADED = 'loaded'
+STATUS_ERROR = 'error'
 
 
 class ImageItem:
-    """图片项类"""
+    """图片项类
+
+    使用 __slots__ 并把尺寸/模式/格式拆成独立字段，导入十万级图片时
+    每项只占用固定的少量内存。
+    """
+    
+    __slots__ = (
+        'item_id', 'file_path', 'file_hash', 'thumbnail_store', '_thumbnail',
+        'width', 'height', 'mode', 'format', 'status', 'error_message'
+    )
     
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, thumbnail_store: Optional[ThumbnailStore] = None):
+        self.item_id = -1  # 由 ImageManager 分配的稳定ID
         self.file_path = file_path
-        self.file_name = os.path.basename(file_path)
         self.file_hash = get_file_hash(file_path)
-        self.thumbnail = None
-        self.image_info = None
-        self.status = 'pending'  # pending, loaded, error
+        self.thumbnail_store = thumbnail_store
+        self._thumbnail = None
+        self.width = 0
+        self.height = 0
+        self.mode = None
+        self.format = None
+        self.status = STATUS_PENDING  # pending, loaded, error
         self.error_message = ''
         
         # 加载图片信息
         self._load_image_info()
     
+    @property
+    def file_name(self) -> str:
+        """文件名"""
+        return os.path.basename(self.file_path)
+    
+    @property
+    def image_info(self) -> Optional[Dict[str, Any]]:
+        """图片基本信息（兼容旧的字典形式）"""
+        if self.mode is None:
+            return None
+        return {
+            'size': (self.width, self.height),
+            'mode': self.mode,
+            'format': self.format
+        }
+    
     def _load_image_info(self):
         """加载图片基本信息"""
         try:
             if is_supported_image(self.file_path):
-                with Image.open(self.file_path) as img:
-                    self.image_info = {
-                        'size': img.size,
-                        'mode': img.mode,
-                        'format': img.format
-                    }
-                self.status = 'loaded'
+                with open_image(self.file_path) as img:
+                    self.width, self.height = img.size
+                    # 模式和格式字符串重复度高，驻留后所有项共享同一对象
+                    self.mode = sys.intern(img.mode)
+                    self.format = sys.intern(img.format) if img.format else None
+                self.status = STATUS_LOADED
             else:
-                self.status = 'error'
+                self.status = STATUS_ERROR
                 self.error_message = '不支持的格式'
         except Exception as e:
-            self.status = 'error'
+            self.status = STATUS_ERROR
             self.error_message = str(e)
     
-    def generate_thumbnail(self, size: Tuple[int, int] = (120, 120)) -> bool:
-        """生成缩略图"""
+    @property
+    def thumbnail(self) -> Optional[Image.Image]:
+        """缩略图（有缩略图存储时按需解码）"""
+        if self.thumbnail_store is not None:
+            return self.thumbnail_store.get(self.file_path)
+        return self._thumbnail
+    
+    def generate_thumbnail(self, size: Optional[Tuple[int, int]] = None) -> bool:
+        """生成缩略图，size 默认为缩略图存储的当前尺寸（没有存储时为 120x120）"""
         try:
-            self.thumbnail = create_thumbnail(self.file_path, size)
-            return self.thumbnail is not None
+            if self.thumbnail_store is not None:
+                return self.thumbnail_store.add(self.file_path, self.file_path, size)
+            self._thumbnail = create_thumbnail(self.file_path, size or (120, 120))
+            return self._thumbnail is not None
         except Exception as e:
             print(f"生成缩略图失败 {self.file_path}: {e}")
             return False
@@ -59,55 +106,177 @@ class ImageItem:
     
     def get_size_text(self) -> str:
         """获取尺寸文本"""
-        if self.image_info:
-            width, height = self.image_info['size']
-            return f"{width}×{height}"
+        if self.mode is not None:
+            return f"{self.width}×{self.height}"
         return "未知"
 
 
 class ImageManager:
     """图片管理器类"""
     
-    def __init__(self):
+    def __init__(self, thumbnail_size: Tuple[int, int] = (120, 120), image_cache_mb: int = 128):
         self.images: List[ImageItem] = []
-        self.selected_indices: set = set()
-        self.current_index: int = -1
-        self.thumbnail_size = (120, 120)
+        # 选中状态按稳定ID保存，删除图片后无需重新映射索引
+        self.selected_ids: set = set()
+        self.current_id: Optional[int] = None
+        self._next_id = 0
+        self._index_by_id: Optional[Dict[int, int]] = {}
+        self.thumbnail_size = thumbnail_size
+        # 解码后的缩略图与预览底图共用一个有内存上限的 LRU 缓存
+        self.image_cache = ImageCache(image_cache_mb * 1024 * 1024)
+        self.thumbnail_store = ThumbnailStore(thumbnail_size, cache=self.image_cache)
+        # 增量维护的路径索引与状态计数，避免统计时遍历整个列表
+        self._paths: set = set()
+        # 内容哈希 -> 图片ID列表，用于识别不同路径下的相同图片
+        self._hash_groups: Dict[str, List[int]] = {}
+        self._unhashed_count = 0
+        self._status_counts: Dict[str, int] = {STATUS_PENDING: 0, STATUS_LOADED: 0, STATUS_ERROR: 0}
+        # 列表变更监听器，回调参数为 (事件, 数据)：
+        # ('insert', [ImageItem, ...]) / ('delete', [item_id, ...]) / ('clear', None)
+        self._listeners: List[Callable[[str, Any], None]] = []
+    
+    def add_listener(self, callback: Callable[[str, Any], None]):
+        """添加列表变更监听器"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+    
+    def remove_listener(self, callback: Callable[[str, Any], None]):
+        """移除列表变更监听器"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+    
+    def _notify(self, event: str, payload: Any = None):
+        """通知监听器列表发生变更"""
+        for callback in list(self._listeners):
+            try:
+                callback(event, payload)
+            except Exception as e:
+                print(f"列表变更通知失败: {e}")
+    
+    def _track(self, img_item: ImageItem):
+        """登记新加入的图片项"""
+        img_item.item_id = self._next_id
+        self._next_id += 1
+        if self._index_by_id is not None:
+            self._index_by_id[img_item.item_id] = len(self.images) - 1
+        self._paths.add(img_item.file_path)
+        if img_item.file_hash:
+            self._hash_groups.setdefault(img_item.file_hash, []).append(img_item.item_id)
+        else:
+            self._unhashed_count += 1
+        self._status_counts[img_item.status] += 1
+    
+    def _untrack(self, img_item: ImageItem):
+        """注销被移除的图片项"""
+        self._paths.discard(img_item.file_path)
+        group = self._hash_groups.get(img_item.file_hash)
+        if group is not None:
+            group.remove(img_item.item_id)
+            if not group:
+                del self._hash_groups[img_item.file_hash]
+        elif not img_item.file_hash:
+            self._unhashed_count -= 1
+        self._status_counts[img_item.status] -= 1
+    
+    def _get_index_map(self) -> Dict[int, int]:
+        """获取ID到索引的映射（删除后惰性重建）"""
+        if self._index_by_id is None:
+            self._index_by_id = {img_item.item_id: i for i, img_item in enumerate(self.images)}
+        return self._index_by_id
+    
+    def get_index(self, item_id: int) -> int:
+        """获取指定ID的图片索引，不存在时返回-1"""
+        return self._get_index_map().get(item_id, -1)
+    
+    def get_item(self, item_id: int) -> Optional[ImageItem]:
+        """根据ID获取图片项"""
+        index = self.get_index(item_id)
+        return self.images[index] if index >= 0 else None
+    
+    @property
+    def selected_indices(self) -> set:
+        """选中图片的索引集合（由选中ID换算）"""
+        index_map = self._get_index_map()
+        return {index_map[item_id] for item_id in self.selected_ids if item_id in index_map}
+    
+    @selected_indices.setter
+    def selected_indices(self, indices):
+        self.selected_ids = {self.images[i].item_id for i in indices if 0 <= i < len(self.images)}
+    
+    @property
+    def current_index(self) -> int:
+        """当前图片索引，没有当前图片时为-1"""
+        if self.current_id is None:
+            return -1
+        return self.get_index(self.current_id)
+    
+    @current_index.setter
+    def current_index(self, index: int):
+        self.current_id = self.images[index].item_id if 0 <= index < len(self.images) else None
     
     def add_image(self, file_path: str) -> bool:
         """添加单张图片"""
-        if not os.path.exists(file_path):
+        img_item = self._add_image(file_path)
+        if img_item is None:
             return False
+        self._notify('insert', [img_item])
+        return True
+    
+    def _add_image(self, file_path: str) -> Optional[ImageItem]:
+        """添加单张图片（不发送通知）"""
+        if not source_exists(file_path):
+            return None
         
         # 检查是否已存在（基于文件路径）
-        for img_item in self.images:
-            if img_item.file_path == file_path:
-                return False
+        if file_path in self._paths:
+            return None
         
-        img_item = ImageItem(file_path)
-        if img_item.status == 'loaded':
+        img_item = ImageItem(file_path, self.thumbnail_store)
+        if img_item.status == STATUS_LOADED:
             img_item.generate_thumbnail(self.thumbnail_size)
             self.images.append(img_item)
-            return True
-        return False
+            self._track(img_item)
+            return img_item
+        return None
     
-    def add_images(self, file_paths: List[str]) -> Tuple[int, int]:
-        """批量添加图片"""
-        success_count = 0
+    def add_images(self, file_paths: Iterable[str]) -> Tuple[int, int]:
+        """批量添加图片，归档文件（ZIP/TAR）会展开为其中的图片"""
+        added = []
         error_count = 0
         
-        for file_path in file_paths:
-            if self.add_image(file_path):
-                success_count += 1
+        for file_path in self._expand_sources(file_paths):
+            img_item = self._add_image(file_path)
+            if img_item is not None:
+                added.append(img_item)
             else:
                 error_count += 1
         
-        return success_count, error_count
+        # 整批只发送一次插入通知
+        if added:
+            self._notify('insert', added)
+        return len(added), error_count
+    
+    def _expand_sources(self, file_paths: Iterable[str]) -> Iterator[str]:
+        """逐个产出图片路径，归档文件惰性展开为 "归档路径::成员路径"，不解压到磁盘"""
+        for file_path in file_paths:
+            if is_archive(file_path) and os.path.isfile(file_path):
+                try:
+                    yield from iter_archive_images(file_path)
+                except Exception as e:
+                    print(f"读取归档失败 {file_path}: {e}")
+            else:
+                yield file_path
+    
+    def add_archive(self, archive_path: str) -> Tuple[int, int]:
+        """添加归档（ZIP/TAR）中的图片"""
+        return self.add_images([archive_path])
     
     def add_folder(self, folder_path: str, recursive: bool = False) -> Tuple[int, int]:
-        """添加文件夹中的图片"""
+        """添加文件夹中的图片（传入归档文件时读取归档中的图片）"""
         if not os.path.exists(folder_path):
             return 0, 0
+        if is_archive(folder_path):
+            return self.add_archive(folder_path)
         
         image_files = get_image_files_from_folder(folder_path, recursive)
         return self.add_images(image_files)
@@ -115,66 +284,99 @@ class ImageManager:
     def remove_image(self, index: int) -> bool:
         """移除指定索引的图片"""
         if 0 <= index < len(self.images):
-            self.images.pop(index)
-            # 更新选中状态
-            self.selected_indices = {i for i in self.selected_indices if i != index}
-            # 调整大于被删除索引的选中项
-            self.selected_indices = {i-1 if i > index else i for i in self.selected_indices}
-            # 更新当前索引
-            if self.current_index == index:
-                self.current_index = -1
-            elif self.current_index > index:
-                self.current_index -= 1
-            return True
+            return self.remove_ids({self.images[index].item_id}) == 1
         return False
     
-    def remove_selected(self) -> int:
-        """移除选中的图片"""
-        if not self.selected_indices:
+    def remove_images(self, indices) -> int:
+        """批量移除指定索引的图片"""
+        ids = {self.images[i].item_id for i in indices if 0 <= i < len(self.images)}
+        return self.remove_ids(ids)
+    
+    def remove_ids(self, item_ids) -> int:
+        """批量移除指定ID的图片，一次遍历完成列表压缩"""
+        item_ids = set(item_ids)
+        if not item_ids:
+            return 0
+        
+        kept = []
+        removed = []
+        for img_item in self.images:
+            if img_item.item_id in item_ids:
+                removed.append(img_item)
+            else:
+                kept.append(img_item)
+        if not removed:
             return 0
         
-        # 按索引从大到小排序，避免删除时索引变化
-        sorted_indices = sorted(self.selected_indices, reverse=True)
-        removed_count = 0
+        self.images[:] = kept
+        for img_item in removed:
+            self._untrack(img_item)
+        removed_paths = {img_item.file_path for img_item in removed}
+        self.thumbnail_store.remove_many(removed_paths)
+        self.image_cache.discard_where(lambda k: k[0] in ('preview', 'tile') and k[1] in removed_paths)
         
-        for index in sorted_indices:
-            if self.remove_image(index):
-                removed_count += 1
+        # 选中状态基于ID，直接剔除被删除的ID即可
+        self.selected_ids -= item_ids
+        if self.current_id in item_ids:
+            self.current_id = None
+        self._index_by_id = None
+        self._notify('delete', [img_item.item_id for img_item in removed])
+        return len(removed)
+    
+    def remove_selected(self) -> int:
+        """移除选中的图片"""
+        if not self.selected_ids:
+            return 0
         
-        self.selected_indices.clear()
+        removed_count = self.remove_ids(self.selected_ids)
+        self.selected_ids.clear()
         return removed_count
     
     def clear_all(self):
         """清空所有图片"""
         self.images.clear()
-        self.selected_indices.clear()
-        self.current_index = -1
+        self.thumbnail_store.clear()
+        self.image_cache.discard_where(lambda k: k[0] in ('preview', 'tile'))
+        self._paths.clear()
+        self._hash_groups.clear()
+        self._unhashed_count = 0
+        self._status_counts = dict.fromkeys(self._status_counts, 0)
+        self.selected_ids.clear()
+        self.current_id = None
+        self._index_by_id = {}
+        self._notify('clear')
     
     def select_image(self, index: int, multi_select: bool = False):
         """选择图片"""
         if not (0 <= index < len(self.images)):
             return
+        self.select_id(self.images[index].item_id, multi_select)
+    
+    def select_id(self, item_id: int, multi_select: bool = False):
+        """按ID选择图片"""
+        if self.get_index(item_id) < 0:
+            return
         
         if multi_select:
-            if index in self.selected_indices:
-                self.selected_indices.remove(index)
+            if item_id in self.selected_ids:
+                self.selected_ids.remove(item_id)
             else:
-                self.selected_indices.add(index)
+                self.selected_ids.add(item_id)
         else:
-            self.selected_indices.clear()
-            self.selected_indices.add(index)
+            self.selected_ids.clear()
+            self.selected_ids.add(item_id)
         
-        self.current_index = index
+        self.current_id = item_id
     
     def get_current_image(self) -> Optional[ImageItem]:
         """获取当前图片"""
-        if 0 <= self.current_index < len(self.images):
-            return self.images[self.current_index]
-        return None
+        if self.current_id is None:
+            return None
+        return self.get_item(self.current_id)
     
     def get_selected_images(self) -> List[ImageItem]:
-        """获取选中的图片"""
-        return [self.images[i] for i in self.selected_indices if 0 <= i < len(self.images)]
+        """获取选中的图片（按列表顺序）"""
+        return [self.images[i] for i in sorted(self.selected_indices)]
     
     def get_image_count(self) -> int:
         """获取图片总数"""
@@ -182,22 +384,66 @@ class ImageManager:
     
     def get_loaded_count(self) -> int:
         """获取成功加载的图片数量"""
-        return sum(1 for img in self.images if img.status == 'loaded')
+        return self._status_counts[STATUS_LOADED]
     
     def get_error_count(self) -> int:
         """获取加载失败的图片数量"""
-        return sum(1 for img in self.images if img.status == 'error')
+        return self._status_counts[STATUS_ERROR]
     
     def get_error_messages(self) -> List[str]:
         """获取错误信息列表"""
-        return [f"{img.file_name}: {img.error_message}" for img in self.images if img.status == 'error']
+        if not self._status_counts[STATUS_ERROR]:
+            return []
+        return [f"{img.file_name}: {img.error_message}" for img in self.images if img.status == STATUS_ERROR]
+    
+    def get_duplicate_count(self) -> int:
+        """获取内容重复的图片数量（不含每组的第一张）"""
+        return len(self.images) - self.get_unique_count()
+    
+    def get_unique_count(self) -> int:
+        """获取内容不同的图片数量"""
+        return len(self._hash_groups) + self._unhashed_count
+    
+    def get_duplicate_groups(self) -> List[List[ImageItem]]:
+        """获取内容相同的图片分组（只返回含多张图片的组）"""
+        return [group for group in self.get_export_groups(dedupe=True) if len(group) > 1]
+    
+    def get_export_groups(self, dedupe: bool = False) -> List[List[ImageItem]]:
+        """获取导出分组，按列表顺序排列
+
+        去重模式下内容哈希相同的图片归为一组，每组只需处理第一张；
+        否则每张图片单独成组。
+        """
+        if not dedupe:
+            return [[img_item] for img_item in self.images]
+        
+        groups = []
+        group_by_hash: Dict[str, List[ImageItem]] = {}
+        for img_item in self.images:
+            if not img_item.file_hash:
+                groups.append([img_item])
+                continue
+            group = group_by_hash.get(img_item.file_hash)
+            if group is None:
+                group = group_by_hash[img_item.file_hash] = []
+                groups.append(group)
+            group.append(img_item)
+        return groups
+    
+    def get_thumbnail(self, index: int) -> Optional[Image.Image]:
+        """获取指定索引图片的缩略图（按需解码，供可见行使用）"""
+        if 0 <= index < len(self.images):
+            return self.images[index].thumbnail
+        return None
     
     def set_thumbnail_size(self, size: Tuple[int, int]):
-        """设置缩略图尺寸"""
+        """设置缩略图尺寸（后台逐步重建）"""
         self.thumbnail_size = size
-        # 重新生成所有缩略图
-        for img_item in self.images:
-            img_item.generate_thumbnail(size)
+        self.thumbnail_store.set_size(size)
+    
+    def set_image_cache_limit(self, cache_mb: int):
+        """设置已解码图片缓存（缩略图和预览底图）的内存上限"""
+        self.image_cache.set_max_bytes(cache_mb * 1024 * 1024)
     
     def get_statistics(self) -> Dict[str, Any]:
         """获取统计信息"""
@@ -209,6 +455,8 @@ class ImageManager:
             'total': total,
             'loaded': loaded,
             'error': error,
-            'selected': len(self.selected_indices),
-            'current_index': self.current_index
+            'duplicates': self.get_duplicate_count(),
+            'selected': len(self.selected_ids),
+            'current_index': self.current_index,
+            'image_cache': self.image_cache.get_statistics()
         }
@@ -0,0 +1,358 @@
+"""
+任务队列模块 - 基于 SQLite 的持久化批处理队列，支持原子领取、失败重试和崩溃恢复
+
+用法:
+    queue = JobQueue('export_jobs.db')
+    queue.enqueue('a.jpg', watermark_config, export_config, 'out/a.jpg')
+    queue.run(workers=4)
+
+命令行:
+    python job_queue.py status export_jobs.db
+    python job_queue.py run export_jobs.db --workers 4
+    python job_queue.py retry export_jobs.db
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from output_writer import atomic_write
+
+
+# 任务状态：等待（含等待重试）、执行中、已完成、最终失败
+JOB_STATES = ('pending', 'running', 'done', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS configs (
+    hash TEXT PRIMARY KEY,
+    watermark_config TEXT NOT NULL,
+    export_config TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    input TEXT NOT NULL,
+    config_hash TEXT NOT NULL REFERENCES configs(hash),
+    output TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    next_run_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL,
+    claim_token TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (input, config_hash, output)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, next_run_at);
+"""
+
+
+def config_hash(watermark_config: Dict[str, Any], export_config: Dict[str, Any]) -> str:
+    """计算水印配置和导出配置的哈希，配置相同的任务共用一条配置记录"""
+    data = json.dumps([watermark_config, export_config], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class JobQueue:
+    """持久化任务队列类
+
+    每个任务为 (input, config_hash, output, state, attempts, error)，同一输入、
+    配置和输出只会入队一次。领取任务在 BEGIN IMMEDIATE 事务中完成，多个线程或
+    进程同时领取也不会拿到同一个任务。领取时 attempts 加一并设置租约，执行失败
+    按指数退避重新排队，超过 max_attempts 后标记为 failed。
+
+    进程崩溃时，已完成的任务状态已经提交，不会重做；执行中的任务在租约到期后
+    重新领取（单进程重启时可调用 requeue_running() 立即恢复）。输出通过临时文件
+    加改名写入，中断的任务重做时直接覆盖，不会留下不完整的文件。
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 3, retry_delay: float = 2.0,
+                 max_retry_delay: float = 300.0, lease_time: float = 600.0):
+        self.db_path = db_path
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lease_time = lease_time
+        # sqlite3 连接不能跨线程使用，每个线程一个连接
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._configs: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # isolation_level=None：事务由下面显式的 BEGIN/COMMIT 控制
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                         check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            # WAL 模式下读写互不阻塞；synchronous=NORMAL 保证进程崩溃后数据库一致
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _execute(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        return self._connect().execute(sql, tuple(params))
+
+    def _transaction(self, immediate: bool = False):
+        """开始事务，返回连接；immediate 时立即获取写锁"""
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        return connection
+
+    def enqueue(self, input_path: str, watermark_config: Dict[str, Any],
+                export_config: Dict[str, Any], output_path: str) -> int:
+        """添加一个任务，已存在相同任务时不重复添加，返回任务 ID"""
+        return self.enqueue_many([(input_path, watermark_config, export_config, output_path)])[0]
+
+    def enqueue_many(self, jobs: Iterable[Tuple[str, Dict[str, Any], Dict[str, Any], str]]) -> List[int]:
+        """在一个事务中批量添加任务，返回任务 ID 列表"""
+        now = time.time()
+        ids = []
+        connection = self._transaction(immediate=True)
+        try:
+            for input_path, watermark_config, export_config, output_path in jobs:
+                hash_value = config_hash(watermark_config, export_config)
+                connection.execute(
+                    'INSERT OR IGNORE INTO configs (hash, watermark_config, export_config) VALUES (?, ?, ?)',
+                    (hash_value, json.dumps(watermark_config, ensure_ascii=False),
+                     json.dumps(export_config, ensure_ascii=False))
+                )
+                connection.execute(
+                    'INSERT OR IGNORE INTO jobs (input, config_hash, output, updated_at) VALUES (?, ?, ?, ?)',
+                    (input_path, hash_value, output_path, now)
+                )
+                row = connection.execute(
+                    'SELECT id FROM jobs WHERE input = ? AND config_hash = ? AND output = ?',
+                    (input_path, hash_value, output_path)
+                ).fetchone()
+                ids.append(row['id'])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return ids
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """原子地领取一个可执行的任务，没有时返回 None
+
+        返回的字典包含 id、input、output、attempts、token 和两份配置，
+        完成或失败时需要把 token 传回，租约过期被他人领走的任务无法再提交结果。
+        """
+        now = time.time()
+        connection = self._transaction(immediate=True)
+        try:
+            # 租约过期且次数用尽的任务不再领取
+            connection.execute(
+                "UPDATE jobs SET state = 'failed', error = ?, lease_until = NULL, claim_token = NULL, "
+                "updated_at = ? WHERE state = 'running' AND lease_until < ? AND attempts >= ?",
+                ('执行中断且已达到最大重试次数', now, now, self.max_attempts)
+            )
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE (state = 'pending' AND next_run_at <= ?) "
+                "OR (state = 'running' AND lease_until < ?) ORDER BY id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                connection.execute('COMMIT')
+                return None
+            token = uuid.uuid4().hex
+            connection.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1, lease_until = ?, "
+                "claim_token = ?, updated_at = ? WHERE id = ?",
+                (now + self.lease_time, token, now, row['id'])
+            )
+            job = connection.execute(
+                'SELECT id, input, output, config_hash, attempts FROM jobs WHERE id = ?', (row['id'],)
+            ).fetchone()
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        watermark_config, export_config = self.get_config(job['config_hash'])
+        return {
+            'id': job['id'],
+            'input': job['input'],
+            'output': job['output'],
+            'attempts': job['attempts'],
+            'token': token,
+            'watermark_config': watermark_config,
+            'export_config': export_config
+        }
+
+    def get_config(self, hash_value: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """按哈希读取配置（缓存解析结果）"""
+        with self._lock:
+            configs = self._configs.get(hash_value)
+        if configs is None:
+            row = self._execute(
+                'SELECT watermark_config, export_config FROM configs WHERE hash = ?', (hash_value,)
+            ).fetchone()
+            configs = (json.loads(row['watermark_config']), json.loads(row['export_config']))
+            with self._lock:
+                self._configs[hash_value] = configs
+        return configs
+
+    def complete(self, job: Dict[str, Any]) -> bool:
+        """标记任务完成，租约已被他人接手时返回 False"""
+        cursor = self._execute(
+            "UPDATE jobs SET state = 'done', error = NULL, lease_until = NULL, claim_token = NULL, "
+            "updated_at = ? WHERE id = ? AND claim_token = ?",
+            (time.time(), job['id'], job['token'])
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """记录任务失败：未达到最大次数时按指数退避重新排队，否则标记为 failed"""
+        now = time.time()
+        if job['attempts'] >= self.max_attempts:
+            state, next_run_at = 'failed', 0
+        else:
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (job['attempts'] - 1))
+            state, next_run_at = 'pending', now + delay
+        cursor = self._execute(
+            "UPDATE jobs SET state = ?, error = ?, next_run_at = ?, lease_until = NULL, "
+            "claim_token = NULL, updated_at = ? WHERE id = ? AND claim_token = ?",
+            (state, error, next_run_at, now, job['id'], job['token'])
+        )
+        return cursor.rowcount == 1
+
+    def requeue_running(self) -> int:
+        """把执行中的任务放回队列（确认没有其他进程在执行时，重启后立即恢复）"""
+        cursor = self._execute(
+            "UPDATE jobs SET state = 'pending', next_run_at = 0, lease_until = NULL, "
+            "claim_token = NULL, updated_at = ? WHERE state = 'running'",
+            (time.time(),)
+        )
+        return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        """把最终失败的任务重新排队，重试次数清零"""
+        cursor = self._execute(
+            "UPDATE jobs SET state = 'pending', attempts = 0, error = NULL, next_run_at = 0, "
+            "updated_at = ? WHERE state = 'failed'",
+            (time.time(),)
+        )
+        return cursor.rowcount
+
+    def next_retry_time(self) -> Optional[float]:
+        """最早一个等待中任务的可执行时间，没有等待中的任务时返回 None"""
+        row = self._execute("SELECT MIN(next_run_at) AS t FROM jobs WHERE state = 'pending'").fetchone()
+        return row['t']
+
+    def get_jobs(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        """列出任务（可按状态过滤）"""
+        sql = 'SELECT id, input, config_hash, output, state, attempts, error FROM jobs'
+        params: Tuple = ()
+        if state:
+            sql += ' WHERE state = ?'
+            params = (state,)
+        return [dict(row) for row in self._execute(sql + ' ORDER BY id', params)]
+
+    def get_statistics(self) -> Dict[str, int]:
+        """获取各状态的任务数"""
+        counts = {state: 0 for state in JOB_STATES}
+        for row in self._execute('SELECT state, COUNT(*) AS n FROM jobs GROUP BY state'):
+            counts[row['state']] = row['n']
+        counts['total'] = sum(counts.values())
+        return counts
+
+    def run(self, workers: int = 1, engine=None, wait_retries: bool = True) -> Dict[str, int]:
+        """用若干线程执行队列中的任务，直到没有可执行的任务
+
+        wait_retries 为 True 时等待退避中的任务到期后继续执行，
+        否则只执行当前可领取的任务。返回本次完成和失败的次数。
+        """
+        if engine is None:
+            from watermark_engine import WatermarkEngine
+            engine = WatermarkEngine()
+        stats = {'done': 0, 'failed': 0}
+
+        def worker():
+            while True:
+                job = self.claim()
+                if job is None:
+                    next_time = self.next_retry_time() if wait_retries else None
+                    if next_time is None:
+                        return
+                    time.sleep(min(max(0.0, next_time - time.time()), 1.0) or 0.01)
+                    continue
+                try:
+                    data = engine.encode(job['input'], job['watermark_config'], job['export_config'])
+                    if data is None:
+                        raise ValueError("无法处理该图片")
+                    atomic_write(job['output'], data)
+                except Exception as e:
+                    print(f"任务 {job['id']} 失败（第 {job['attempts']} 次）: {e}")
+                    self.fail(job, str(e))
+                    with self._lock:
+                        stats['failed'] += 1
+                    continue
+                self.complete(job)
+                with self._lock:
+                    stats['done'] += 1
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def close(self):
+        """关闭所有线程的数据库连接"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def __enter__(self) -> 'JobQueue':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="水印批处理任务队列")
+    parser.add_argument('command', choices=('status', 'run', 'retry'), help="查看状态、执行任务或重试失败任务")
+    parser.add_argument('db', help="队列数据库文件")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="执行线程数")
+    parser.add_argument('--max-attempts', type=int, default=3, help="每个任务的最大尝试次数")
+    parser.add_argument('--recover', action='store_true',
+                        help="立即恢复中断的任务（仅在确认没有其他进程执行该队列时使用）")
+    args = parser.parse_args()
+
+    with JobQueue(args.db, max_attempts=args.max_attempts) as queue:
+        if args.command == 'retry':
+            print(f"重新排队 {queue.retry_failed()} 个失败任务")
+        elif args.command == 'run':
+            # 默认等租约过期后再重新领取，避免抢走其他进程正在执行的任务
+            if args.recover:
+                recovered = queue.requeue_running()
+                if recovered:
+                    print(f"恢复 {recovered} 个中断的任务")
+            stats = queue.run(workers=args.workers)
+            print(f"完成 {stats['done']} 个，失败 {stats['failed']} 次")
+        for state, count in queue.get_statistics().items():
+            print(f"{state}: {count}")
+        for job in queue.get_jobs('failed'):
+            print(f"  失败: {job['input']} -> {job['output']}（{job['attempts']} 次）: {job['error']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,18 +6,29 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, colorchooser
 import os
 from typing import Dict, Any, Optional
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import threading
+import time
 import json
 
 from config import DEFAULT_SETTINGS, POSITION_PRESETS
 from image_manager import ImageManager
+from image_list_model import ImageListModel
+from image_list_view import VirtualImageList
 from watermark_engine import WatermarkEngine
+from preview_renderer import PreviewRenderer, drag_offset
+from preview_worker import PreviewWorker, PreviewPrefetcher
+from preview_stats import PreviewStats
+from display_surface import DisplaySurface
+from output_naming import OutputNameAllocator
+from output_layout import OutputLayout, LAYOUTS, LAYOUT_NAMES
+from archive_writer import ArchiveWriter, ARCHIVE_FORMATS
+from output_writer import OutputWriter, DURABILITY_MODES, DURABILITY_NAMES
+from tile_viewer import TilePyramid
 from template_manager import TemplateManager
 from utils import (
     load_config, save_config, get_available_fonts, 
-    show_error, show_info, ask_yes_no, generate_output_filename,
-    ensure_unique_filename
+    show_error, show_info, ask_yes_no, generate_output_filename
 )
 
 
@@ -30,14 +41,32 @@ class MainWindow:
         self.root.geometry("1200x800")
         self.root.minsize(800, 600)
         
+        # 配置
+        self.config = load_config()
+        
         # 核心组件
-        self.image_manager = ImageManager()
+        ui_config = self.config.get('ui', {})
+        thumbnail_size = ui_config.get('thumbnail_size', DEFAULT_SETTINGS['ui']['thumbnail_size'])
+        self.image_manager = ImageManager(
+            (thumbnail_size, thumbnail_size),
+            ui_config.get('image_cache_mb', DEFAULT_SETTINGS['ui']['image_cache_mb'])
+        )
         self.watermark_engine = WatermarkEngine()
+        # 预览底图与缩略图共用图片管理器的缓存
+        self.preview_renderer = PreviewRenderer(self.watermark_engine, self.image_manager.image_cache,
+                                                self.image_manager.thumbnail_store.peek)
+        self.preview_worker = PreviewWorker(self._generate_preview, self._on_preview_result)
+        self.preview_prefetcher = PreviewPrefetcher(self.preview_renderer.get_base,
+                                                    self.preview_renderer.is_cached)
+        self.prefetch_count = ui_config.get('prefetch_count', DEFAULT_SETTINGS['ui']['prefetch_count'])
+        # 同尺寸的预览帧原地更新到同一个 PhotoImage
+        self.display_surface = DisplaySurface()
+        # 预览帧耗时统计（性能统计开关打开时显示在状态栏）
+        self.preview_stats = PreviewStats()
+        # 原始尺寸视图的图块在独立线程中渲染
+        self.tile_worker = PreviewWorker(self._render_tiles, self._on_tile_result)
         self.template_manager = TemplateManager()
         
-        # 配置
-        self.config = load_config()
-        
         # UI变量
         self.setup_variables()
         
@@ -53,12 +82,24 @@ class MainWindow:
         # 预览相关
         self.preview_image = None
         self.preview_photo = None
+        self._displayed_generation = 0
+        self._displayed_draft = False
+        # 原始尺寸（分块）视图状态
+        self.tile_pyramid = None
+        self.tile_level = 0
+        self._tile_items = {}
+        self._tile_update_pending = False
+        self._preview_frame = None
+        self.preview_origin = (0, 0)
+        self.watermark_photo = None
+        self._layer_drag = False
         
         # 拖拽相关
         self.drag_start_x = 0
         self.drag_start_y = 0
         self.is_dragging = False
         self.watermark_position = None  # 存储当前水印在预览中的位置
+        self.watermark_geometry = None  # 水印在预览图坐标系中的几何信息
         self.canvas_scale = 1.0  # 画布缩放比例
         self.show_watermark_bounds = False  # 是否显示水印边界
         
@@ -83,6 +124,11 @@ class MainWindow:
         self.prefix_text = tk.StringVar(value=self.config['export']['prefix'])
         self.suffix_text = tk.StringVar(value=self.config['export']['suffix'])
         self.output_dir = tk.StringVar(value=self.config['export']['output_dir'])
+        self.export_dedupe = tk.BooleanVar(value=self.config['export'].get('dedupe', False))
+        self.output_layout = tk.StringVar(value=self.config['export'].get('layout', 'flat'))
+        self.output_archive = tk.StringVar(value=self.config['export'].get('archive', ''))
+        self.output_durability = tk.StringVar(value=self.config['export'].get('durability', 'none'))
+        self.show_preview_stats = tk.BooleanVar(value=False)
         
         # 图片水印设置
         self.image_watermark_path = tk.StringVar()
@@ -157,26 +203,22 @@ class MainWindow:
         ttk.Button(btn_frame, text="清空", command=self.clear_images).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(btn_frame, text="删除选中", command=self.remove_selected).pack(side=tk.LEFT)
         
+        # 文件名过滤
+        filter_frame = ttk.Frame(left_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="过滤:").pack(side=tk.LEFT)
+        self.list_filter = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.list_filter).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.list_filter.trace_add('write', lambda *args: self.image_list_model.set_filter(self.list_filter.get()))
+        
         # 列表框架
         list_frame = ttk.Frame(left_frame)
         list_frame.pack(fill=tk.BOTH, expand=True)
         
-        # 创建Treeview
-        self.image_tree = ttk.Treeview(list_frame, columns=("size",), show="tree headings", height=15)
-        self.image_tree.heading("#0", text="文件名")
-        self.image_tree.heading("size", text="尺寸")
-        self.image_tree.column("#0", width=150)
-        self.image_tree.column("size", width=80)
-        
-        # 滚动条
-        tree_scroll = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.image_tree.yview)
-        self.image_tree.configure(yscrollcommand=tree_scroll.set)
-        
-        self.image_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # 绑定选择事件
-        self.image_tree.bind("<<TreeviewSelect>>", self.on_image_select)
+        # 虚拟化列表：由模型增量维护排序/过滤后的行，控件只渲染可见行
+        self.image_list_model = ImageListModel(self.image_manager)
+        self.image_list = VirtualImageList(list_frame, self.image_list_model, self.on_image_select)
+        self.image_tree = self.image_list.tree
         
     def create_preview_area(self):
         """创建预览区域"""
@@ -193,8 +235,10 @@ class MainWindow:
         
         # 创建画布和滚动条
         self.preview_canvas = tk.Canvas(canvas_frame, bg="white")
-        v_scroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.preview_canvas.yview)
-        h_scroll = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=self.preview_canvas.xview)
+        v_scroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL,
+                                 command=lambda *args: self._scroll_canvas(self.preview_canvas.yview, *args))
+        h_scroll = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL,
+                                 command=lambda *args: self._scroll_canvas(self.preview_canvas.xview, *args))
         
         self.preview_canvas.configure(yscrollcommand=v_scroll.set, xscrollcommand=h_scroll.set)
         
@@ -212,8 +256,13 @@ class MainWindow:
         
         ttk.Button(control_frame, text="适应窗口", command=self.fit_to_window).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(control_frame, text="原始尺寸", command=self.actual_size).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="放大", width=4, command=self.zoom_in).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="缩小", width=4, command=self.zoom_out).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(control_frame, text="刷新预览", command=self.refresh_preview).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(control_frame, text="显示边界", command=self.toggle_watermark_bounds).pack(side=tk.LEFT)
+        ttk.Button(control_frame, text="导出统计", command=self.export_preview_stats).pack(side=tk.RIGHT)
+        ttk.Checkbutton(control_frame, text="性能统计", variable=self.show_preview_stats,
+                        command=self.toggle_preview_stats).pack(side=tk.RIGHT, padx=(0, 5))
         
     def create_settings_panel(self):
         """创建设置面板"""
@@ -441,6 +490,36 @@ class MainWindow:
         ttk.Entry(dir_select_frame, textvariable=self.output_dir, state="readonly").pack(side=tk.LEFT, fill=tk.X, expand=True)
         ttk.Button(dir_select_frame, text="浏览", command=self.choose_output_dir).pack(side=tk.RIGHT, padx=(5, 0))
         
+        # 目录结构
+        layout_frame = ttk.LabelFrame(export_frame, text="目录结构", padding=10)
+        layout_frame.pack(fill=tk.X, pady=(0, 10))
+        for layout in LAYOUTS:
+            ttk.Radiobutton(layout_frame, text=LAYOUT_NAMES[layout], variable=self.output_layout,
+                            value=layout).pack(anchor=tk.W)
+        
+        # 输出目标
+        target_frame = ttk.LabelFrame(export_frame, text="输出目标", padding=10)
+        target_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Radiobutton(target_frame, text="写入输出目录", variable=self.output_archive,
+                        value="").pack(anchor=tk.W)
+        ttk.Radiobutton(target_frame, text="打包为 ZIP（不重新压缩）", variable=self.output_archive,
+                        value="zip").pack(anchor=tk.W)
+        ttk.Radiobutton(target_frame, text="打包为 TAR", variable=self.output_archive,
+                        value="tar").pack(anchor=tk.W)
+        
+        # 写入可靠性（文件总是先写临时文件再改名，这里决定何时同步到磁盘）
+        durability_frame = ttk.LabelFrame(export_frame, text="写入可靠性", padding=10)
+        durability_frame.pack(fill=tk.X, pady=(0, 10))
+        for durability in DURABILITY_MODES:
+            ttk.Radiobutton(durability_frame, text=DURABILITY_NAMES[durability],
+                            variable=self.output_durability, value=durability).pack(anchor=tk.W)
+        
+        # 重复图片处理
+        dedupe_frame = ttk.LabelFrame(export_frame, text="重复图片", padding=10)
+        dedupe_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Checkbutton(dedupe_frame, text="内容相同的图片只处理一次（其余硬链接或复制）",
+                        variable=self.export_dedupe).pack(anchor=tk.W)
+        
         # 初始状态
         self.on_format_change()
         self.on_naming_change()
@@ -453,6 +532,9 @@ class MainWindow:
         self.status_label = ttk.Label(self.status_bar, text="就绪")
         self.status_label.pack(side=tk.LEFT, padx=5, pady=2)
         
+        # 预览性能统计（开启性能统计后显示）
+        self.stats_label = ttk.Label(self.status_bar, text="", foreground="gray")
+        
         # 进度条
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(self.status_bar, variable=self.progress_var, 
@@ -469,6 +551,19 @@ class MainWindow:
         self.preview_canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
         self.preview_canvas.bind("<Motion>", self.on_canvas_motion)  # 绑定鼠标移动事件
         
+        # 原始尺寸视图：滚动和窗口尺寸变化时加载可见图块
+        self.preview_canvas.bind("<Configure>", lambda e: self._schedule_tile_update())
+        self.preview_canvas.bind("<MouseWheel>",
+                                 lambda e: self._scroll_canvas(self.preview_canvas.yview, 'scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.preview_canvas.bind("<Shift-MouseWheel>",
+                                 lambda e: self._scroll_canvas(self.preview_canvas.xview, 'scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.preview_canvas.bind("<Button-4>", lambda e: self._scroll_canvas(self.preview_canvas.yview, 'scroll', -1, 'units'))
+        self.preview_canvas.bind("<Button-5>", lambda e: self._scroll_canvas(self.preview_canvas.yview, 'scroll', 1, 'units'))
+        # Ctrl+滚轮缩放（在金字塔各层之间切换）
+        self.preview_canvas.bind("<Control-MouseWheel>", lambda e: self.zoom_in() if e.delta > 0 else self.zoom_out())
+        self.preview_canvas.bind("<Control-Button-4>", lambda e: self.zoom_in())
+        self.preview_canvas.bind("<Control-Button-5>", lambda e: self.zoom_out())
+        
         # 文件拖拽支持
         self.setup_file_drag_drop()
         
@@ -581,13 +676,16 @@ class MainWindow:
         """导入图片"""
         file_paths = filedialog.askopenfilenames(
             title="选择图片文件",
-            filetypes=[("图片文件", "*.jpg *.jpeg *.png *.bmp *.tiff *.tif")]
+            filetypes=[
+                ("图片文件", "*.jpg *.jpeg *.png *.bmp *.tiff *.tif"),
+                ("压缩包（不解压直接读取）", "*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz")
+            ]
         )
         
         if file_paths:
             success, error = self.image_manager.add_images(list(file_paths))
             self.update_image_list()
-            self.update_status(f"导入完成: 成功 {success} 张，失败 {error} 张")
+            self.update_status(self._format_import_status(success, error))
             
     def import_folder(self):
         """导入文件夹"""
@@ -597,7 +695,15 @@ class MainWindow:
             recursive = ask_yes_no("是否包含子文件夹？", "导入选项")
             success, error = self.image_manager.add_folder(folder_path, recursive)
             self.update_image_list()
-            self.update_status(f"导入完成: 成功 {success} 张，失败 {error} 张")
+            self.update_status(self._format_import_status(success, error))
+    
+    def _format_import_status(self, success, error):
+        """生成导入结果提示"""
+        message = f"导入完成: 成功 {success} 张，失败 {error} 张"
+        duplicates = self.image_manager.get_duplicate_count()
+        if duplicates:
+            message += f"（列表中有 {duplicates} 张内容重复）"
+        return message
             
     def clear_images(self):
         """清空图片列表"""
@@ -614,131 +720,118 @@ class MainWindow:
             self.update_image_list()
             self.update_status(f"已删除 {count} 张图片")
             
-    def on_image_select(self, event):
+    def on_image_select(self, item_ids, current_id):
         """图片选择事件"""
-        selection = self.image_tree.selection()
-        if selection:
-            item = selection[0]
-            index = int(self.image_tree.item(item)['tags'][0])
-            self.image_manager.select_image(index)
+        previous_id = self.image_manager.current_id
+        self.image_manager.selected_ids = set(item_ids)
+        self.image_manager.current_id = current_id
+        if current_id != previous_id:
             self.refresh_preview()
+            self._prefetch_neighbors(current_id)
+    
+    def _prefetch_neighbors(self, current_id):
+        """在后台预取列表中前后相邻图片的预览底图"""
+        if current_id is None or self.prefetch_count <= 0:
+            return
+        file_paths = []
+        for item_id in self.image_list_model.get_neighbors(current_id, self.prefetch_count):
+            img_item = self.image_manager.get_item(item_id)
+            if img_item is not None:
+                file_paths.append(img_item.file_path)
+        self.preview_prefetcher.submit(file_paths, self._get_preview_max_size())
             
     def update_image_list(self):
-        """更新图片列表"""
-        # 清空现有项目
-        for item in self.image_tree.get_children():
-            self.image_tree.delete(item)
-            
-        # 添加图片项目
-        for i, img_item in enumerate(self.image_manager.images):
-            self.image_tree.insert("", "end", 
-                                  text=img_item.get_display_name(),
-                                  values=(img_item.get_size_text(),),
-                                  tags=(str(i),))
+        """更新图片列表（列表模型已随图片管理器增量更新，这里只刷新可见行）"""
+        self.image_list.schedule_refresh()
                                   
     def refresh_preview(self):
         """刷新预览"""
         current_image = self.image_manager.get_current_image()
         if not current_image:
+            self._exit_tile_view()
             self.clear_preview()
             return
+        
+        # 原始尺寸视图中按新的图片/配置重建金字塔
+        if self.tile_pyramid is not None:
+            if self.tile_pyramid.file_path == current_image.file_path:
+                self._refresh_tile_view()
+            else:
+                self.actual_size()
+            return
             
         try:
-            # 在后台线程中生成预览
-            threading.Thread(target=self._generate_preview, 
-                           args=(current_image,), daemon=True).start()
+            # 画布尺寸在主线程读取，后台线程只做渲染
+            request = {
+                'file_path': current_image.file_path,
+                'original_size': (current_image.width, current_image.height),
+                'watermark_config': self.get_watermark_config(),
+                'max_size': self._get_preview_max_size(),
+                'submitted_at': time.perf_counter()
+            }
+            # 提交给常驻预览线程，旧的未完成请求会被合并或取消
+            self.preview_worker.submit(request)
         except Exception as e:
             print(f"预览失败: {e}")
+    
+    def _get_preview_max_size(self):
+        """获取预览图可用的最大尺寸"""
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
+        if canvas_width > 1 and canvas_height > 1:
+            return (canvas_width - 20, canvas_height - 20)
+        preview_size = self.config.get('ui', {}).get('preview_size', DEFAULT_SETTINGS['ui']['preview_size'])
+        return (preview_size, preview_size)
             
-    def _generate_preview(self, image_item):
-        """生成预览（后台线程）"""
-        try:
-            # 打开原始图片
-            with Image.open(image_item.file_path) as img:
-                # 转换为RGBA以支持水印
-                if img.mode != 'RGBA':
-                    img = img.convert('RGBA')
-                
-                # 获取水印配置
-                watermark_config = self.get_watermark_config()
-                
-                # 创建水印
-                watermark = None
-                if watermark_config['type'] == 'text' and watermark_config['text_content']:
-                    print(f"创建文本水印: 内容='{watermark_config['text_content']}', 字体='{watermark_config['font_family']}', 大小={watermark_config['font_size']}")  # 调试信息
-                    watermark = self.watermark_engine.create_text_watermark(
-                        watermark_config['text_content'],
-                        watermark_config['font_family'],
-                        watermark_config['font_size'],
-                        watermark_config['color'],
-                        watermark_config['opacity'],
-                        watermark_config.get('font_weight', 'normal'),
-                        watermark_config.get('font_style', 'normal')
-                    )
-                elif watermark_config['type'] == 'image' and watermark_config.get('image_path'):
-                    if os.path.exists(watermark_config['image_path']):
-                        watermark = self.watermark_engine.create_image_watermark(
-                            watermark_config['image_path'],
-                            watermark_config.get('scale', 1.0),
-                            watermark_config['opacity']
-                        )
-                
-                # 应用水印并记录位置
-                if watermark:
-                    # 获取旋转角度
-                    rotation = watermark_config.get('rotation', 0)
-                    
-                    # 如果有旋转，需要计算旋转后的水印尺寸
-                    if rotation != 0:
-                        # 创建一个临时的水印图像来计算旋转后的尺寸
-                        temp_watermark = Image.new('RGBA', watermark.size, (0, 0, 0, 0))
-                        rotated_watermark = temp_watermark.rotate(rotation, expand=True)
-                        actual_watermark_size = rotated_watermark.size
-                    else:
-                        actual_watermark_size = watermark.size
-                    
-                    # 计算水印在原始图片上的位置
-                    watermark_pos = self._calculate_watermark_position(
-                        img.size, actual_watermark_size, watermark_config
-                    )
-                    
-                    img = self.watermark_engine.apply_watermark(
-                        img, watermark,
-                        watermark_config['position_preset'],
-                        watermark_config['offset_x'],
-                        watermark_config['offset_y'],
-                        watermark_config.get('padding', 10),
-                        rotation
-                    )
-                else:
-                    watermark_pos = None
-                
-                # 转换为RGB用于显示
-                if img.mode == 'RGBA':
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[-1])
-                    img = background
-                
-                # 缩放以适应预览区域
-                canvas_width = self.preview_canvas.winfo_width()
-                canvas_height = self.preview_canvas.winfo_height()
-                
-                if canvas_width > 1 and canvas_height > 1:
-                    img.thumbnail((canvas_width - 20, canvas_height - 20), Image.Resampling.LANCZOS)
-                
-                # 转换为PhotoImage
-                photo = ImageTk.PhotoImage(img)
-                
-                # 在主线程中更新UI
-                self.root.after(0, self._update_preview_ui, photo, img.size, watermark_pos)
-                
-        except Exception as e:
-            print(f"生成预览失败: {e}")
-            self.root.after(0, self.clear_preview)
+    def _generate_preview(self, request, is_cancelled):
+        """生成预览（预览线程）"""
+        # 在预览分辨率下渲染，水印参数按缩放比例换算；底图未缓存时先产出草稿帧
+        for frame in self.preview_renderer.render_progressive(
+            request['file_path'], request['watermark_config'], request['max_size'],
+            request['original_size'], is_cancelled
+        ):
+            frame['submitted_at'] = request['submitted_at']
+            yield frame
+    
+    def _on_preview_result(self, generation, frame, error):
+        """接收预览结果（预览线程），转交主线程"""
+        self.root.after(0, self._apply_preview_frame, generation, frame, error)
+    
+    def _apply_preview_frame(self, generation, frame, error):
+        """显示预览结果（主线程）"""
+        # 比已显示的帧更旧的结果（乱序到达）或图层拖拽过程中到达的帧直接丢弃；
+        # 同一请求的清晰帧可以替换其草稿帧
+        is_draft = bool(frame and frame.get('is_draft'))
+        stale = generation < self._displayed_generation or (
+            generation == self._displayed_generation and not self._displayed_draft)
+        if stale or self._layer_drag:
+            self.preview_stats.record_dropped()
+            return
+        self._displayed_generation = generation
+        self._displayed_draft = is_draft
+        if error is not None:
+            print(f"生成预览失败: {error}")
+            self.clear_preview()
+            return
+        
+        img = frame['image']
+        # PhotoImage 必须在主线程更新；尺寸不变时复用已有的 PhotoImage
+        convert_start = time.perf_counter()
+        photo = self.display_surface.update(img)
+        display_start = time.perf_counter()
+        self._preview_frame = frame
+        self._update_preview_ui(photo, img.size, frame['geometry'], frame['scale'])
+        displayed_at = time.perf_counter()
+        
+        timings = dict(frame['timings'], convert=display_start - convert_start, display=displayed_at - display_start)
+        self.preview_stats.record_frame(displayed_at - frame['submitted_at'], timings,
+                                        'draft' if is_draft else 'frame')
+        self._update_stats_label()
             
-    def _update_preview_ui(self, photo, size, watermark_pos=None):
+    def _update_preview_ui(self, photo, size, geometry=None, scale=1.0):
         """更新预览UI（主线程）"""
         self.preview_photo = photo
+        self.watermark_photo = None
         self.preview_canvas.delete("all")
         
         # 计算居中位置
@@ -746,60 +839,289 @@ class MainWindow:
         canvas_height = self.preview_canvas.winfo_height()
         x = max(0, (canvas_width - size[0]) // 2)
         y = max(0, (canvas_height - size[1]) // 2)
+        self.preview_origin = (x, y)
         
-        self.preview_canvas.create_image(x, y, anchor=tk.NW, image=photo)
+        self.preview_canvas.create_image(x, y, anchor=tk.NW, image=photo, tags="preview_image")
+        self.canvas_scale = scale
         
-        # 如果有水印位置信息，记录到画布坐标中
-        if watermark_pos:
-            # 计算缩放比例
-            scale_x = size[0] / self.image_manager.get_current_image().image_info['size'][0]
-            scale_y = size[1] / self.image_manager.get_current_image().image_info['size'][1]
-            self.canvas_scale = min(scale_x, scale_y)
-            
-            # 转换水印位置到画布坐标
-            wx, wy, ww, wh = watermark_pos
-            canvas_wx = x + wx * self.canvas_scale
-            canvas_wy = y + wy * self.canvas_scale
-            canvas_ww = ww * self.canvas_scale
-            canvas_wh = wh * self.canvas_scale
+        # 如果有水印几何信息，记录到画布坐标中（渲染结果已是预览坐标）
+        self._set_watermark_geometry(geometry)
+        
+        self.preview_canvas.configure(scrollregion=self.preview_canvas.bbox("all"))
+    
+    def _set_watermark_geometry(self, geometry):
+        """记录水印在画布中的位置并按需绘制边界（主线程）"""
+        self.preview_canvas.delete("watermark_bounds", "drag_bounds", "drag_hint")
+        self.watermark_geometry = geometry
+        if geometry is None:
+            self.watermark_position = None
+            return
+        
+        x, y = self.preview_origin
+        wx, wy, ww, wh = geometry.rect
+        canvas_wx = x + wx
+        canvas_wy = y + wy
+        
+        self.watermark_position = (canvas_wx, canvas_wy, ww, wh)
+        
+        # 绘制水印区域边框（如果启用）
+        if self.show_watermark_bounds:
+            # 绘制水印边界（旋转后的实际区域）
+            polygon = [coord for px, py in geometry.polygon for coord in (x + px, y + py)]
+            self.preview_canvas.create_polygon(polygon, fill="", outline="red", width=2,
+                                               dash=(5, 5), tags="watermark_bounds")
             
-            self.watermark_position = (canvas_wx, canvas_wy, canvas_ww, canvas_wh)
+            # 绘制拖拽检测区域
+            margin = 10
+            self.preview_canvas.create_rectangle(canvas_wx - margin, canvas_wy - margin, 
+                                               canvas_wx + ww + margin, canvas_wy + wh + margin,
+                                               outline="blue", width=1, dash=(2, 2), tags="drag_bounds")
             
-            # 绘制水印区域边框（如果启用）
-            if self.show_watermark_bounds:
-                # 绘制水印边界
-                self.preview_canvas.create_rectangle(canvas_wx, canvas_wy, 
-                                                   canvas_wx + canvas_ww, canvas_wy + canvas_wh,
-                                                   outline="red", width=2, dash=(5, 5), tags="watermark_bounds")
-                
-                # 绘制拖拽检测区域
-                margin = 10
-                self.preview_canvas.create_rectangle(canvas_wx - margin, canvas_wy - margin, 
-                                                   canvas_wx + canvas_ww + margin, canvas_wy + canvas_wh + margin,
-                                                   outline="blue", width=1, dash=(2, 2), tags="drag_bounds")
-                
-                # 添加提示文本
-                self.preview_canvas.create_text(canvas_wx + canvas_ww/2, canvas_wy - 20,
-                                               text="可拖拽区域", fill="blue", font=("Arial", 10),
-                                               tags="drag_hint")
-        else:
-            self.watermark_position = None
+            # 添加提示文本
+            self.preview_canvas.create_text(canvas_wx + ww/2, canvas_wy - 20,
+                                           text="可拖拽区域", fill="blue", font=("Arial", 10),
+                                           tags="drag_hint")
+    
+    def _begin_layer_drag(self):
+        """拖拽开始：把预览拆成底图和水印两个画布图层（主线程）"""
+        frame = self._preview_frame
+        if not frame or frame.get('watermark') is None:
+            return False
         
-        self.preview_canvas.configure(scrollregion=self.preview_canvas.bbox("all"))
+        # 底图替换合成图，水印作为独立的画布图片，拖拽时只移动它
+        self.preview_photo = self.display_surface.update(frame['base'])
+        self.preview_canvas.itemconfigure("preview_image", image=self.preview_photo)
+        self.watermark_photo = ImageTk.PhotoImage(frame['watermark'])
+        x, y = self.preview_origin
+        wx, wy = frame['geometry'].position
+        self.preview_canvas.create_image(x + wx, y + wy, anchor=tk.NW,
+                                         image=self.watermark_photo, tags="preview_watermark")
+        return True
+    
+    def _move_watermark_layer(self, offset_x, offset_y):
+        """拖拽过程中移动水印图层，不重新合成（主线程）"""
+        geometry = self.preview_renderer.place_watermark(self._preview_frame, offset_x, offset_y)
+        if geometry is None:
+            return
+        x, y = self.preview_origin
+        self.preview_canvas.coords("preview_watermark", x + geometry.position[0], y + geometry.position[1])
+        self._set_watermark_geometry(geometry)
         
     def clear_preview(self):
         """清空预览"""
         self.preview_canvas.delete("all")
         self.preview_photo = None
+        self.watermark_photo = None
+        self._preview_frame = None
+        # 清空后仍在途中的帧不再显示
+        if hasattr(self, 'preview_worker'):
+            self._displayed_generation = self.preview_worker.latest_generation
+            self._displayed_draft = False
         
     def fit_to_window(self):
         """适应窗口"""
+        self._exit_tile_view()
         self.refresh_preview()
         
     def actual_size(self):
-        """原始尺寸"""
-        # TODO: 实现原始尺寸显示
-        pass
+        """原始尺寸（按视口分块渲染，只加载可见的图块）"""
+        current_image = self.image_manager.get_current_image()
+        if not current_image:
+            return
+        
+        if self.tile_pyramid is not None and self.tile_pyramid.file_path == current_image.file_path:
+            # 同一张图只更换水印并回到原始尺寸，已解码的各层继续复用
+            self.tile_pyramid.set_watermark_config(self.get_watermark_config())
+            self._set_tile_level(0)
+            return
+        
+        try:
+            pyramid = TilePyramid(current_image.file_path, self.preview_renderer,
+                                  self.get_watermark_config(), self.image_manager.image_cache)
+        except Exception as e:
+            print(f"打开原始尺寸视图失败: {e}")
+            show_error(f"无法显示原始尺寸: {e}")
+            return
+        
+        # 丢弃仍在途中的缩放预览帧
+        self._displayed_generation = self.preview_worker.latest_generation
+        self._displayed_draft = False
+        self._exit_tile_view()
+        self.preview_canvas.delete("all")
+        self.preview_photo = None
+        self.watermark_photo = None
+        self._preview_frame = None
+        self.watermark_position = None
+        self.watermark_geometry = None
+        
+        self.tile_pyramid = pyramid
+        self.tile_level = 0
+        width, height = pyramid.get_level_size(self.tile_level)
+        self.preview_canvas.configure(scrollregion=(0, 0, width, height))
+        self.preview_canvas.xview_moveto(0)
+        self.preview_canvas.yview_moveto(0)
+        self.update_status(f"原始尺寸: {width}x{height}")
+        self._update_visible_tiles()
+    
+    def _refresh_tile_view(self):
+        """水印配置变化后重新渲染当前缩放层的图块，保持视口不变"""
+        self.tile_pyramid.set_watermark_config(self.get_watermark_config())
+        self.preview_canvas.delete("tile")
+        self._tile_items.clear()
+        self._update_visible_tiles()
+    
+    def zoom_in(self):
+        """放大（切换到分辨率高一倍的层），在缩放预览中进入原始尺寸视图"""
+        if self.tile_pyramid is None:
+            self.actual_size()
+            return
+        self._zoom_tiles(2.0)
+    
+    def zoom_out(self):
+        """缩小（切换到分辨率低一半的层）"""
+        if self.tile_pyramid is not None:
+            self._zoom_tiles(0.5)
+    
+    def _zoom_tiles(self, factor):
+        """按倍数缩放原始尺寸视图"""
+        pyramid = self.tile_pyramid
+        zoom = pyramid.get_level_scale(self.tile_level) * factor
+        self._set_tile_level(pyramid.level_for_zoom(min(1.0, zoom)))
+    
+    def _set_tile_level(self, level):
+        """切换显示的金字塔层，重设滚动区域并保持视口中心不变"""
+        pyramid = self.tile_pyramid
+        old_width, old_height = pyramid.get_level_size(self.tile_level)
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
+        # 视口中心在图片中的相对位置
+        center_x = (self.preview_canvas.canvasx(canvas_width / 2)) / old_width
+        center_y = (self.preview_canvas.canvasy(canvas_height / 2)) / old_height
+        
+        self.tile_level = level
+        width, height = pyramid.get_level_size(level)
+        self.preview_canvas.delete("tile")
+        self._tile_items.clear()
+        self.preview_canvas.configure(scrollregion=(0, 0, width, height))
+        self.preview_canvas.xview_moveto(max(0.0, (center_x * width - canvas_width / 2) / width))
+        self.preview_canvas.yview_moveto(max(0.0, (center_y * height - canvas_height / 2) / height))
+        scale = pyramid.get_level_scale(level)
+        self.update_status(f"缩放 {scale:.0%}: {width}x{height}")
+        self._update_visible_tiles()
+    
+    def _exit_tile_view(self):
+        """退出原始尺寸视图"""
+        if self.tile_pyramid is None:
+            return
+        self.tile_pyramid = None
+        self.preview_canvas.delete("tile")
+        self._tile_items.clear()
+        self.preview_canvas.xview_moveto(0)
+        self.preview_canvas.yview_moveto(0)
+    
+    def _scroll_canvas(self, view_func, *args):
+        """滚动画布，并在原始尺寸视图中加载新露出的图块"""
+        view_func(*args)
+        self._schedule_tile_update()
+    
+    def _schedule_tile_update(self):
+        """合并同一轮事件循环内的多次滚动，只更新一次可见图块"""
+        if self.tile_pyramid is not None and not self._tile_update_pending:
+            self._tile_update_pending = True
+            self.root.after_idle(self._update_visible_tiles)
+    
+    def _update_visible_tiles(self):
+        """移除离开视口的图块，请求新进入视口的图块（主线程）"""
+        self._tile_update_pending = False
+        pyramid = self.tile_pyramid
+        if pyramid is None:
+            return
+        
+        # 视口四周各多加载一圈图块，平移时边缘不会露白
+        margin = pyramid.tile_size
+        x0 = int(self.preview_canvas.canvasx(0)) - margin
+        y0 = int(self.preview_canvas.canvasy(0)) - margin
+        x1 = int(self.preview_canvas.canvasx(self.preview_canvas.winfo_width())) + margin
+        y1 = int(self.preview_canvas.canvasy(self.preview_canvas.winfo_height())) + margin
+        visible = pyramid.visible_tiles(self.tile_level, (x0, y0, x1, y1))
+        
+        visible_set = set(visible)
+        for tile in list(self._tile_items):
+            if tile not in visible_set:
+                self.preview_canvas.delete(self._tile_items.pop(tile)[0])
+        
+        missing = [tile for tile in visible if tile not in self._tile_items]
+        if missing:
+            # 新请求替换尚未渲染的旧请求，快速平移时只渲染最终视口
+            self.tile_worker.submit({'pyramid': pyramid, 'version': pyramid.config_version,
+                                     'level': self.tile_level, 'tiles': missing})
+    
+    def _render_tiles(self, request, is_cancelled):
+        """渲染图块（图块线程），每完成一块就投递一次"""
+        pyramid = request['pyramid']
+        level = request['level']
+        for tile, image in pyramid.iter_tiles(level, request['tiles'], is_cancelled):
+            yield {
+                'pyramid': pyramid,
+                'version': request['version'],
+                'level': level,
+                'tile': tile,
+                'image': image
+            }
+    
+    def _on_tile_result(self, generation, result, error):
+        """接收图块（图块线程），转交主线程"""
+        self.root.after(0, self._apply_tile, result, error)
+    
+    def _apply_tile(self, result, error):
+        """显示图块（主线程）"""
+        if error is not None:
+            print(f"渲染图块失败: {error}")
+            return
+        pyramid = self.tile_pyramid
+        if (result['pyramid'] is not pyramid or result['version'] != pyramid.config_version
+                or result['level'] != self.tile_level):
+            return
+        tile = result['tile']
+        if tile in self._tile_items:
+            return
+        
+        x0, y0, _, _ = pyramid.get_tile_box(self.tile_level, *tile)
+        photo = ImageTk.PhotoImage(result['image'])
+        item = self.preview_canvas.create_image(x0, y0, anchor=tk.NW, image=photo, tags="tile")
+        self._tile_items[tile] = (item, photo)
+    
+    def toggle_preview_stats(self):
+        """切换状态栏中的预览性能统计"""
+        if self.show_preview_stats.get():
+            self.stats_label.pack(side=tk.LEFT, padx=5, pady=2)
+            self._update_stats_label()
+        else:
+            self.stats_label.pack_forget()
+    
+    def _update_stats_label(self):
+        """刷新状态栏中的预览性能统计（主线程）"""
+        if self.show_preview_stats.get():
+            self.stats_label.configure(text=self.preview_stats.format_status())
+    
+    def export_preview_stats(self):
+        """把预览延迟直方图和各阶段耗时导出为 JSON"""
+        file_path = filedialog.asksaveasfilename(
+            title="导出预览性能统计",
+            defaultextension=".json",
+            filetypes=[("JSON文件", "*.json")]
+        )
+        if not file_path:
+            return
+        try:
+            self.preview_stats.dump_json(file_path, {
+                'preview_size': self._get_preview_max_size(),
+                'preview_worker': dict(self.preview_worker.stats),
+                'image_cache': self.image_manager.image_cache.get_statistics()
+            })
+            self.update_status(f"预览性能统计已导出: {file_path}")
+        except Exception as e:
+            show_error(f"导出统计失败: {e}")
     
     def toggle_watermark_bounds(self):
         """切换水印边界显示"""
@@ -843,7 +1165,11 @@ class MainWindow:
             'naming_rule': self.naming_rule.get(),
             'prefix': self.prefix_text.get(),
             'suffix': self.suffix_text.get(),
-            'output_dir': self.output_dir.get()
+            'output_dir': self.output_dir.get(),
+            'dedupe': self.export_dedupe.get(),
+            'layout': self.output_layout.get(),
+            'archive': self.output_archive.get(),
+            'durability': self.output_durability.get()
         }
         
     def save_template(self):
@@ -972,6 +1298,10 @@ class MainWindow:
             self.naming_rule.set(export_config.get('naming_rule', 'keep_original'))
             self.prefix_text.set(export_config.get('prefix', 'wm_'))
             self.suffix_text.set(export_config.get('suffix', '_watermarked'))
+            self.export_dedupe.set(export_config.get('dedupe', False))
+            self.output_layout.set(export_config.get('layout', 'flat'))
+            self.output_archive.set(export_config.get('archive', ''))
+            self.output_durability.set(export_config.get('durability', 'none'))
             
             # 更新UI状态
             self.on_watermark_type_change()
@@ -1000,6 +1330,8 @@ class MainWindow:
         
     def _export_images(self):
         """导出图片（后台线程）"""
+        archive_writer = None
+        output_writer = None
         try:
             print("开始导出图片...")
             watermark_config = self.get_watermark_config()
@@ -1025,58 +1357,103 @@ class MainWindow:
             print(f"导出配置: {export_config}")
             print(f"水印配置: {watermark_config}")
             
-            total = len(self.image_manager.images)
+            # 去重模式下内容相同的图片为一组，每组只处理一次
+            groups = self.image_manager.get_export_groups(export_config.get('dedupe', False))
+            # 输出目录只扫描一次，之后的重名检测在内存中完成
+            name_allocator = OutputNameAllocator()
+            input_paths = [img_item.file_path for group in groups for img_item in group]
+            
+            archive_writer = None
+            archive_format = export_config.get('archive', '')
+            if archive_format in ARCHIVE_FORMATS:
+                # 打包输出：编码结果直接写入归档，归档内的路径不需要扫描磁盘
+                archive_name = name_allocator.allocate(
+                    output_dir, f"watermark_export_{time.strftime('%Y%m%d_%H%M%S')}{ARCHIVE_FORMATS[archive_format]}"
+                )
+                archive_writer = ArchiveWriter(os.path.join(output_dir, archive_name), archive_format)
+                print(f"打包输出到: {archive_writer.archive_path}")
+                name_allocator = OutputNameAllocator(scan=False)
+                layout = OutputLayout('', export_config.get('layout', 'flat'), input_paths)
+            else:
+                # 按配置的目录结构分子目录，每个目录在本批次内只创建一次
+                layout = OutputLayout(output_dir, export_config.get('layout', 'flat'), input_paths)
+                # 编码结果交给后台线程原子写入，导出线程不等待磁盘
+                output_writer = OutputWriter(export_config.get('durability', 'none'))
+            total = sum(len(group) for group in groups)
             success_count = 0
             error_count = 0
+            done = 0
             
-            print(f"总共需要处理 {total} 张图片")
+            print(f"总共需要处理 {total} 张图片（{len(groups)} 组不同内容）")
             
-            for i, img_item in enumerate(self.image_manager.images):
-                try:
-                    print(f"处理第 {i+1}/{total} 张图片: {img_item.file_path}")
-                    
-                    # 生成输出文件名
-                    output_filename = generate_output_filename(
-                        img_item.file_path,
-                        export_config['naming_rule'],
-                        export_config['prefix'],
-                        export_config['suffix']
-                    )
-                    print(f"生成文件名: {output_filename}")
-                    
-                    # 确保文件名唯一
-                    output_filename = ensure_unique_filename(
-                        export_config['output_dir'], output_filename
-                    )
-                    print(f"确保文件名唯一后: {output_filename}")
-                    
-                    output_path = os.path.join(export_config['output_dir'], output_filename)
-                    print(f"完整输出路径: {output_path}")
-                    
-                    # 处理图片
-                    result = self.watermark_engine.process_image(
-                        img_item.file_path, watermark_config, output_path, export_config
-                    )
-                    
-                    if result:
-                        print(f"图片导出成功: {output_path}")
-                        success_count += 1
-                    else:
-                        print(f"图片导出失败: {img_item.file_path}")
-                        error_count += 1
+            for group in groups:
+                # 组内只编码一次，其余内容相同的图片直接复用编码结果
+                exported_data = None
+                # 写入目录时组内第一个输出路径和其余（硬链接）路径
+                primary_path = None
+                link_paths = []
+                for img_item in group:
+                    try:
+                        print(f"处理第 {done+1}/{total} 张图片: {img_item.file_path}")
+                        if archive_writer:
+                            output_path = self._build_archive_name(img_item, export_config, name_allocator, layout)
+                        else:
+                            output_path = self._build_output_path(img_item, export_config, name_allocator, layout)
+                        
+                        if exported_data is None:
+                            exported_data = self.watermark_engine.encode_image(
+                                img_item.file_path, watermark_config, export_config
+                            )
+                            result = exported_data is not None
+                            if result and not archive_writer:
+                                primary_path = output_path
+                        else:
+                            print("内容重复，复用已编码的结果")
+                            result = True
+                            if not archive_writer:
+                                link_paths.append(output_path)
+                        
+                        if result and archive_writer:
+                            archive_writer.write(output_path, exported_data)
                         
-                except Exception as e:
-                    print(f"导出失败 {img_item.file_path}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    error_count += 1
+                        if result:
+                            print(f"图片导出成功: {output_path}")
+                            success_count += 1
+                        else:
+                            print(f"图片导出失败: {img_item.file_path}")
+                            error_count += 1
+                            
+                    except Exception as e:
+                        print(f"导出失败 {img_item.file_path}: {e}")
+                        import traceback
+                        traceback.print_exc()
+                        error_count += 1
+                    
+                    # 更新进度
+                    done += 1
+                    progress = done / total * 100
+                    print(f"进度: {progress:.1f}% ({done}/{total})")
+                    self.root.after(0, self._update_progress, progress, done, total)
                 
-                # 更新进度
-                progress = (i + 1) / total * 100
-                print(f"进度: {progress:.1f}% ({i+1}/{total})")
-                self.root.after(0, self._update_progress, progress, i + 1, total)
+                if primary_path:
+                    # 交给后台写入线程，原子写入并为重复内容创建硬链接
+                    output_writer.submit(primary_path, exported_data, link_paths)
                 
+            if archive_writer:
+                # 等待写入线程写完剩余文件
+                archive_writer.close()
+                print(f"归档写入完成: {archive_writer.get_statistics()}")
+            else:
+                # 等待写入线程写完剩余文件，并按落盘策略同步
+                output_writer.close()
+                print(f"文件写入完成: {output_writer.get_statistics()}")
+                for failed_path, message in output_writer.failed:
+                    print(f"图片写入失败 {failed_path}: {message}")
+                success_count -= len(output_writer.failed)
+                error_count += len(output_writer.failed)
+            
             # 导出完成
+            print(f"输出目录: {layout.get_statistics()['directories']} 个")
             print(f"导出完成: 成功 {success_count} 张，失败 {error_count} 张")
             self.root.after(0, self._export_complete, success_count, error_count)
             
@@ -1084,8 +1461,47 @@ class MainWindow:
             print(f"导出过程出错: {e}")
             import traceback
             traceback.print_exc()
+            if archive_writer:
+                archive_writer.abort()
+            if output_writer:
+                output_writer.close()
             self.root.after(0, lambda: show_error(f"导出过程出错: {e}"))
             
+    def _build_output_path(self, img_item, export_config, name_allocator, layout):
+        """生成图片的输出路径，并确保其所在目录存在"""
+        # 生成输出文件名
+        output_filename = generate_output_filename(
+            img_item.file_path,
+            export_config['naming_rule'],
+            export_config['prefix'],
+            export_config['suffix']
+        )
+        print(f"生成文件名: {output_filename}")
+        
+        # 按目录结构确定输出目录
+        output_dir = layout.get_directory(img_item.file_path, img_item.file_hash)
+        layout.ensure_directory(output_dir)
+        
+        # 确保文件名唯一（在分配器中预留，不逐个探测文件是否存在）
+        output_filename = name_allocator.allocate(output_dir, output_filename)
+        print(f"确保文件名唯一后: {output_filename}")
+        
+        output_path = os.path.join(output_dir, output_filename)
+        print(f"完整输出路径: {output_path}")
+        return output_path
+            
+    def _build_archive_name(self, img_item, export_config, name_allocator, layout):
+        """生成图片在归档内的路径（/ 分隔）"""
+        output_filename = generate_output_filename(
+            img_item.file_path,
+            export_config['naming_rule'],
+            export_config['prefix'],
+            export_config['suffix']
+        )
+        archive_dir = layout.get_directory(img_item.file_path, img_item.file_hash)
+        output_filename = name_allocator.allocate(archive_dir, output_filename)
+        return os.path.join(archive_dir, output_filename).replace(os.sep, '/')
+            
     def _update_progress(self, progress, current, total):
         """更新进度（主线程）"""
         self.progress_var.set(progress)
@@ -1141,31 +1557,34 @@ class MainWindow:
             
             if not self.is_dragging:
                 self.is_dragging = True
+                self._cancel_refresh_timer()
+                self._layer_drag = self._begin_layer_drag()
                 self.preview_canvas.configure(cursor="hand2")
                 self.update_status("正在拖拽水印...")
             
-            # 计算相对于拖拽起始点的偏移（转换为实际图片坐标）
-            dx = (event.x - self.drag_start_x) / self.canvas_scale
-            dy = (event.y - self.drag_start_y) / self.canvas_scale
-            
-            # 基于拖拽起始时的偏移值计算新的偏移值
-            new_x = self.drag_start_offset_x + int(dx)
-            new_y = self.drag_start_offset_y + int(dy)
-            
-            # 扩大偏移范围，允许更大的拖拽区域
-            new_x = max(-1000, min(1000, new_x))  # 从-200~200扩大到-1000~1000
-            new_y = max(-1000, min(1000, new_y))  # 从-200~200扩大到-1000~1000
+            # 基于拖拽起始时的偏移值，把画布位移换算为实际图片坐标中的新偏移
+            new_x, new_y = drag_offset(
+                (self.drag_start_offset_x, self.drag_start_offset_y),
+                (self.drag_start_x, self.drag_start_y),
+                (event.x, event.y),
+                self.canvas_scale
+            )
             
             # 更新UI变量
             self.offset_x.set(new_x)
             self.offset_y.set(new_y)
             
-            # 取消之前的刷新定时器以避免累积延迟
-            self._cancel_refresh_timer()
-            
-            # 立即刷新预览以提高响应性
-            # 使用更短的时间间隔来减少延迟感
-            self._refresh_timer = self.root.after(30, self._delayed_refresh)  # 从100ms减少到30ms
+            if self._layer_drag:
+                # 只移动水印图层，不重新合成；松开鼠标后再完整渲染一次
+                move_start = time.perf_counter()
+                self._move_watermark_layer(new_x, new_y)
+                move_time = time.perf_counter() - move_start
+                self.preview_stats.record_frame(move_time, {'display': move_time}, 'drag')
+                self._update_stats_label()
+            else:
+                # 没有可拖拽的图层（预览尚未生成）时退回到延迟刷新
+                self._cancel_refresh_timer()
+                self._refresh_timer = self.root.after(30, self._delayed_refresh)
     
     def on_canvas_release(self, event):
         """画布释放事件"""
@@ -1177,6 +1596,8 @@ class MainWindow:
             
             # 立即刷新预览以显示最终位置
             self._cancel_refresh_timer()
+            self.is_dragging = False
+            self._layer_drag = False
             self.refresh_preview()
         self.is_dragging = False
     
@@ -1197,15 +1618,13 @@ class MainWindow:
     
     def is_point_in_watermark(self, x, y):
         """检查点是否在水印区域内"""
-        if not self.watermark_position:
+        if not self.watermark_position or self.watermark_geometry is None:
             return False
         
-        wx, wy, ww, wh = self.watermark_position
-        
-        # 扩大检测区域，使拖拽更容易
+        # 按旋转后的实际区域检测，并扩大检测范围，使拖拽更容易
         margin = 30  # 从10增加到30，使拖拽区域更大
-        return (wx - margin <= x <= wx + ww + margin and 
-                wy - margin <= y <= wy + wh + margin)
+        origin_x, origin_y = self.preview_origin
+        return self.watermark_geometry.contains(x - origin_x, y - origin_y, margin)
     
 
     
@@ -1225,35 +1644,6 @@ class MainWindow:
             self.root.after_cancel(self._refresh_timer)
             self._refresh_timer = None
     
-    def _calculate_watermark_position(self, image_size, watermark_size, watermark_config):
-        """计算水印在图片中的位置和尺寸"""
-        from utils import calculate_watermark_position
-        from PIL import Image
-        
-        # 获取旋转角度
-        rotation = watermark_config.get('rotation', 0)
-        
-        # 如果有旋转，需要计算旋转后的水印尺寸
-        if rotation != 0:
-            # 创建一个临时的水印图像来计算旋转后的尺寸
-            temp_watermark = Image.new('RGBA', watermark_size, (0, 0, 0, 0))
-            rotated_watermark = temp_watermark.rotate(rotation, expand=True)
-            actual_watermark_size = rotated_watermark.size
-        else:
-            actual_watermark_size = watermark_size
-        
-        # 计算水印位置
-        pos_x, pos_y = calculate_watermark_position(
-            image_size,
-            actual_watermark_size,
-            watermark_config['position_preset'],
-            watermark_config['offset_x'],
-            watermark_config['offset_y'],
-            watermark_config.get('padding', 10)
-        )
-        
-        return (pos_x, pos_y, actual_watermark_size[0], actual_watermark_size[1])
-            
     def on_closing(self):
         """窗口关闭事件"""
         # 保存当前配置
@@ -1264,6 +1654,9 @@ class MainWindow:
         }
         save_config(current_config)
         
+        self.preview_worker.stop()
+        self.preview_prefetcher.stop()
+        self.tile_worker.stop()
         self.root.destroy()
         
     def run(self):
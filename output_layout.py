@@ -0,0 +1,110 @@
+"""
+输出目录结构模块 - 按输入目录、哈希前缀或拍摄日期把导出文件分到子目录
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+from archive_reader import open_image, source_directory, source_mtime
+
+
+# 可选的目录结构：平铺、镜像输入目录、按哈希前缀分目录、按日期分目录
+LAYOUTS = ('flat', 'mirror', 'hash_prefix', 'date')
+
+LAYOUT_NAMES = {
+    'flat': '全部放在输出目录',
+    'mirror': '保持输入目录结构',
+    'hash_prefix': '按内容哈希前缀分目录',
+    'date': '按拍摄日期分目录'
+}
+
+# 哈希前缀目录名的长度（2 个十六进制字符 = 256 个子目录）
+HASH_PREFIX_LENGTH = 2
+
+# EXIF 中的拍摄时间（DateTimeOriginal，位于 Exif IFD）和修改时间（DateTime）
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+
+
+def common_input_root(file_paths: Iterable[str]) -> Optional[str]:
+    """计算所有输入文件所在目录的公共父目录，不存在（如位于不同盘符）时返回 None"""
+    directories = {source_directory(path) for path in file_paths}
+    if not directories:
+        return None
+    try:
+        return os.path.commonpath(list(directories))
+    except ValueError:
+        return None
+
+
+def get_image_date(file_path: str) -> str:
+    """获取图片的拍摄日期（YYYY/MM-DD），没有 EXIF 时使用文件修改时间"""
+    try:
+        with open_image(file_path) as img:
+            exif = img.getexif()
+            value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        if value:
+            # EXIF 日期格式为 "YYYY:MM:DD HH:MM:SS"
+            date = time.strptime(str(value).strip()[:10], '%Y:%m:%d')
+            return time.strftime('%Y/%m-%d', date)
+    except Exception:
+        pass
+    try:
+        return time.strftime('%Y/%m-%d', time.localtime(source_mtime(file_path)))
+    except (OSError, KeyError):
+        return 'unknown'
+
+
+class OutputLayout:
+    """输出目录结构类
+
+    根据配置为每张图片计算输出子目录，并记录本批次已创建的目录，
+    每个目录只调用一次 makedirs，不再在处理每张图片时重复创建和检查。
+    """
+
+    def __init__(self, output_dir: str, layout: str = 'flat', input_paths: Iterable[str] = ()):
+        self.output_dir = output_dir
+        self.layout = layout if layout in LAYOUTS else 'flat'
+        self.input_root = common_input_root(input_paths) if self.layout == 'mirror' else None
+        self._created: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def get_subdir(self, file_path: str, file_hash: str = '') -> str:
+        """计算图片相对输出目录的子目录，平铺时返回空字符串"""
+        if self.layout == 'mirror':
+            directory = source_directory(file_path)
+            if self.input_root:
+                subdir = os.path.relpath(directory, self.input_root)
+                return '' if subdir == os.curdir else subdir
+            # 输入位于不同盘符，去掉盘符后保留完整路径
+            return os.path.splitdrive(directory)[1].lstrip('\\/')
+        if self.layout == 'hash_prefix':
+            if not file_hash:
+                file_hash = hashlib.md5(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+            return file_hash[:HASH_PREFIX_LENGTH]
+        if self.layout == 'date':
+            return os.path.normpath(get_image_date(file_path))
+        return ''
+
+    def get_directory(self, file_path: str, file_hash: str = '') -> str:
+        """计算图片的输出目录"""
+        subdir = self.get_subdir(file_path, file_hash)
+        return os.path.join(self.output_dir, subdir) if subdir else self.output_dir
+
+    def ensure_directory(self, directory: str):
+        """确保目录存在，同一批次内每个目录只创建一次"""
+        key = os.path.normcase(os.path.abspath(directory))
+        with self._lock:
+            if key in self._created:
+                return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._created.add(key)
+
+    def get_statistics(self) -> Dict[str, int]:
+        """获取本批次创建（确认存在）的目录数"""
+        with self._lock:
+            return {'directories': len(self._created)}
@@ -0,0 +1,97 @@
+"""
+输出文件名分配模块 - 在内存中预留输出文件名，避免逐个探测文件是否存在
+"""
+
+import os
+import threading
+from typing import Dict, Set
+
+
+class _DirectoryState:
+    """单个输出目录的已用文件名和各文件名的下一个序号"""
+
+    __slots__ = ('names', 'counters')
+
+    def __init__(self, names: Set[str]):
+        self.names = names
+        self.counters: Dict[str, int] = {}
+
+
+class OutputNameAllocator:
+    """输出文件名分配器类
+
+    每个输出目录只用 os.scandir 读取一次已有文件名，之后的冲突检测和
+    序号分配都在内存中完成；同名文件按 name_1、name_2 … 递增，并记录每个
+    文件名下一次从哪个序号开始，避免大量重名时反复从 1 开始尝试。
+    文件名比较使用 os.path.normcase（Windows 下不区分大小写）。
+    所有方法都是线程安全的，多个导出线程可以共用一个分配器。
+    scan 为 False 时不读取磁盘，所有目录视为空目录（如归档内的路径）。
+    """
+
+    def __init__(self, scan: bool = True):
+        self.scan = scan
+        self._directories: Dict[str, _DirectoryState] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, output_dir: str, filename: str) -> str:
+        """分配一个在 output_dir 中唯一的文件名并预留它"""
+        with self._lock:
+            state = self._get_state(output_dir)
+            key = os.path.normcase(filename)
+            if key not in state.names:
+                state.names.add(key)
+                return filename
+
+            base_name, ext = os.path.splitext(filename)
+            counter = state.counters.get(key, 1)
+            while True:
+                candidate = f"{base_name}_{counter}{ext}"
+                candidate_key = os.path.normcase(candidate)
+                counter += 1
+                if candidate_key not in state.names:
+                    state.names.add(candidate_key)
+                    state.counters[key] = counter
+                    return candidate
+
+    def allocate_path(self, output_dir: str, filename: str) -> str:
+        """分配唯一文件名并返回完整路径"""
+        return os.path.join(output_dir, self.allocate(output_dir, filename))
+
+    def reserve(self, output_dir: str, filename: str):
+        """把文件名标记为已占用（例如由其他途径写入的文件）"""
+        with self._lock:
+            self._get_state(output_dir).names.add(os.path.normcase(filename))
+
+    def release(self, output_dir: str, filename: str):
+        """释放预留的文件名（例如写入失败时）"""
+        with self._lock:
+            self._get_state(output_dir).names.discard(os.path.normcase(filename))
+
+    def _get_state(self, output_dir: str) -> _DirectoryState:
+        """获取目录状态，首次访问时扫描目录（调用方持有锁）"""
+        if self.scan:
+            dir_key = os.path.normcase(os.path.abspath(output_dir))
+        else:
+            dir_key = os.path.normcase(os.path.normpath(output_dir))
+        state = self._directories.get(dir_key)
+        if state is None:
+            names = set()
+            if self.scan:
+                try:
+                    with os.scandir(output_dir) as entries:
+                        for entry in entries:
+                            names.add(os.path.normcase(entry.name))
+                except FileNotFoundError:
+                    # 目录尚未创建（例如分目录输出），视为空目录
+                    pass
+            state = _DirectoryState(names)
+            self._directories[dir_key] = state
+        return state
+
+    def get_statistics(self) -> Dict[str, int]:
+        """获取已扫描的目录数和已占用的文件名数"""
+        with self._lock:
+            return {
+                'directories': len(self._directories),
+                'names': sum(len(state.names) for state in self._directories.values())
+            }
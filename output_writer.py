@@ -0,0 +1,214 @@
+"""
+输出写入模块 - 临时文件加改名的原子写入，后台写入线程池和可配置的落盘策略
+"""
+
+import errno
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# 落盘策略：不调用 fsync、整批结束时统一 fsync、每个文件写完立即 fsync
+DURABILITY_MODES = ('none', 'batch', 'file')
+
+DURABILITY_NAMES = {
+    'none': '不强制落盘（最快）',
+    'batch': '整批结束时统一落盘',
+    'file': '每个文件立即落盘（最慢）'
+}
+
+# 表示不支持硬链接的错误码：跨设备、无权限、文件系统不支持、链接数已达上限
+_LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK,
+                     getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP), errno.EOPNOTSUPP}
+
+
+def _temp_path(path: str) -> str:
+    """同一目录下的隐藏临时文件名，改名前不会被当成输出文件"""
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".{filename}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+def atomic_write(path: str, data: bytes, fsync: bool = False):
+    """先写入临时文件再改名为目标文件，中途崩溃不会留下不完整的输出"""
+    temp_path = _temp_path(path)
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def link_or_copy(src_path: str, dst_path: str, data: Optional[bytes] = None, fsync: bool = False) -> str:
+    """为已导出的文件创建硬链接，不支持时原子地写入副本（data 为已有的文件内容），返回实际使用的方式
+
+    只有系统或文件系统不支持硬链接时才改为复制；目标已存在（FileExistsError）
+    等其他错误直接抛出，不会覆盖已有文件。
+    """
+    try:
+        os.link(src_path, dst_path)
+        return 'link'
+    except AttributeError:
+        pass
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+    if data is None:
+        with open(src_path, 'rb') as f:
+            data = f.read()
+    atomic_write(dst_path, data, fsync)
+    return 'copy'
+
+
+def fsync_path(path: str):
+    """把已写入的文件刷到磁盘"""
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(directory: str):
+    """把目录项（新建和改名）刷到磁盘，Windows 不支持时跳过"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class OutputWriter:
+    """输出写入器类
+
+    导出线程把编码好的内容交给 submit()，由固定数量的写入线程原子地写到
+    磁盘（write-behind）。队列有上限，磁盘跟不上时 submit() 阻塞，内存占用
+    有界。内容相同的其他输出路径（links）优先硬链接到刚写好的文件。
+
+    durability 决定何时 fsync：
+        none: 不调用 fsync，由系统择机写回（进程崩溃不会留下不完整文件，断电可能丢失）
+        batch: close() 时各写入线程并行 fsync 本批次写入的文件，再 fsync 目录
+        file: 每个文件改名前 fsync，close() 时再 fsync 目录
+    """
+
+    def __init__(self, durability: str = 'none', workers: int = 2, queue_size: int = 16):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"不支持的落盘策略: {durability}")
+        self.durability = durability
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._directories = set()
+        self._closed = False
+        self.failed: List[Tuple[str, str]] = []
+        self.files = 0
+        self.bytes_written = 0
+        self.write_time = 0.0
+        self.sync_time = 0.0
+
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, path: str, data: bytes, links: Iterable[str] = ()):
+        """提交一个输出文件，links 为内容相同的其他输出路径"""
+        if self._closed:
+            raise ValueError("写入器已关闭")
+        self._queue.put((path, data, list(links)))
+
+    def _run(self):
+        """写入线程"""
+        fsync = self.durability == 'file'
+        # 本线程写入的文件，整批落盘时由各线程并行 fsync
+        own_written = []
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, data, links = item
+            start = time.perf_counter()
+            written = []
+            try:
+                atomic_write(path, data, fsync)
+                written.append(path)
+            except Exception as e:
+                print(f"写入文件失败 {path}: {e}")
+                with self._lock:
+                    self.failed.extend((target, str(e)) for target in [path] + links)
+                continue
+
+            for link in links:
+                try:
+                    link_or_copy(path, link, data, fsync)
+                    written.append(link)
+                except Exception as e:
+                    print(f"写入文件失败 {link}: {e}")
+                    with self._lock:
+                        self.failed.append((link, str(e)))
+
+            elapsed = time.perf_counter() - start
+            own_written.extend(written)
+            with self._lock:
+                self._directories.update(os.path.dirname(os.path.abspath(p)) for p in written)
+                self.files += len(written)
+                self.bytes_written += len(data) * len(written)
+                self.write_time += elapsed
+
+        if self.durability == 'batch':
+            start = time.perf_counter()
+            for path in own_written:
+                try:
+                    fsync_path(path)
+                except OSError as e:
+                    print(f"同步文件失败 {path}: {e}")
+            with self._lock:
+                self.sync_time += time.perf_counter() - start
+
+    def close(self):
+        """等待所有文件写完，并按落盘策略同步到磁盘"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+        start = time.perf_counter()
+        if self.durability != 'none':
+            for directory in self._directories:
+                try:
+                    fsync_directory(directory)
+                except OSError as e:
+                    print(f"同步目录失败 {directory}: {e}")
+        with self._lock:
+            self.sync_time += time.perf_counter() - start
+
+    def get_statistics(self) -> Dict[str, float]:
+        """获取写入统计"""
+        with self._lock:
+            return {
+                'files': self.files,
+                'bytes': self.bytes_written,
+                'failed': len(self.failed),
+                'pending': self._queue.qsize(),
+                'write_time': self.write_time,
+                'sync_time': self.sync_time
+            }
+
+    def __enter__(self) -> 'OutputWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,267 @@
+"""
+预览渲染模块 - 在预览分辨率下合成水印
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from PIL import Image
+from archive_reader import open_image
+from image_cache import ImageCache, estimate_image_bytes
+from watermark_engine import WatermarkEngine
+from watermark_geometry import WatermarkGeometry
+
+
+# 随预览缩放比例一起缩放的水印参数（像素单位）及其默认值（与引擎和几何计算一致）
+SCALED_KEYS = {'font_size': 24, 'offset_x': 20, 'offset_y': 20, 'padding': 10}
+
+# 草稿帧按预览尺寸的这个比例解码，再放大显示
+DRAFT_REDUCTION = 4
+
+# 拖拽水印时偏移的取值范围（原图像素）
+DRAG_OFFSET_LIMIT = 1000
+
+
+class RenderCancelled(Exception):
+    """渲染被更新的请求取消"""
+
+
+def _check_cancelled(is_cancelled: Optional[Callable[[], bool]]):
+    """协作式取消检查点"""
+    if is_cancelled is not None and is_cancelled():
+        raise RenderCancelled()
+
+
+def fit_size(original_size: Tuple[int, int], max_size: Tuple[int, int]) -> Tuple[int, int]:
+    """计算等比缩小到 max_size 以内后的尺寸（不放大）"""
+    width, height = original_size
+    if width <= max_size[0] and height <= max_size[1]:
+        return width, height
+    ratio = min(max_size[0] / width, max_size[1] / height)
+    return max(1, int(round(width * ratio))), max(1, int(round(height * ratio)))
+
+
+def drag_offset(start_offset: Tuple[int, int], start_point: Tuple[float, float],
+                point: Tuple[float, float], scale: float) -> Tuple[int, int]:
+    """把画布上的拖拽位移（预览像素）换算为水印偏移（原图像素）"""
+    dx = (point[0] - start_point[0]) / scale
+    dy = (point[1] - start_point[1]) / scale
+    new_x = max(-DRAG_OFFSET_LIMIT, min(DRAG_OFFSET_LIMIT, start_offset[0] + int(dx)))
+    new_y = max(-DRAG_OFFSET_LIMIT, min(DRAG_OFFSET_LIMIT, start_offset[1] + int(dy)))
+    return new_x, new_y
+
+
+def flatten_image(image: Image.Image) -> Image.Image:
+    """把图片转换为 RGB，透明部分合成到白色背景上（与预览显示效果一致）"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def scale_watermark_config(watermark_config: Dict[str, Any], scale: float) -> Dict[str, Any]:
+    """将水印配置中的像素参数按比例缩放到预览坐标系"""
+    if scale == 1.0:
+        return dict(watermark_config)
+
+    config = dict(watermark_config)
+    # 未给出的参数按默认值缩放，否则预览中会使用原图尺度的默认值
+    for key, default in SCALED_KEYS.items():
+        config[key] = int(round(config.get(key, default) * scale))
+    config['font_size'] = max(1, config['font_size'])
+    config['scale'] = config.get('scale', 1.0) * scale
+
+    shadow = config.get('shadow')
+    if shadow:
+        shadow = dict(shadow)
+        for key in ('offset_x', 'offset_y', 'blur'):
+            if key in shadow:
+                shadow[key] = int(round(shadow[key] * scale))
+        config['shadow'] = shadow
+    stroke = config.get('stroke')
+    if stroke:
+        stroke = dict(stroke)
+        if 'width' in stroke:
+            stroke['width'] = max(1, int(round(stroke['width'] * scale)))
+        config['stroke'] = stroke
+    return config
+
+
+class PreviewRenderer:
+    """预览渲染器类
+
+    缓存按画布尺寸缩小后的底图，并把水印参数缩放到同一坐标系，
+    每帧只需在画布大小的图片上合成一次水印。底图放在 LRU 缓存中
+    （可与缩略图共用），预取线程和预览线程同时请求同一张图时只解码一次。
+    """
+
+    def __init__(self, watermark_engine: WatermarkEngine, cache: Optional[ImageCache] = None,
+                 draft_source: Optional[Callable[[str], Optional[Image.Image]]] = None):
+        """draft_source(file_path) 返回已有的低分辨率图（如缩略图），用于草稿帧"""
+        self.watermark_engine = watermark_engine
+        self.cache = cache if cache is not None else ImageCache()
+        self.draft_source = draft_source
+        # 正在解码的底图 -> 完成事件
+        self._loading: Dict[Tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get_base(self, file_path: str, max_size: Tuple[int, int]) -> Tuple[Image.Image, float, Tuple[int, int]]:
+        """获取缩小到预览尺寸的底图，返回 (底图, 缩放比例, 原图尺寸)"""
+        key = ('preview', file_path, max_size)
+        while True:
+            base = self.cache.get(key)
+            if base is not None:
+                return base
+            with self._lock:
+                event = self._loading.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._loading[key] = event
+                    break
+            # 其他线程正在解码同一张图，等待其完成后再读缓存
+            event.wait()
+
+        try:
+            base = self._load_base(file_path, max_size)
+            self.cache.put(key, base, estimate_image_bytes(base[0]))
+        finally:
+            with self._lock:
+                del self._loading[key]
+            event.set()
+        return base
+
+    def is_cached(self, file_path: str, max_size: Tuple[int, int]) -> bool:
+        """底图是否已在缓存中"""
+        return ('preview', file_path, max_size) in self.cache
+
+    def _load_base(self, file_path: str, max_size: Tuple[int, int]) -> Tuple[Image.Image, float, Tuple[int, int]]:
+        """解码并缩小原图"""
+        with open_image(file_path) as img:
+            original_size = img.size
+            # JPEG 可以直接以降低的分辨率解码
+            img.draft('RGB', max_size)
+            img.load()
+            base = img.copy()
+
+        base.thumbnail(max_size, Image.Resampling.LANCZOS)
+        base = flatten_image(base)
+        scale = base.width / original_size[0] if original_size[0] else 1.0
+        return base, scale, original_size
+
+    def _load_draft_base(self, file_path: str, max_size: Tuple[int, int],
+                         original_size: Optional[Tuple[int, int]] = None) -> Optional[Tuple[Image.Image, float, Tuple[int, int]]]:
+        """快速获取低分辨率底图并放大到预览尺寸，无法快速获取时返回 None"""
+        draft = None
+        if self.draft_source is not None and original_size and original_size[0] and original_size[1]:
+            draft = self.draft_source(file_path)
+        if draft is None:
+            # 只有 JPEG 支持按比例降低分辨率解码，其他格式直接等待清晰帧
+            with open_image(file_path) as img:
+                if img.format != 'JPEG':
+                    return None
+                original_size = img.size
+                img.draft('RGB', (max(1, max_size[0] // DRAFT_REDUCTION), max(1, max_size[1] // DRAFT_REDUCTION)))
+                img.load()
+                draft = img.copy()
+
+        display_size = fit_size(original_size, max_size)
+        base = flatten_image(draft.resize(display_size, Image.Resampling.BILINEAR))
+        scale = base.width / original_size[0]
+        return base, scale, original_size
+
+    def create_watermark(self, watermark_config: Dict[str, Any]) -> Optional[Image.Image]:
+        """按配置创建（未旋转的）水印图像"""
+        return self.watermark_engine.create_watermark(watermark_config)
+
+    def render(self, file_path: str, watermark_config: Dict[str, Any],
+               max_size: Tuple[int, int],
+               is_cancelled: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """渲染一帧预览
+
+        is_cancelled 在解码底图前后被调用，返回 True 时抛出 RenderCancelled；
+        底图就绪后的合成很快，总是完成，避免连续拖拽时每帧都被取消。
+
+        返回的字典包含:
+            image: 预览图（RGB）
+            scale: 预览相对原图的缩放比例
+            original_size: 原图尺寸
+            watermark_rect: 水印在预览图中的 (x, y, w, h)，没有水印时为 None
+            geometry: 水印在预览图中的几何信息（WatermarkGeometry），没有水印时为 None
+            base: 未加水印的底图，拖拽时作为独立图层显示
+            watermark: 已旋转的水印图层（RGBA），没有水印时为 None
+            preview_config: 缩放到预览坐标系后的水印配置
+            is_draft: 是否为低分辨率草稿帧
+            timings: 各阶段耗时（秒），decode 为获取底图，render 为合成水印
+        """
+        _check_cancelled(is_cancelled)
+        start = time.perf_counter()
+        base, scale, original_size = self.get_base(file_path, max_size)
+        decode_time = time.perf_counter() - start
+        _check_cancelled(is_cancelled)
+        return self._compose(base, scale, original_size, watermark_config, decode_time=decode_time)
+
+    def render_draft(self, file_path: str, watermark_config: Dict[str, Any],
+                     max_size: Tuple[int, int], original_size: Optional[Tuple[int, int]] = None,
+                     is_cancelled: Optional[Callable[[], bool]] = None) -> Optional[Dict[str, Any]]:
+        """渲染低分辨率草稿帧（尺寸与清晰帧相同），无法快速生成时返回 None"""
+        _check_cancelled(is_cancelled)
+        start = time.perf_counter()
+        try:
+            draft = self._load_draft_base(file_path, max_size, original_size)
+        except Exception as e:
+            print(f"生成草稿预览失败 {file_path}: {e}")
+            return None
+        if draft is None:
+            return None
+        _check_cancelled(is_cancelled)
+        return self._compose(*draft, watermark_config, is_draft=True, decode_time=time.perf_counter() - start)
+
+    def render_progressive(self, file_path: str, watermark_config: Dict[str, Any],
+                           max_size: Tuple[int, int], original_size: Optional[Tuple[int, int]] = None,
+                           is_cancelled: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+        """依次产出草稿帧和清晰帧；底图已缓存时只产出清晰帧"""
+        if not self.is_cached(file_path, max_size):
+            draft = self.render_draft(file_path, watermark_config, max_size, original_size, is_cancelled)
+            if draft is not None:
+                yield draft
+        yield self.render(file_path, watermark_config, max_size, is_cancelled)
+
+    def _compose(self, base: Image.Image, scale: float, original_size: Tuple[int, int],
+                 watermark_config: Dict[str, Any], is_draft: bool = False,
+                 decode_time: float = 0.0) -> Dict[str, Any]:
+        """在底图上合成水印"""
+        start = time.perf_counter()
+        config = scale_watermark_config(watermark_config, scale)
+
+        frame = base
+        geometry = None
+        watermark, watermark_size = self.watermark_engine.prepare_watermark(config)
+        if watermark:
+            geometry = WatermarkGeometry.from_config(base.size, watermark_size, config)
+            frame = self.watermark_engine.paste_watermark(base, watermark, geometry.position)
+
+        return {
+            'image': frame,
+            'scale': scale,
+            'original_size': original_size,
+            'watermark_rect': geometry.rect if geometry else None,
+            'geometry': geometry,
+            'base': base,
+            'watermark': watermark,
+            'preview_config': config,
+            'is_draft': is_draft,
+            'timings': {'decode': decode_time, 'render': time.perf_counter() - start}
+        }
+
+    @staticmethod
+    def place_watermark(frame: Dict[str, Any], offset_x: int, offset_y: int) -> Optional[WatermarkGeometry]:
+        """按新的偏移（原图坐标）重新放置水印图层，返回预览坐标系中的几何信息，不重新合成"""
+        geometry = frame.get('geometry')
+        if geometry is None:
+            return None
+        scale = frame['scale']
+        return geometry.moved(int(round(offset_x * scale)), int(round(offset_y * scale)))
@@ -0,0 +1,157 @@
+"""
+预览性能统计模块 - 记录每帧各阶段耗时，维护滚动延迟直方图
+"""
+
+import json
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# 每帧记录的阶段：解码底图、合成水印、转换为 PhotoImage、更新画布
+STAGES = ('decode', 'render', 'convert', 'display')
+
+# 延迟直方图的桶上限（毫秒），最后一个桶收集更慢的帧
+HISTOGRAM_BOUNDS_MS = (4, 8, 16, 33, 50, 100, 200, 500, 1000)
+
+
+def percentile(values: Iterable[float], percent: float) -> float:
+    """计算百分位数（最近秩法），没有数据时返回 0"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def build_histogram(latencies_ms: Iterable[float],
+                    bounds: Iterable[float] = HISTOGRAM_BOUNDS_MS) -> List[Dict[str, Any]]:
+    """按桶统计延迟分布，le 为桶上限（毫秒），None 表示无上限"""
+    bounds = list(bounds)
+    counts = [0] * (len(bounds) + 1)
+    for value in latencies_ms:
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return [{'le': bound, 'count': count} for bound, count in zip(bounds + [None], counts)]
+
+
+class PreviewStats:
+    """预览性能统计类
+
+    保存最近 window 帧的阶段耗时和端到端延迟（从提交请求或鼠标事件到
+    画面更新），按需汇总为百分位数和直方图，可导出为 JSON 以便跨版本对比。
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._frames: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.total_frames = 0
+        self.dropped_frames = 0
+        self.started_at = time.time()
+
+    def record_frame(self, latency: float, timings: Optional[Dict[str, float]] = None, kind: str = 'frame'):
+        """记录一帧（时间单位为秒）；kind 区分完整帧 frame、草稿帧 draft 和拖拽图层移动 drag"""
+        with self._lock:
+            self._frames.append((kind, latency, dict(timings or {})))
+            self.total_frames += 1
+
+    def record_dropped(self, count: int = 1):
+        """记录被丢弃的过期帧"""
+        with self._lock:
+            self.dropped_frames += count
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._frames.clear()
+            self.total_frames = 0
+            self.dropped_frames = 0
+            self.started_at = time.time()
+
+    def get_latencies(self, kinds: Optional[Iterable[str]] = None) -> List[float]:
+        """获取滚动窗口内指定类型帧的延迟（毫秒），kinds 为 None 时返回全部"""
+        kinds = set(kinds) if kinds is not None else None
+        with self._lock:
+            return [latency * 1000 for kind, latency, _ in self._frames if kinds is None or kind in kinds]
+
+    def get_last_frame(self) -> Optional[Dict[str, Any]]:
+        """获取最近一帧的耗时（毫秒）"""
+        with self._lock:
+            if not self._frames:
+                return None
+            kind, latency, timings = self._frames[-1]
+        return {
+            'kind': kind,
+            'latency_ms': latency * 1000,
+            'stages_ms': {stage: value * 1000 for stage, value in timings.items()}
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总滚动窗口内的统计（毫秒）"""
+        with self._lock:
+            frames = list(self._frames)
+            total_frames = self.total_frames
+            dropped_frames = self.dropped_frames
+
+        latencies = [latency * 1000 for _, latency, _ in frames]
+        kinds: Dict[str, int] = {}
+        for kind, _, _ in frames:
+            kinds[kind] = kinds.get(kind, 0) + 1
+
+        stages = {}
+        for stage in STAGES:
+            values = [timings[stage] * 1000 for _, _, timings in frames if stage in timings]
+            if values:
+                stages[stage] = {
+                    'avg': sum(values) / len(values),
+                    'p95': percentile(values, 95),
+                    'max': max(values)
+                }
+
+        return {
+            'window': len(frames),
+            'total_frames': total_frames,
+            'dropped_frames': dropped_frames,
+            'kinds': kinds,
+            'latency': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies) if latencies else 0.0
+            },
+            'stages': stages,
+            'histogram': build_histogram(latencies)
+        }
+
+    def format_status(self) -> str:
+        """生成状态栏显示的简短文本"""
+        last = self.get_last_frame()
+        summary = self.summary()
+        latency = summary['latency']
+        text = f"延迟 p50 {latency['p50']:.0f} / p95 {latency['p95']:.0f} ms"
+        if last:
+            names = {'decode': '解码', 'render': '渲染', 'convert': '转换', 'display': '显示'}
+            stages = " ".join(f"{names[stage]} {last['stages_ms'][stage]:.1f}"
+                              for stage in STAGES if stage in last['stages_ms'])
+            text += f" | 本帧 {last['latency_ms']:.1f} ms ({stages})"
+        return text + f" | 丢帧 {summary['dropped_frames']}"
+
+    def dump_json(self, path: str, extra: Optional[Dict[str, Any]] = None):
+        """把汇总统计写入 JSON 文件"""
+        data = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration': time.time() - self.started_at,
+            'histogram_bounds_ms': list(HISTOGRAM_BOUNDS_MS),
+            'summary': self.summary()
+        }
+        if extra:
+            data.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
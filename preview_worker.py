@@ -0,0 +1,157 @@
+"""
+预览工作线程模块 - 单线程合并预览请求，只渲染最新的一帧；后台预取相邻图片
+"""
+
+import inspect
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from preview_renderer import RenderCancelled
+
+
+class PreviewWorker:
+    """预览工作线程类
+
+    所有预览请求提交到同一个常驻线程。线程忙碌期间提交的多个请求只保留
+    最新的一个（后者覆盖前者）；每个请求带有递增的代数，渲染函数可通过
+    is_cancelled 在耗时阶段之间协作式放弃已被取代的渲染。完成的结果连同
+    代数一起投递，由接收方丢弃比已显示帧更旧的结果。渲染函数返回生成器时
+    （先草稿后清晰的渐进渲染），每产出一帧就投递一次，同一请求的各帧代数相同。
+    """
+
+    def __init__(self, render_func: Callable[[Any, Callable[[], bool]], Any],
+                 on_result: Callable[[int, Any, Optional[Exception]], None]):
+        """
+        render_func(request, is_cancelled) 在工作线程中执行渲染；
+        on_result(generation, result, error) 在工作线程中接收渲染结果。
+        """
+        self.render_func = render_func
+        self.on_result = on_result
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._pending: Optional[Tuple[int, Any]] = None
+        self._running = True
+        self.stats: Dict[str, int] = {'submitted': 0, 'rendered': 0, 'coalesced': 0, 'cancelled': 0}
+        self._thread = threading.Thread(target=self._run, name="PreviewWorker", daemon=True)
+        self._thread.start()
+
+    @property
+    def latest_generation(self) -> int:
+        """最新请求的代数"""
+        return self._generation
+
+    def submit(self, request: Any) -> int:
+        """提交预览请求，返回该请求的代数"""
+        with self._condition:
+            self._generation += 1
+            if self._pending is not None:
+                # 尚未开始的旧请求直接被覆盖
+                self.stats['coalesced'] += 1
+            self._pending = (self._generation, request)
+            self.stats['submitted'] += 1
+            self._condition.notify()
+            return self._generation
+
+    def is_current(self, generation: int) -> bool:
+        """该代数是否仍是最新请求"""
+        return generation == self._generation
+
+    def stop(self, timeout: Optional[float] = 1.0):
+        """停止工作线程"""
+        with self._condition:
+            self._running = False
+            self._generation += 1
+            self._pending = None
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        """工作线程主循环"""
+        while True:
+            with self._condition:
+                while self._running and self._pending is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                generation, request = self._pending
+                self._pending = None
+
+            def is_cancelled(generation=generation) -> bool:
+                return generation != self._generation
+
+            try:
+                result = self.render_func(request, is_cancelled)
+                if inspect.isgenerator(result):
+                    for frame in result:
+                        self._deliver(generation, frame, None)
+                else:
+                    self._deliver(generation, result, None)
+            except RenderCancelled:
+                self.stats['cancelled'] += 1
+            except Exception as e:
+                self._deliver(generation, None, e)
+
+    def _deliver(self, generation: int, result: Any, error: Optional[Exception]):
+        """投递一帧结果"""
+        self.stats['rendered'] += 1
+        try:
+            self.on_result(generation, result, error)
+        except Exception as e:
+            print(f"投递预览结果失败: {e}")
+
+
+class PreviewPrefetcher:
+    """预取线程类
+
+    在后台按由近及远的顺序解码相邻图片的预览底图并放入缓存。每次提交
+    新的列表都会替换尚未处理的旧列表，翻页时只预取当前图片附近的项。
+    """
+
+    def __init__(self, load_func: Callable[[str, Tuple[int, int]], Any],
+                 is_cached: Optional[Callable[[str, Tuple[int, int]], bool]] = None):
+        """
+        load_func(file_path, max_size) 解码并缓存底图；
+        is_cached(file_path, max_size) 用于跳过已缓存的图片。
+        """
+        self.load_func = load_func
+        self.is_cached = is_cached
+        self._condition = threading.Condition()
+        self._queue: List[Tuple[str, Tuple[int, int]]] = []
+        self._running = True
+        self.stats: Dict[str, int] = {'requested': 0, 'loaded': 0, 'skipped': 0, 'failed': 0}
+        self._thread = threading.Thread(target=self._run, name="PreviewPrefetcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, file_paths: List[str], max_size: Tuple[int, int]):
+        """替换待预取列表"""
+        with self._condition:
+            self._queue = [(file_path, max_size) for file_path in file_paths]
+            self.stats['requested'] += len(self._queue)
+            self._condition.notify()
+
+    def stop(self, timeout: Optional[float] = 1.0):
+        """停止预取线程"""
+        with self._condition:
+            self._running = False
+            self._queue = []
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        """预取线程主循环"""
+        while True:
+            with self._condition:
+                while self._running and not self._queue:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                file_path, max_size = self._queue.pop(0)
+
+            if self.is_cached is not None and self.is_cached(file_path, max_size):
+                self.stats['skipped'] += 1
+                continue
+            try:
+                self.load_func(file_path, max_size)
+                self.stats['loaded'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"预取预览失败 {file_path}: {e}")
@@ -252,7 +252,10 @@ class TemplateManager:
                 'naming_rule': 'suffix',
                 'prefix': 'wm_',
                 'suffix': '_watermarked',
-                'output_dir': ''
+                'output_dir': '',
+                'layout': 'flat',
+                'archive': '',
+                'durability': 'none'
             },
             'version': '1.0'
         }
@@ -279,7 +282,10 @@ class TemplateManager:
                 'naming_rule': 'prefix',
                 'prefix': 'logo_',
                 'suffix': '_watermarked',
-                'output_dir': ''
+                'output_dir': '',
+                'layout': 'flat',
+                'archive': '',
+                'durability': 'none'
             },
             'version': '1.0'
         }
@@ -376,6 +382,7 @@ class TemplateManager:
             if export_config.get('format') == 'JPEG':
                 preview_lines.append(f"JPEG质量: {export_config.get('jpeg_quality', 85)}")
             preview_lines.append(f"命名规则: {export_config.get('naming_rule', 'keep_original')}")
+            preview_lines.append(f"目录结构: {export_config.get('layout', 'flat')}")
             
             return "\n".join(preview_lines)
             
@@ -137,6 +137,1145 @@ def test_config():
         print(f"- 配置功能测试失败: {e}")
         return False
 
+def test_thumbnail_store():
+    """测试缩略图存储"""
+    print("\n测试缩略图存储...")
+    
+    import tempfile
+    from PIL import Image
+    from thumbnail_store import ThumbnailStore
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = []
+        for i in range(5):
+            path = os.path.join(temp_dir, f"img_{i}.png")
+            Image.new('RGB', (400, 300), (i * 40, 80, 160)).save(path)
+            paths.append(path)
+        
+        # 上限只够容纳两张解码后的缩略图
+        store = ThumbnailStore((100, 100), max_decoded_bytes=2 * 100 * 75 * 3)
+        for path in paths:
+            assert store.add(path, path)
+        for path in paths:
+            assert store.get(path).size == (100, 75)
+        stats = store.cache.get_statistics()
+        assert stats['items'] == 2 and stats['bytes'] <= stats['max_bytes']
+        print("+ 解码缓存遵守内存上限")
+        
+        store.set_size((40, 40))
+        assert store.get(paths[0]).size == (40, 30)
+        assert store.wait_until_idle(10)
+        assert all(store.get(path).size == (40, 30) for path in paths)
+        print("+ 修改尺寸后缩略图重建成功")
+        
+        # 指定尺寸生成的缩略图按该尺寸保存，显示时仍使用当前尺寸
+        from image_manager import ImageItem
+        item = ImageItem(paths[1], store)
+        assert item.generate_thumbnail((20, 20))
+        assert store._encoded[paths[1]][0] == (20, 20)
+        assert item.thumbnail.size == (40, 30)
+        assert ImageItem(paths[2]).generate_thumbnail((20, 20))
+    
+    return True
+
+def test_batch_remove():
+    """测试批量删除与选中状态"""
+    print("\n测试批量删除...")
+    
+    import tempfile
+    from PIL import Image
+    from image_manager import ImageManager
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = []
+        for i in range(10):
+            path = os.path.join(temp_dir, f"img_{i}.png")
+            Image.new('RGB', (32, 32), (i * 20, 0, 0)).save(path)
+            paths.append(path)
+        
+        manager = ImageManager()
+        assert manager.add_images(paths) == (10, 0)
+        manager.select_image(9)
+        current_id = manager.current_id
+        
+        assert manager.remove_images([0, 2, 4, 6]) == 4
+        assert [img.file_path for img in manager.images] == [paths[i] for i in (1, 3, 5, 7, 8, 9)]
+        # 当前图片保持不变，索引自动跟随
+        assert manager.current_id == current_id and manager.current_index == 5
+        
+        manager.selected_indices = {0, 1, 5}
+        assert manager.remove_selected() == 3
+        assert [img.file_path for img in manager.images] == [paths[i] for i in (5, 7, 8)]
+        assert manager.get_current_image() is None and not manager.selected_indices
+        assert manager.get_statistics()['loaded'] == 3
+        print("+ 批量删除后列表和选中状态正确")
+    
+    return True
+
+def test_image_list_model():
+    """测试图片列表模型"""
+    print("\n测试图片列表模型...")
+    
+    import tempfile
+    from PIL import Image
+    from image_manager import ImageManager
+    from image_list_model import ImageListModel
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        names = ['c.png', 'a.png', 'b.png', 'ab.png']
+        sizes = [(30, 30), (10, 10), (40, 40), (20, 20)]
+        paths = []
+        for name, size in zip(names, sizes):
+            path = os.path.join(temp_dir, name)
+            Image.new('RGB', size).save(path)
+            paths.append(path)
+        
+        manager = ImageManager()
+        model = ImageListModel(manager)
+        manager.add_images(paths[:3])
+        manager.add_image(paths[3])
+        
+        def row_names():
+            return [manager.get_item(item_id).file_name for item_id in model.get_ids(0, len(model))]
+        
+        assert row_names() == names
+        model.sort_by('name')
+        assert row_names() == ['a.png', 'ab.png', 'b.png', 'c.png']
+        model.sort_by('name')
+        assert row_names() == ['c.png', 'b.png', 'ab.png', 'a.png']
+        model.sort_by('size', reverse=False)
+        assert row_names() == ['a.png', 'ab.png', 'c.png', 'b.png']
+        
+        model.set_filter('A')
+        assert row_names() == ['a.png', 'ab.png']
+        manager.remove_images([1])
+        assert row_names() == ['ab.png']
+        model.set_filter('')
+        assert row_names() == ['ab.png', 'c.png', 'b.png']
+        
+        # 过滤隐藏的图片不再保持选中，删除选中只影响可见行
+        manager.selected_ids = {img.item_id for img in manager.images}
+        model.set_filter('b')
+        assert row_names() == ['ab.png', 'b.png']
+        assert manager.remove_selected() == 2
+        model.set_filter('')
+        assert row_names() == ['c.png']
+        print("+ 列表模型排序、过滤和增量更新正确")
+    
+    return True
+
+def test_dedupe_groups():
+    """测试内容哈希去重分组"""
+    print("\n测试内容去重...")
+    
+    import errno
+    import tempfile
+    import shutil
+    from PIL import Image
+    from image_manager import ImageManager
+    from output_writer import link_or_copy
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.makedirs(os.path.join(temp_dir, 'sub'))
+        first = os.path.join(temp_dir, 'a.png')
+        other = os.path.join(temp_dir, 'b.png')
+        Image.new('RGB', (16, 16), (255, 0, 0)).save(first)
+        Image.new('RGB', (16, 16), (0, 255, 0)).save(other)
+        copy = os.path.join(temp_dir, 'sub', 'a_copy.png')
+        shutil.copyfile(first, copy)
+        
+        manager = ImageManager()
+        manager.add_images([first, other, copy])
+        groups = manager.get_export_groups(dedupe=True)
+        assert [[img.file_path for img in group] for group in groups] == [[first, copy], [other]]
+        assert len(manager.get_export_groups(dedupe=False)) == 3
+        assert manager.get_duplicate_count() == 1
+        manager.remove_images([0])
+        assert manager.get_duplicate_count() == 0
+        
+        target = os.path.join(temp_dir, 'linked.png')
+        assert link_or_copy(first, target) in ('link', 'copy')
+        with open(first, 'rb') as f1, open(target, 'rb') as f2:
+            assert f1.read() == f2.read()
+        # 目标已存在时报错，不覆盖已有文件
+        try:
+            link_or_copy(other, target, b'copied')
+            assert False, "已有文件被覆盖"
+        except FileExistsError:
+            pass
+        with open(first, 'rb') as f1, open(target, 'rb') as f2:
+            assert f1.read() == f2.read()
+        # 不支持硬链接（如跨设备）时原子地写入副本
+        def cross_device_link(src, dst):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        original_link = os.link
+        os.link = cross_device_link
+        try:
+            copied = os.path.join(temp_dir, 'copied.png')
+            assert link_or_copy(other, copied, b'copied') == 'copy'
+        finally:
+            os.link = original_link
+        with open(copied, 'rb') as f:
+            assert f.read() == b'copied'
+        print("+ 相同内容的图片分组正确")
+    
+    return True
+
+def test_watermark_geometry():
+    """测试水印几何计算"""
+    print("\n测试水印几何...")
+    
+    from PIL import Image
+    from watermark_geometry import WatermarkGeometry, rotated_size
+    
+    watermark = Image.new('RGBA', (200, 60), (255, 0, 0, 255))
+    for angle in (0, 17, -45, 90, 135, -170, 180):
+        layer = watermark.rotate(angle, expand=True, fillcolor=(0, 0, 0, 0))
+        assert rotated_size(watermark.size, angle) == layer.size
+        
+        geometry = WatermarkGeometry((1000, 800), watermark.size, angle, 'top_left', 5, 7, 0)
+        assert geometry.rect == (5, 7) + layer.size
+        # 图层中心一定在水印内，图层角落在旋转后是透明的
+        assert geometry.contains(5 + layer.width / 2, 7 + layer.height / 2)
+        if angle % 90:
+            assert layer.getpixel((0, 0))[3] == 0
+            assert not geometry.contains(5.5, 7.5)
+    
+    moved = WatermarkGeometry((1000, 800), (200, 60), 30).moved(-100, -50)
+    assert moved.layer_size == rotated_size((200, 60), 30)
+    print("+ 旋转尺寸、位置和命中检测正确")
+    
+    return True
+
+def test_output_naming():
+    """测试输出文件名分配"""
+    print("\n测试输出文件名分配...")
+    
+    import tempfile
+    import threading
+    from output_naming import OutputNameAllocator
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name in ('a.jpg', 'a_1.jpg', 'a_3.jpg'):
+            open(os.path.join(temp_dir, name), 'wb').close()
+        
+        allocator = OutputNameAllocator()
+        assert allocator.allocate(temp_dir, 'a.jpg') == 'a_2.jpg'
+        assert allocator.allocate(temp_dir, 'a.jpg') == 'a_4.jpg'
+        assert allocator.allocate(temp_dir, 'b.jpg') == 'b.jpg'
+        assert allocator.allocate(temp_dir, 'b.jpg') == 'b_1.jpg'
+        
+        # 多个导出线程同时分配时名称不重复
+        results = []
+        def worker():
+            for _ in range(200):
+                results.append(allocator.allocate(temp_dir, 'c.jpg'))
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(results)) == 800
+        
+        # 尚未创建的目录视为空目录
+        assert allocator.allocate(os.path.join(temp_dir, 'new'), 'a.jpg') == 'a.jpg'
+        print("+ 重名文件按序号分配，并发分配不冲突")
+    
+    return True
+
+def test_output_layout():
+    """测试输出目录结构"""
+    print("\n测试输出目录结构...")
+    
+    import tempfile
+    import time
+    from PIL import Image
+    from output_layout import OutputLayout
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_dir = os.path.join(temp_dir, 'input')
+        output_dir = os.path.join(temp_dir, 'output')
+        paths = [os.path.join(input_dir, 'a', '1.jpg'), os.path.join(input_dir, 'b', 'c', '2.jpg')]
+        for path in paths:
+            os.makedirs(os.path.dirname(path))
+            Image.new('RGB', (8, 8)).save(path)
+        
+        flat = OutputLayout(output_dir, 'flat', paths)
+        assert flat.get_directory(paths[1]) == output_dir
+        
+        mirror = OutputLayout(output_dir, 'mirror', paths)
+        assert mirror.get_directory(paths[0]) == os.path.join(output_dir, 'a')
+        assert mirror.get_directory(paths[1]) == os.path.join(output_dir, 'b', 'c')
+        
+        sharded = OutputLayout(output_dir, 'hash_prefix', paths)
+        assert sharded.get_directory(paths[0], 'abcdef') == os.path.join(output_dir, 'ab')
+        
+        dated = OutputLayout(output_dir, 'date', paths)
+        os.utime(paths[0], (1700000000, 1700000000))
+        expected = time.strftime('%Y/%m-%d', time.localtime(1700000000))
+        assert dated.get_directory(paths[0]) == os.path.join(output_dir, os.path.normpath(expected))
+        
+        # 同一目录在批次内只创建一次
+        for path in paths * 3:
+            mirror.ensure_directory(mirror.get_directory(path))
+        assert mirror.get_statistics()['directories'] == 2
+        assert os.path.isdir(os.path.join(output_dir, 'b', 'c'))
+        print("+ 镜像、哈希前缀和日期目录计算正确")
+    
+    return True
+
+def test_archive_writer():
+    """测试归档输出"""
+    print("\n测试归档输出...")
+    
+    import tarfile
+    import tempfile
+    import zipfile
+    from PIL import Image
+    from archive_writer import ArchiveWriter
+    from watermark_engine import WatermarkEngine
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_path = os.path.join(temp_dir, 'input.png')
+        Image.new('RGB', (64, 48), (10, 20, 30)).save(image_path)
+        data = WatermarkEngine().encode_image(
+            image_path, {'type': 'text', 'text_content': 'Test'}, {'format': 'JPEG', 'jpeg_quality': 80}
+        )
+        assert data and data[:2] == b'\xff\xd8'
+        
+        for archive_format in ('zip', 'tar'):
+            archive_path = os.path.join(temp_dir, f'out.{archive_format}')
+            with ArchiveWriter(archive_path, queue_size=2) as writer:
+                for i in range(10):
+                    writer.write(f'sub/{i}.jpg', data)
+            assert not os.path.exists(archive_path + '.part')
+            assert writer.get_statistics()['files'] == 10
+            
+            if archive_format == 'zip':
+                with zipfile.ZipFile(archive_path) as archive:
+                    assert archive.getinfo('sub/3.jpg').compress_type == zipfile.ZIP_STORED
+                    assert archive.read('sub/9.jpg') == data
+            else:
+                with tarfile.open(archive_path) as archive:
+                    assert archive.extractfile('sub/0.jpg').read() == data
+        print("+ 编码结果直接写入 ZIP/TAR，内容一致")
+    
+    return True
+
+def test_archive_reader():
+    """测试从归档读取图片"""
+    print("\n测试从归档读取图片...")
+    
+    import io
+    import tarfile
+    import tempfile
+    import zipfile
+    from PIL import Image
+    from archive_reader import ArchiveReader, archive_reader, open_image, source_directory, split_member_path
+    from image_manager import ImageManager
+    from output_layout import OutputLayout
+    from utils import generate_output_filename
+    from watermark_engine import WatermarkEngine
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), (200, 0, 0)).save(buffer, 'JPEG')
+    data = buffer.getvalue()
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        zip_path = os.path.join(temp_dir, 'photos.zip')
+        with zipfile.ZipFile(zip_path, 'w') as archive:
+            for i in range(3):
+                archive.writestr(f'day1/{i}.jpg', data)
+            archive.writestr('notes.txt', b'skip')
+        tar_path = os.path.join(temp_dir, 'more.tar.gz')
+        with tarfile.open(tar_path, 'w:gz') as archive:
+            info = tarfile.TarInfo('a/b.jpg')
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        
+        manager = ImageManager()
+        success, error = manager.add_images([zip_path, tar_path])
+        assert (success, error) == (4, 0), (success, error)
+        item = manager.images[0]
+        assert item.file_path == f'{zip_path}::day1/0.jpg'
+        assert item.get_size_text() == '40×30'
+        assert manager.get_duplicate_count() == 3
+        assert generate_output_filename(item.file_path, 'suffix', suffix='_wm') == '0_wm.jpg'
+        
+        # 成员路径用于保持目录结构
+        assert source_directory(item.file_path) == os.path.join(temp_dir, 'photos', 'day1')
+        layout = OutputLayout('out', 'mirror', [img.file_path for img in manager.images])
+        assert layout.get_subdir(manager.images[-1].file_path) == os.path.join('more', 'a')
+        
+        encoded = WatermarkEngine().encode_image(
+            manager.images[-1].file_path, {'type': 'text', 'text_content': 'Test'}, {'format': 'PNG'}
+        )
+        assert encoded and encoded[:4] == b'\x89PNG'
+        archive_reader.close()
+        
+        # 读取 TAR 成员时只向后读到该成员，不加载整个索引；压缩 TAR 只解压一遍
+        for name, mode in (('big.tar', 'w'), ('big.tgz', 'w:gz')):
+            big_path = os.path.join(temp_dir, name)
+            with tarfile.open(big_path, mode) as archive:
+                for i in range(50):
+                    info = tarfile.TarInfo(f'{i}.jpg')
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            reader = ArchiveReader(spool_limit=len(data) * 10)
+            paths = reader.iter_images(big_path)
+            first = next(paths)
+            assert reader.read(first) == data
+            entry = reader._archives[os.path.abspath(big_path)]
+            assert len(entry.archive.members) == 1 and not entry.archive._loaded
+            # 枚举不转存内容，读取时才转存，超出上限后改为重新解压
+            rest = list(paths)
+            assert len(rest) == 49 and len(entry.spooled) == (mode == 'w:gz')
+            assert all(reader.read(path) == data for path in reversed(rest))
+            assert len(entry.spooled) == (10 if mode == 'w:gz' else 0)
+            assert entry.spool_size <= reader.spool_limit
+            assert reader.read(rest[0]) == data
+            reader.close()
+        
+        # 文件名含 "::" 的普通文件不会当作归档成员
+        plain = os.path.join(temp_dir, 'a::b.jpg')
+        with open(plain, 'wb') as f:
+            f.write(data)
+        assert split_member_path(plain) is None and open_image(plain).size == (40, 30)
+        assert split_member_path(f'{zip_path}::day1/0.jpg') == (zip_path, 'day1/0.jpg')
+        assert split_member_path(os.path.join(temp_dir, 'gone.zip::x.jpg')) is None
+        print("+ 归档中的图片按成员路径导入并参与导出")
+    
+    return True
+
+def test_output_writer():
+    """测试原子写入和后台写入"""
+    print("\n测试原子写入和后台写入...")
+    
+    import tempfile
+    from output_writer import OutputWriter, atomic_write
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for durability in ('none', 'batch', 'file'):
+            output_dir = os.path.join(temp_dir, durability)
+            os.makedirs(output_dir)
+            with OutputWriter(durability, workers=2, queue_size=2) as writer:
+                for i in range(20):
+                    writer.submit(os.path.join(output_dir, f'{i}.jpg'), bytes([i]) * 1000,
+                                  [os.path.join(output_dir, f'{i}_copy.jpg')])
+                # 目录不存在时写入失败，不影响其他文件
+                writer.submit(os.path.join(temp_dir, 'missing', 'x.jpg'), b'x')
+            stats = writer.get_statistics()
+            assert stats['files'] == 40 and stats['failed'] == 1
+            assert sorted(os.listdir(output_dir)) == sorted(
+                [f'{i}.jpg' for i in range(20)] + [f'{i}_copy.jpg' for i in range(20)]
+            )
+            with open(os.path.join(output_dir, '7_copy.jpg'), 'rb') as f:
+                assert f.read() == bytes([7]) * 1000
+        
+        # 写入中途出错时不留下目标文件和临时文件
+        target = os.path.join(temp_dir, 'broken.jpg')
+        try:
+            atomic_write(target, None)
+        except TypeError:
+            pass
+        assert not any(name.startswith('.broken.jpg') or name == 'broken.jpg' for name in os.listdir(temp_dir))
+        print("+ 各落盘策略下写入完整，失败时没有残留文件")
+    
+    return True
+
+def test_memory_api():
+    """测试内存接口"""
+    print("\n测试内存接口...")
+    
+    import io
+    from PIL import Image
+    from watermark_engine import WatermarkEngine
+    
+    engine = WatermarkEngine()
+    watermark_config = {'type': 'text', 'text_content': 'Test', 'font_size': 20, 'opacity': 100}
+    source = Image.new('RGB', (120, 90), (0, 0, 255))
+    buffer = io.BytesIO()
+    source.save(buffer, 'PNG')
+    data = buffer.getvalue()
+    
+    expected = engine.encode(source, watermark_config, {'format': 'PNG'})
+    assert expected[:4] == b'\x89PNG'
+    # 各种来源得到相同的输出
+    for item in (data, bytearray(data), memoryview(data), io.BytesIO(data)):
+        assert engine.encode(item, watermark_config, {'format': 'PNG'}) == expected
+    
+    result = engine.watermark(data, watermark_config, {'format': 'JPEG'})
+    assert result.mode == 'RGB' and result.size == (120, 90)
+    # 传入的 PIL 图片不被修改
+    assert engine.watermark(source, watermark_config) is not source
+    assert source.getpixel((110, 80)) == (0, 0, 255)
+    assert engine.encode(b'not an image', watermark_config, {'format': 'PNG'}) is None
+    print("+ bytes/缓冲区/文件对象/PIL 图片输入结果一致")
+    
+    return True
+
+def test_array_api():
+    """测试数组接口"""
+    print("\n测试数组接口...")
+    
+    try:
+        import numpy as np
+    except ImportError:
+        print("- 未安装 numpy，跳过数组接口测试")
+        return True
+    from PIL import Image
+    from watermark_engine import WatermarkEngine
+    from watermark_geometry import WatermarkGeometry
+    
+    engine = WatermarkEngine()
+    rng = np.random.default_rng(0)
+    for mode, channels in (('RGB', 3), ('RGBA', 4)):
+        watermark_config = {'type': 'text', 'text_content': 'Test', 'font_size': 30,
+                            'opacity': 70, 'rotation': 30, 'position_preset': 'center'}
+        frame = rng.integers(0, 256, (120, 160, channels), dtype=np.uint8)
+        image = Image.fromarray(frame, mode)
+        watermark, watermark_size = engine.prepare_watermark(watermark_config)
+        geometry = WatermarkGeometry.from_config(image.size, watermark_size, watermark_config)
+        expected = np.asarray(engine.paste_watermark(image, watermark, geometry.position))
+        
+        # 写入调用方提供的数组，输入不变；结果与 PIL 合成逐像素一致
+        out = np.empty_like(frame)
+        assert engine.watermark_array(frame, watermark_config, out) is out
+        assert np.array_equal(out, expected)
+        assert np.array_equal(np.asarray(image), frame)
+        
+        # 批量原地合成
+        batch = np.stack([frame] * 3)
+        prepared = engine.prepare_array_watermark(watermark_config)
+        engine.watermark_array(batch, prepared)
+        assert all(np.array_equal(item, expected) for item in batch)
+    print("+ 单帧/批量数组合成与 PIL 结果一致")
+    
+    return True
+
+def test_watermark_server():
+    """测试本机水印服务"""
+    print("\n测试本机水印服务...")
+    
+    import io
+    import json
+    import socket
+    import tempfile
+    import urllib.error
+    import urllib.request
+    from urllib.parse import quote
+    from PIL import Image
+    from watermark_server import WatermarkServer, _exit_worker
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (10, 20, 30)).save(buffer, 'JPEG')
+    data = buffer.getvalue()
+    
+    def post(server, body, headers=None, query=''):
+        request = urllib.request.Request(server.url + '/watermark' + query, data=body,
+                                         headers=headers or {}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.headers['Content-Type'], response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Retry-After'), e.read()
+    
+    with tempfile.TemporaryDirectory() as templates_dir:
+        with open(os.path.join(templates_dir, 'logo.json'), 'w', encoding='utf-8') as f:
+            json.dump({'name': '角标', 'watermark_config': {'type': 'text', 'text_content': 'A'},
+                       'export_config': {'format': 'PNG'}}, f, ensure_ascii=False)
+        
+        server = WatermarkServer(port=0, workers=1, max_pending=1, max_bytes=100000,
+                                 templates_dir=templates_dir)
+        server.start()
+        try:
+            assert server.url.startswith('http://127.0.0.1:')
+            inline = json.dumps({'watermark_config': {'type': 'text', 'text_content': 'Test'},
+                                 'export_config': {'format': 'JPEG'}})
+            status, content_type, body = post(server, data, {'X-Watermark-Config': inline})
+            assert (status, content_type) == (200, 'image/jpeg')
+            assert Image.open(io.BytesIO(body)).size == (64, 48)
+            
+            # 按模板名称处理，模板解析结果被缓存
+            for _ in range(2):
+                status, content_type, body = post(server, data, query='?template=' + quote('角标'))
+                assert (status, content_type) == (200, 'image/png') and body[:4] == b'\x89PNG'
+            assert server.templates.loads == 1 and server.templates.hits == 1
+            
+            assert post(server, data, query='?template=missing')[0] == 400
+            assert post(server, b'not an image', {'X-Watermark-Config': inline})[0] == 422
+            
+            # 超过大小上限时不读取请求体
+            host, port = server.httpd.server_address[:2]
+            with socket.create_connection((host, port)) as sock:
+                sock.sendall(b'POST /watermark HTTP/1.1\r\nHost: localhost\r\n'
+                             b'Content-Length: 200000\r\nExpect: 100-continue\r\n\r\n')
+                assert sock.recv(64).startswith(b'HTTP/1.1 413')
+            
+            # 排队已满时返回 503
+            server._slots.acquire()
+            status, retry_after, _ = post(server, data, {'X-Watermark-Config': inline})
+            server._slots.release()
+            assert (status, retry_after) == (503, '1')
+            
+            with urllib.request.urlopen(server.url + '/stats', timeout=10) as response:
+                stats = json.loads(response.read())
+            assert stats['completed'] == 3 and stats['rejected_busy'] == 1
+            assert stats['rejected_size'] == 1 and stats['failed'] == 1
+            
+            # 工作进程意外退出：当次请求返回 503，进程池重建后恢复正常
+            server.process_func = _exit_worker
+            status, retry_after, _ = post(server, data, {'X-Watermark-Config': inline})
+            del server.process_func
+            assert (status, retry_after) == (503, '1')
+            assert post(server, data, {'X-Watermark-Config': inline})[0] == 200
+            assert server.get_statistics()['pool_restarts'] == 1
+        finally:
+            server.stop()
+        print("+ 上传处理、模板缓存、大小限制、背压和进程池恢复正常")
+    
+    return True
+
+def test_async_engine():
+    """测试异步批处理接口"""
+    print("\n测试异步批处理接口...")
+    
+    import asyncio
+    import io
+    import tempfile
+    import threading
+    import time
+    from PIL import Image
+    from async_engine import AsyncWatermarkEngine
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (10, 20, 30)).save(buffer, 'JPEG')
+    data = buffer.getvalue()
+    watermark_config = {'type': 'text', 'text_content': 'Test'}
+    
+    async def run(output_dir):
+        state = {'pulled': 0, 'done': 0, 'in_flight': 0}
+        
+        async def jobs():
+            for i in range(6):
+                state['pulled'] += 1
+                state['in_flight'] = max(state['in_flight'], state['pulled'] - state['done'])
+                yield {'source': data, 'output_path': os.path.join(output_dir, f'{i}.jpg')}
+        
+        async with AsyncWatermarkEngine(max_concurrency=2, watermark_config=watermark_config,
+                                        export_config={'format': 'JPEG'}) as engine:
+            async for result in engine.process_many(jobs()):
+                state['done'] += 1
+                assert result['ok'] and os.path.exists(result['result'])
+            # 按需读取任务，同时执行的任务不超过并发上限
+            assert state['done'] == 6 and state['in_flight'] <= 2
+            
+            results = [r async for r in engine.process_many([{'source': b'bad'}, {'source': data}])]
+            assert sorted(r['ok'] for r in results) == [False, True]
+            results = [r async for r in engine.process_many([{'source': data}], timeout=0)]
+            assert results[0]['error'] == 'timeout'
+            
+            # 提前结束迭代时取消剩余任务
+            results = engine.process_many([{'source': data}] * 20)
+            assert (await results.__anext__())['ok']
+            await results.aclose()
+    
+    async def close_without_blocking():
+        # 关闭时仍有超时任务在执行，事件循环中的其他任务照常运行
+        release = threading.Event()
+        engine = AsyncWatermarkEngine(max_concurrency=1)
+        engine.executor.submit(release.wait, 5)
+        ticks = []
+        
+        async def ticker():
+            while not release.is_set():
+                ticks.append(1)
+                if len(ticks) == 3:
+                    release.set()
+                await asyncio.sleep(0.01)
+        
+        start = time.perf_counter()
+        await asyncio.gather(engine.aclose(), ticker())
+        # 阻塞事件循环时只能等任务自己超时（5 秒）才会结束
+        assert len(ticks) >= 3 and time.perf_counter() - start < 2
+    
+    with tempfile.TemporaryDirectory() as output_dir:
+        asyncio.run(run(output_dir))
+    asyncio.run(close_without_blocking())
+    print("+ 并发上限、完成顺序产出、超时和取消正常，关闭不阻塞事件循环")
+    
+    return True
+
+def test_job_queue():
+    """测试持久化任务队列"""
+    print("\n测试持久化任务队列...")
+    
+    import tempfile
+    from PIL import Image
+    from job_queue import JobQueue
+    
+    watermark_config = {'type': 'text', 'text_content': 'Test'}
+    export_config = {'format': 'PNG'}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'jobs.db')
+        inputs = []
+        for i in range(3):
+            path = os.path.join(temp_dir, f'in{i}.png')
+            Image.new('RGB', (40, 30), (i, i, i)).save(path)
+            inputs.append(path)
+        missing = os.path.join(temp_dir, 'missing.png')
+        
+        with JobQueue(db_path, max_attempts=2, retry_delay=0.01) as queue:
+            ids = queue.enqueue_many([(path, watermark_config, export_config, path + '.out.png')
+                                      for path in inputs + [missing]])
+            # 相同任务不重复入队
+            assert queue.enqueue(inputs[0], watermark_config, export_config, inputs[0] + '.out.png') == ids[0]
+            
+            # 模拟崩溃：领取后未提交结果
+            crashed = queue.claim()
+            assert crashed['id'] == ids[0] and crashed['watermark_config'] == watermark_config
+        
+        with JobQueue(db_path, max_attempts=2, retry_delay=0.01) as queue:
+            assert queue.get_statistics()['running'] == 1
+            assert queue.requeue_running() == 1
+            # 旧的领取凭证失效
+            assert not queue.complete(crashed)
+            
+            stats = queue.run(workers=3)
+            assert stats == {'done': 3, 'failed': 2}
+            counts = queue.get_statistics()
+            assert counts['done'] == 3 and counts['failed'] == 1 and counts['total'] == 4
+            failed = queue.get_jobs('failed')
+            assert failed[0]['input'] == missing and failed[0]['attempts'] == 2
+            mtime = os.path.getmtime(inputs[1] + '.out.png')
+        
+        # 重启后不重做已完成的任务
+        with JobQueue(db_path, max_attempts=2, retry_delay=0.01) as queue:
+            assert queue.run() == {'done': 0, 'failed': 0}
+            assert os.path.getmtime(inputs[1] + '.out.png') == mtime
+            # 重试失败任务时清除上次的错误信息
+            assert queue.retry_failed() == 1
+            retried = queue.get_jobs('pending')
+            assert retried[0]['input'] == missing and retried[0]['error'] is None
+    print("+ 去重入队、原子领取、退避重试和崩溃恢复正常")
+    
+    return True
+
+def test_tile_pyramid():
+    """测试分块查看金字塔"""
+    print("\n测试分块查看金字塔...")
+    
+    import tempfile
+    from PIL import Image
+    from image_cache import ImageCache
+    from preview_renderer import PreviewRenderer
+    from tile_viewer import TilePyramid
+    from watermark_engine import WatermarkEngine
+    
+    watermark_config = {'type': 'text', 'text_content': 'Test', 'font_size': 40,
+                        'opacity': 100, 'position_preset': 'center'}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'big.png')
+        Image.new('RGB', (1000, 600), (0, 0, 255)).save(path)
+        renderer = PreviewRenderer(WatermarkEngine())
+        pyramid = TilePyramid(path, renderer, watermark_config, ImageCache(), tile_size=256)
+        
+        # 每层宽高减半，直到整张图放进一个图块
+        assert pyramid.level_count == 3
+        assert [pyramid.get_level_size(level) for level in range(3)] == [(1000, 600), (500, 300), (250, 150)]
+        assert [pyramid.level_for_zoom(zoom) for zoom in (1.0, 0.6, 0.5, 0.3, 0.25, 0.1)] == [0, 0, 1, 1, 2, 2]
+        
+        # 图块范围和视口相交的图块
+        assert pyramid.get_grid(0) == (4, 3) and pyramid.get_grid(2) == (1, 1)
+        assert pyramid.get_tile_box(0, 3, 2) == (768, 512, 1000, 600)
+        assert pyramid.visible_tiles(0, (300, 0, 600, 300)) == [(1, 0), (2, 0), (1, 1), (2, 1)]
+        assert pyramid.visible_tiles(1, (-256, -256, 10000, 10000)) == [(0, 0), (1, 0), (0, 1), (1, 1)]
+        
+        # 各层底图放在受内存上限约束的缓存中
+        tiles = dict(pyramid.iter_tiles(1, pyramid.visible_tiles(1, (0, 0, 500, 300))))
+        assert tiles[(1, 1)].size == (244, 44)
+        assert ('tile_level', path, 1) in pyramid.cache
+        # 水印所在的图块叠加了水印，角落图块保持原色
+        x, y = pyramid._get_watermark(1)[1]
+        assert len(tiles[(x // 256, y // 256)].getcolors(256 * 256)) > 1
+        assert tiles[(0, 1)].getcolors(256 * 256) == [(256 * 44, (0, 0, 255))]
+        
+        small_cache = ImageCache(max_bytes=600 * 1024)
+        pyramid = TilePyramid(path, renderer, watermark_config, small_cache, tile_size=256)
+        tiles = list(pyramid.iter_tiles(0, pyramid.visible_tiles(0, (0, 0, 1000, 600))))
+        assert len(tiles) == 12
+        assert ('tile_level', path, 0) not in small_cache
+        assert small_cache.get_statistics()['bytes'] <= small_cache.max_bytes
+        
+        # 取消后不再渲染后续图块
+        assert list(pyramid.iter_tiles(0, [(0, 0), (1, 0)], lambda: True)) == []
+    print("+ 层尺寸、缩放选层、图块范围和缓存上限正确")
+    
+    return True
+
+def test_preview_worker():
+    """测试预览工作线程"""
+    print("\n测试预览工作线程...")
+    
+    import threading
+    from preview_renderer import RenderCancelled
+    from preview_worker import PreviewWorker
+    
+    started = threading.Event()
+    release = threading.Event()
+    finished = threading.Event()
+    rendered = []
+    delivered = []
+    
+    def render(request, is_cancelled):
+        rendered.append(request)
+        if request == 'first':
+            started.set()
+            release.wait(5)
+            # 耗时阶段之间检查是否已被新请求取代
+            if is_cancelled():
+                raise RenderCancelled()
+        return request.upper()
+    
+    def on_result(generation, result, error):
+        delivered.append((generation, result, error))
+        finished.set()
+    
+    worker = PreviewWorker(render, on_result)
+    try:
+        worker.submit('first')
+        assert started.wait(5)
+        # 渲染进行中连续提交，只有最新的请求会被渲染
+        for request in ('second', 'third', 'latest'):
+            generation = worker.submit(request)
+        release.set()
+        assert finished.wait(5)
+        assert rendered == ['first', 'latest']
+        assert delivered == [(generation, 'LATEST', None)]
+        assert worker.is_current(generation) and not worker.is_current(generation - 1)
+        assert worker.stats['coalesced'] == 2 and worker.stats['cancelled'] == 1
+        assert worker.stats['rendered'] == 1
+    finally:
+        worker.stop()
+    print("+ 只渲染最新请求，被取代的渲染协作式取消")
+    
+    return True
+
+def test_progressive_preview():
+    """测试渐进预览"""
+    print("\n测试渐进预览...")
+    
+    import tempfile
+    import threading
+    from PIL import Image
+    from preview_renderer import PreviewRenderer
+    from preview_worker import PreviewWorker
+    from watermark_engine import WatermarkEngine
+    
+    watermark_config = {'type': 'text', 'text_content': 'Test', 'font_size': 40, 'opacity': 100}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'photo.png')
+        Image.new('RGB', (1600, 1200), (0, 0, 255)).save(path)
+        # 草稿来源（如缩略图）只有 40x30，且颜色与原图不同以便区分
+        draft_requests = []
+        
+        def draft_source(file_path):
+            draft_requests.append(file_path)
+            return Image.new('RGB', (40, 30), (255, 0, 0))
+        
+        renderer = PreviewRenderer(WatermarkEngine(), draft_source=draft_source)
+        frames = list(renderer.render_progressive(path, watermark_config, (400, 400), (1600, 1200)))
+        assert [frame['is_draft'] for frame in frames] == [True, False]
+        draft, sharp = frames
+        # 草稿由低分辨率图放大到与清晰帧相同的显示尺寸
+        assert draft_requests == [path]
+        assert draft['image'].size == sharp['image'].size == (400, 300)
+        assert draft['base'].getpixel((0, 0)) == (255, 0, 0)
+        assert sharp['base'].getpixel((0, 0)) == (0, 0, 255)
+        assert draft['scale'] == sharp['scale'] == 0.25
+        # 底图已缓存后只产出清晰帧
+        frames = list(renderer.render_progressive(path, watermark_config, (400, 400), (1600, 1200)))
+        assert [frame['is_draft'] for frame in frames] == [False]
+        
+        # 草稿投递后有新请求时，清晰帧被取消
+        renderer = PreviewRenderer(WatermarkEngine(), draft_source=draft_source)
+        delivered = []
+        done = threading.Event()
+        
+        def render(request, is_cancelled):
+            return renderer.render_progressive(path, watermark_config, request, (1600, 1200), is_cancelled)
+        
+        def on_result(generation, result, error):
+            delivered.append((generation, result['is_draft'], result['image'].size))
+            if generation == 1:
+                worker.submit((200, 200))
+            elif not result['is_draft']:
+                done.set()
+        
+        worker = PreviewWorker(render, on_result)
+        try:
+            worker.submit((400, 400))
+            assert done.wait(5)
+            assert delivered == [(1, True, (400, 300)), (2, True, (200, 150)), (2, False, (200, 150))]
+            assert worker.stats['cancelled'] == 1
+            assert not renderer.is_cached(path, (400, 400))
+        finally:
+            worker.stop()
+    print("+ 先草稿后清晰，新请求取消未完成的清晰帧")
+    
+    return True
+
+def test_preview_scaling():
+    """测试预览分辨率合成"""
+    print("\n测试预览分辨率合成...")
+    
+    import tempfile
+    from PIL import Image, ImageChops
+    from preview_renderer import PreviewRenderer, scale_watermark_config
+    from watermark_engine import WatermarkEngine
+    from watermark_geometry import WatermarkGeometry
+    
+    # 未给出的像素参数按默认值缩放
+    config = scale_watermark_config({'type': 'text', 'scale': 0.8}, 0.5)
+    assert (config['font_size'], config['offset_x'], config['offset_y'], config['padding']) == (12, 10, 10, 5)
+    assert config['scale'] == 0.4
+    
+    background = (0, 0, 255)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'photo.png')
+        Image.new('RGB', (1600, 1200), background).save(path)
+        logo_path = os.path.join(temp_dir, 'logo.png')
+        Image.new('RGBA', (200, 100), (255, 0, 0, 255)).save(logo_path)
+        
+        placement = {'position_preset': 'bottom_right', 'offset_x': 100, 'offset_y': 60,
+                     'padding': 40, 'opacity': 100, 'rotation': 30}
+        configs = [
+            dict(placement, type='text', text_content='Watermark', font_size=120, color='#FFFFFF'),
+            dict(placement, type='image', image_path=logo_path, scale=0.8)
+        ]
+        engine = WatermarkEngine()
+        renderer = PreviewRenderer(engine)
+        for watermark_config in configs:
+            frame = renderer.render(path, watermark_config, (400, 400))
+            assert frame['scale'] == 0.25 and frame['image'].size == (400, 300)
+            
+            # 预览中的水印范围与原图合成结果缩小后一致
+            _, watermark_size = engine.prepare_watermark(watermark_config)
+            full_rect = WatermarkGeometry.from_config((1600, 1200), watermark_size, watermark_config).rect
+            expected_rect = [value * 0.25 for value in full_rect]
+            assert all(abs(a - b) <= 3 for a, b in zip(frame['watermark_rect'], expected_rect)), \
+                (frame['watermark_rect'], expected_rect)
+            
+            full = engine.watermark(path, watermark_config)
+            reduced = full.resize((400, 300), Image.Resampling.LANCZOS)
+            solid = Image.new('RGB', (400, 300), background)
+            # 忽略缩小时的轻微振铃，只比较明显不同于背景的区域
+            expected_box = ImageChops.difference(reduced, solid).convert('L').point(lambda v: 255 if v > 64 else 0).getbbox()
+            preview_box = ImageChops.difference(frame['image'], solid).convert('L').point(lambda v: 255 if v > 64 else 0).getbbox()
+            assert all(abs(a - b) <= 4 for a, b in zip(preview_box, expected_box)), (preview_box, expected_box)
+    print("+ 字号、偏移、边距和图片缩放按预览比例缩放")
+    
+    return True
+
+def test_layer_drag():
+    """测试拖拽时移动水印图层"""
+    print("\n测试拖拽水印图层...")
+    
+    import tempfile
+    from PIL import Image, ImageChops
+    from preview_renderer import DRAG_OFFSET_LIMIT, PreviewRenderer, drag_offset
+    from watermark_engine import WatermarkEngine
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'photo.png')
+        Image.new('RGB', (400, 300), (0, 0, 255)).save(path)
+        logo_path = os.path.join(temp_dir, 'logo.png')
+        Image.new('RGBA', (40, 20), (255, 0, 0, 255)).save(logo_path)
+        watermark_config = {'type': 'image', 'image_path': logo_path, 'scale': 1.0, 'opacity': 100,
+                            'position_preset': 'top_left', 'offset_x': 20, 'offset_y': 20, 'padding': 10}
+        
+        engine = WatermarkEngine()
+        renderer = PreviewRenderer(engine)
+        frame = renderer.render(path, watermark_config, (200, 150))
+        assert frame['scale'] == 0.5
+        
+        # 画布上拖动 (40, 20)，原图偏移增加 (80, 40)，水印图层移动同样的距离
+        offset = drag_offset((20, 20), (50, 50), (90, 70), frame['scale'])
+        assert offset == (100, 60)
+        start_x, start_y = frame['geometry'].position
+        moved = renderer.place_watermark(frame, *offset)
+        assert moved.position == (start_x + 40, start_y + 20)
+        
+        # 拖出很远时偏移被限制，水印仍留在图片内
+        far = drag_offset((20, 20), (50, 50), (5000, -5000), frame['scale'])
+        assert far == (DRAG_OFFSET_LIMIT, -DRAG_OFFSET_LIMIT)
+        x, y, w, h = renderer.place_watermark(frame, *far).rect
+        assert 0 <= x and x + w <= 200 and 0 <= y and y + h <= 150
+        
+        # 松开后的完整渲染与引擎按新偏移合成的结果一致
+        dropped = dict(watermark_config, offset_x=offset[0], offset_y=offset[1])
+        assert renderer.render(path, dropped, (200, 150))['geometry'].position == moved.position
+        final = renderer.render(path, dropped, (400, 300))
+        expected = engine.watermark(path, dropped).convert('RGB')
+        assert ImageChops.difference(final['image'], expected).getbbox() is None
+        assert final['geometry'].position == (100, 60)
+    print("+ 拖拽位移、边界限制和最终渲染正确")
+    
+    return True
+
+def test_preview_stats():
+    """测试预览性能统计"""
+    print("\n测试预览性能统计...")
+    
+    import json
+    import tempfile
+    from preview_stats import PreviewStats, build_histogram, percentile
+    
+    # 最近秩百分位数
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50 and percentile(values, 95) == 95
+    assert percentile(values, 99) == 99 and percentile(values, 100) == 100
+    assert percentile([7, 1, 3], 50) == 3 and percentile([5], 1) == 5
+    assert percentile([], 95) == 0.0
+    
+    # 等于上限的值落入该桶，超过最后一个上限的值落入无上限的桶
+    histogram = build_histogram([4, 4.5, 8, 1000, 1000.5, 5000], (4, 8, 1000))
+    assert histogram == [{'le': 4, 'count': 1}, {'le': 8, 'count': 2},
+                         {'le': 1000, 'count': 1}, {'le': None, 'count': 2}]
+    
+    # 滚动窗口只保留最近 window 帧，总帧数继续累计
+    stats = PreviewStats(window=4)
+    for i in range(1, 7):
+        stats.record_frame(i / 1000, {'decode': i / 2000, 'render': i / 2000}, 'draft' if i == 6 else 'frame')
+    stats.record_dropped(2)
+    assert [round(value) for value in stats.get_latencies()] == [3, 4, 5, 6]
+    assert [round(value) for value in stats.get_latencies(['draft'])] == [6]
+    summary = stats.summary()
+    assert summary['window'] == 4 and summary['total_frames'] == 6 and summary['dropped_frames'] == 2
+    assert summary['kinds'] == {'frame': 3, 'draft': 1}
+    assert round(summary['latency']['p50']) == 4 and round(summary['latency']['max']) == 6
+    assert round(summary['stages']['decode']['max'], 1) == 3.0 and 'convert' not in summary['stages']
+    assert sum(bucket['count'] for bucket in summary['histogram']) == 4
+    
+    # JSON 导出可以读回
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'stats.json')
+        stats.dump_json(path, {'label': 'test'})
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    assert data['label'] == 'test' and data['summary'] == summary
+    assert data['histogram_bounds_ms'] == [bucket['le'] for bucket in summary['histogram'][:-1]]
+    print("+ 百分位数、直方图分桶、滚动窗口和 JSON 导出正确")
+    
+    return True
+
+def test_display_surface():
+    """测试复用 PhotoImage 的显示表面"""
+    print("\n测试显示表面...")
+    
+    import tkinter as tk
+    from PIL import Image
+    from display_surface import DisplaySurface
+    
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print("- 没有图形显示环境，跳过")
+        return True
+    try:
+        surface = DisplaySurface(max_surfaces=2)
+        first = surface.update(Image.new('RGB', (64, 48), (255, 0, 0)))
+        # 同尺寸的新帧粘贴到已有的 PhotoImage 中
+        second = surface.update(Image.new('RGB', (64, 48), (0, 255, 0)))
+        assert second is first and (surface.created, surface.reused) == (1, 1)
+        assert surface.get((64, 48)) is first
+        
+        # 超过 max_surfaces 时淘汰最久未使用的尺寸
+        other = surface.update(Image.new('RGB', (32, 32)))
+        surface.update(Image.new('RGB', (64, 48)))
+        surface.update(Image.new('RGB', (16, 16)))
+        assert surface.created == 3 and surface.reused == 2
+        assert surface.get((32, 32)) is None and surface.get((64, 48)) is first
+        assert surface.get((16, 16)) is not None and other is not first
+        surface.clear()
+    finally:
+        root.destroy()
+    print("+ 同尺寸帧复用 PhotoImage，新尺寸淘汰最久未用的表面")
+    
+    return True
+
+def test_preview_prefetcher():
+    """测试预取相邻图片的预览底图"""
+    print("\n测试预览预取...")
+    
+    import tempfile
+    import threading
+    import time
+    from PIL import Image
+    from image_list_model import ImageListModel
+    from image_manager import ImageManager
+    from preview_renderer import PreviewRenderer
+    from preview_worker import PreviewPrefetcher
+    from watermark_engine import WatermarkEngine
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = []
+        for i in range(8):
+            path = os.path.join(temp_dir, f'{i}.png')
+            Image.new('RGB', (80, 60), (i * 30, 0, 0)).save(path)
+            paths.append(path)
+        manager = ImageManager()
+        model = ImageListModel(manager)
+        manager.add_images(paths)
+        renderer = PreviewRenderer(WatermarkEngine(), manager.image_cache)
+        max_size = (40, 40)
+        
+        def neighbor_paths(row, count):
+            return [manager.get_item(item_id).file_path
+                    for item_id in model.get_neighbors(model.get_id(row), count)]
+        
+        # 第一个预取被挡住，期间切换当前图片
+        started = threading.Event()
+        release = threading.Event()
+        loaded = []
+        def load(file_path, size):
+            loaded.append(file_path)
+            if len(loaded) == 1:
+                started.set()
+                release.wait(5)
+            return renderer.get_base(file_path, size)
+        
+        prefetcher = PreviewPrefetcher(load, renderer.is_cached)
+        try:
+            stale = neighbor_paths(3, 2)
+            assert stale == [paths[4], paths[2], paths[5], paths[1]]
+            prefetcher.submit(stale, max_size)
+            assert started.wait(5)
+            current = neighbor_paths(6, 1)
+            prefetcher.submit(current, max_size)
+            release.set()
+            
+            deadline = time.time() + 5
+            while prefetcher.stats['loaded'] < 3 and time.time() < deadline:
+                time.sleep(0.01)
+            # 正在解码的一张完成，旧列表中其余的被放弃，新的相邻图片进入共享缓存
+            assert loaded == [paths[4], paths[7], paths[5]], loaded
+            assert all(renderer.is_cached(path, max_size) for path in [paths[4]] + current)
+            assert not renderer.is_cached(paths[2], max_size) and not renderer.is_cached(paths[1], max_size)
+            assert ('preview', paths[7], max_size) in manager.image_cache
+            
+            # 已缓存的图片不再解码
+            prefetcher.submit(current, max_size)
+            deadline = time.time() + 5
+            while prefetcher.stats['skipped'] < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            assert prefetcher.stats['skipped'] == 2 and len(loaded) == 3
+        finally:
+            prefetcher.stop()
+    print("+ 预取相邻图片并放弃过期的预取")
+    
+    return True
+
 def main():
     """主测试函数"""
     print("=" * 50)
@@ -164,6 +1303,98 @@ def main():
     if not test_config():
         all_passed = False
     
+    # 测试缩略图存储
+    if not test_thumbnail_store():
+        all_passed = False
+    
+    # 测试批量删除
+    if not test_batch_remove():
+        all_passed = False
+    
+    # 测试图片列表模型
+    if not test_image_list_model():
+        all_passed = False
+    
+    # 测试内容去重
+    if not test_dedupe_groups():
+        all_passed = False
+    
+    # 测试水印几何
+    if not test_watermark_geometry():
+        all_passed = False
+    
+    # 测试输出文件名分配
+    if not test_output_naming():
+        all_passed = False
+    
+    # 测试输出目录结构
+    if not test_output_layout():
+        all_passed = False
+    
+    # 测试归档输出
+    if not test_archive_writer():
+        all_passed = False
+    
+    # 测试从归档读取图片
+    if not test_archive_reader():
+        all_passed = False
+    
+    # 测试预览分辨率合成
+    if not test_preview_scaling():
+        all_passed = False
+    
+    # 测试拖拽水印图层
+    if not test_layer_drag():
+        all_passed = False
+    
+    # 测试预览性能统计
+    if not test_preview_stats():
+        all_passed = False
+    
+    # 测试显示表面
+    if not test_display_surface():
+        all_passed = False
+    
+    # 测试预览工作线程
+    if not test_preview_worker():
+        all_passed = False
+    
+    # 测试预览预取
+    if not test_preview_prefetcher():
+        all_passed = False
+    
+    # 测试渐进预览
+    if not test_progressive_preview():
+        all_passed = False
+    
+    # 测试分块查看金字塔
+    if not test_tile_pyramid():
+        all_passed = False
+    
+    # 测试原子写入和后台写入
+    if not test_output_writer():
+        all_passed = False
+    
+    # 测试内存接口
+    if not test_memory_api():
+        all_passed = False
+    
+    # 测试数组接口
+    if not test_array_api():
+        all_passed = False
+    
+    # 测试本机水印服务
+    if not test_watermark_server():
+        all_passed = False
+    
+    # 测试异步批处理接口
+    if not test_async_engine():
+        all_passed = False
+    
+    # 测试持久化任务队列
+    if not test_job_queue():
+        all_passed = False
+    
     print("\n" + "=" * 50)
     if all_passed:
         print("+ 所有测试通过！应用可以正常运行。")
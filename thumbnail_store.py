@@ -0,0 +1,204 @@
+"""
+缩略图存储模块 - 压缩保存缩略图，按需解码
+"""
+
+import io
+import threading
+from typing import Dict, Optional, Set, Tuple
+from PIL import Image
+from image_cache import ImageCache
+from utils import create_thumbnail
+
+
+class ThumbnailStore:
+    """缩略图存储类
+
+    缩略图以压缩字节保存，解码后的图片放在有内存上限的 LRU 缓存中，
+    只有实际显示的缩略图才会占用解码内存。修改尺寸后由后台线程逐步重建。
+    """
+
+    def __init__(self, size: Tuple[int, int] = (120, 120), max_decoded_bytes: int = 32 * 1024 * 1024,
+                 cache: Optional[ImageCache] = None):
+        self.size = size
+        self.cache = cache if cache is not None else ImageCache(max_decoded_bytes)
+        # key -> (生成时的尺寸, 压缩数据)
+        self._encoded: Dict[str, Tuple[Tuple[int, int], bytes]] = {}
+        self._sources: Dict[str, str] = {}
+        self._stale: Set[str] = set()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def add(self, key: str, source_path: str, size: Optional[Tuple[int, int]] = None) -> bool:
+        """生成并保存缩略图，size 默认为当前尺寸（其他尺寸的缩略图在 get() 时按当前尺寸重建）"""
+        with self._lock:
+            self._sources[key] = source_path
+            if size is None:
+                size = self.size
+        data = self._render(source_path, size)
+        if data is None:
+            return False
+        with self._lock:
+            if key in self._sources:
+                self._encoded[key] = (size, data)
+                if size == self.size:
+                    self._stale.discard(key)
+        return True
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """获取解码后的缩略图（按需解码）"""
+        size = self.size
+        cache_key = ('thumb', key, size)
+        image = self.cache.get(cache_key)
+        if image is not None:
+            return image
+
+        with self._lock:
+            entry = self._encoded.get(key)
+            source_path = self._sources.get(key)
+        # 尺寸已变更但后台尚未重建，优先重建当前需要显示的项
+        if (entry is None or entry[0] != size) and source_path:
+            self.add(key, source_path)
+            with self._lock:
+                entry = self._encoded.get(key)
+        if entry is None or entry[0] != size:
+            return None
+        data = entry[1]
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img.load()
+                image = img.copy()
+        except Exception as e:
+            print(f"解码缩略图失败 {key}: {e}")
+            return None
+
+        self.cache.put(cache_key, image)
+        return image
+
+    def peek(self, key: str) -> Optional[Image.Image]:
+        """获取已有的缩略图（尺寸可能不是当前尺寸），不会触发重新生成"""
+        image = self.cache.get(('thumb', key, self.size))
+        if image is not None:
+            return image
+        with self._lock:
+            entry = self._encoded.get(key)
+        if entry is None:
+            return None
+        try:
+            with Image.open(io.BytesIO(entry[1])) as img:
+                img.load()
+                return img.copy()
+        except Exception:
+            return None
+
+    def remove(self, key: str):
+        """移除缩略图"""
+        with self._lock:
+            self._encoded.pop(key, None)
+            self._sources.pop(key, None)
+            self._stale.discard(key)
+        self.cache.discard_where(lambda k: k[0] == 'thumb' and k[1] == key)
+
+    def remove_many(self, keys):
+        """批量移除缩略图"""
+        keys = set(keys)
+        with self._lock:
+            for key in keys:
+                self._encoded.pop(key, None)
+                self._sources.pop(key, None)
+            self._stale -= keys
+        self.cache.discard_where(lambda k: k[0] == 'thumb' and k[1] in keys)
+
+    def clear(self):
+        """清空所有缩略图"""
+        with self._lock:
+            self._encoded.clear()
+            self._sources.clear()
+            self._stale.clear()
+            self._generation += 1
+        self.cache.discard_where(lambda k: k[0] == 'thumb')
+
+    def set_size(self, size: Tuple[int, int]):
+        """修改缩略图尺寸，旧缩略图在后台逐步重建"""
+        with self._lock:
+            if size == self.size:
+                return
+            old_size = self.size
+            self.size = size
+            self._generation += 1
+            self._stale = set(self._sources)
+            start_worker = bool(self._stale) and (self._worker is None or not self._worker.is_alive())
+            if start_worker:
+                self._idle.clear()
+                self._worker = threading.Thread(target=self._regenerate_loop, daemon=True)
+        self.cache.discard_where(lambda k: k[0] == 'thumb' and k[2] == old_size)
+        if start_worker:
+            self._worker.start()
+
+    def set_memory_limit(self, max_bytes: int):
+        """设置解码缓存的内存上限"""
+        self.cache.set_max_bytes(max_bytes)
+
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """等待后台重建完成"""
+        return self._idle.wait(timeout)
+
+    def get_encoded_bytes(self) -> int:
+        """获取压缩缩略图占用的总字节数"""
+        with self._lock:
+            return sum(len(data) for _, data in self._encoded.values())
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._encoded
+
+    def __len__(self) -> int:
+        return len(self._encoded)
+
+    def _regenerate_loop(self):
+        """后台重建过期缩略图"""
+        while True:
+            with self._lock:
+                if not self._stale:
+                    self._idle.set()
+                    self._worker = None
+                    return
+                key = self._stale.pop()
+                source_path = self._sources.get(key)
+                generation = self._generation
+                size = self.size
+            if not source_path:
+                continue
+
+            data = self._render(source_path, size)
+            with self._lock:
+                # 期间尺寸再次变更或该项已被移除则丢弃结果
+                if generation != self._generation or key not in self._sources:
+                    continue
+                if data is not None:
+                    self._encoded[key] = (size, data)
+
+    def _render(self, source_path: str, size: Tuple[int, int]) -> Optional[bytes]:
+        """生成缩略图并压缩编码"""
+        thumbnail = create_thumbnail(source_path, size)
+        if thumbnail is None:
+            return None
+        return self._encode(thumbnail)
+
+    @staticmethod
+    def _encode(image: Image.Image) -> bytes:
+        """压缩缩略图：不透明图片用JPEG，带透明通道的用PNG"""
+        buffer = io.BytesIO()
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+        if has_alpha:
+            if image.mode != 'RGBA':
+                image = image.convert('RGBA')
+            image.save(buffer, 'PNG')
+        else:
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.save(buffer, 'JPEG', quality=90)
+        return buffer.getvalue()
@@ -0,0 +1,188 @@
+"""
+分块查看模块 - 多分辨率金字塔，按视口只渲染可见的图块
+"""
+
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from PIL import Image
+from archive_reader import open_image
+from image_cache import ImageCache
+from preview_renderer import PreviewRenderer, flatten_image, scale_watermark_config
+from watermark_geometry import WatermarkGeometry
+
+
+# 图块边长（像素）
+TILE_SIZE = 256
+
+
+class TilePyramid:
+    """图片金字塔类
+
+    第 0 层为原图分辨率，之后每层宽高减半，直到整张图能放进一个图块；
+    缩放时选择分辨率不低于当前缩放比例的最小层。各层底图按需解码（已有上一层时
+    由其缩小得到，否则 JPEG 直接降分辨率解码），和图块一样放在共享的 LRU 缓存中，
+    受同一内存上限约束；超过上限的层只在渲染一批图块期间保留。图块在请求时才从
+    对应层裁切并叠加按该层比例缩放的水印。
+    """
+
+    def __init__(self, file_path: str, renderer: PreviewRenderer, watermark_config: Dict[str, Any],
+                 cache: Optional[ImageCache] = None, tile_size: int = TILE_SIZE):
+        self.file_path = file_path
+        self.renderer = renderer
+        self.cache = cache if cache is not None else renderer.cache
+        self.tile_size = tile_size
+        with open_image(file_path) as img:
+            self.size = img.size
+        self.level_count = 1
+        while max(self.get_level_size(self.level_count - 1)) > tile_size:
+            self.level_count += 1
+        # 层 -> (已旋转的水印, 水印在该层中的位置)
+        self._watermarks: Dict[int, Tuple[Optional[Image.Image], Tuple[int, int]]] = {}
+        self._lock = threading.RLock()
+        self.config_version = 0
+        self.set_watermark_config(watermark_config)
+
+    def set_watermark_config(self, watermark_config: Dict[str, Any]):
+        """更换水印配置，已解码的各层底图继续复用"""
+        with self._lock:
+            self.watermark_config = dict(watermark_config)
+            self._config_key = repr(sorted(self.watermark_config.items()))
+            self._watermarks = {}
+            self.config_version += 1
+
+    def get_level_size(self, level: int) -> Tuple[int, int]:
+        """获取指定层的尺寸"""
+        factor = 2 ** level
+        return max(1, math.ceil(self.size[0] / factor)), max(1, math.ceil(self.size[1] / factor))
+
+    def get_level_scale(self, level: int) -> float:
+        """获取指定层相对原图的缩放比例"""
+        return self.get_level_size(level)[0] / self.size[0]
+
+    def level_for_zoom(self, zoom: float) -> int:
+        """选择分辨率不低于 zoom 的最小层"""
+        level = 0
+        while level + 1 < self.level_count and self.get_level_scale(level + 1) >= zoom:
+            level += 1
+        return level
+
+    def get_grid(self, level: int) -> Tuple[int, int]:
+        """获取指定层的图块列数和行数"""
+        width, height = self.get_level_size(level)
+        return math.ceil(width / self.tile_size), math.ceil(height / self.tile_size)
+
+    def visible_tiles(self, level: int, viewport: Tuple[int, int, int, int]) -> List[Tuple[int, int]]:
+        """获取与视口 (x0, y0, x1, y1)（该层坐标）相交的图块，按行优先排列"""
+        columns, rows = self.get_grid(level)
+        x0, y0, x1, y1 = viewport
+        first_column = max(0, int(x0 // self.tile_size))
+        last_column = min(columns - 1, int((x1 - 1) // self.tile_size))
+        first_row = max(0, int(y0 // self.tile_size))
+        last_row = min(rows - 1, int((y1 - 1) // self.tile_size))
+        return [(column, row)
+                for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
+
+    def get_tile_box(self, level: int, column: int, row: int) -> Tuple[int, int, int, int]:
+        """获取图块在该层中的范围"""
+        width, height = self.get_level_size(level)
+        x0 = column * self.tile_size
+        y0 = row * self.tile_size
+        return x0, y0, min(width, x0 + self.tile_size), min(height, y0 + self.tile_size)
+
+    def is_tile_cached(self, level: int, column: int, row: int) -> bool:
+        """图块是否已在缓存中"""
+        return self._tile_key(level, column, row) in self.cache
+
+    def get_tile(self, level: int, column: int, row: int, base: Optional[Image.Image] = None) -> Image.Image:
+        """获取叠加了水印的图块，base 为调用方已取得的该层底图"""
+        key = self._tile_key(level, column, row)
+        tile = self.cache.get(key)
+        if tile is not None:
+            return tile
+
+        box = self.get_tile_box(level, column, row)
+        if base is None:
+            base = self.get_level(level)
+        tile = base.crop(box)
+        watermark, position = self._get_watermark(level)
+        if watermark is not None:
+            x = position[0] - box[0]
+            y = position[1] - box[1]
+            if x < tile.width and y < tile.height and x + watermark.width > 0 and y + watermark.height > 0:
+                tile.paste(watermark, (x, y), watermark)
+        self.cache.put(key, tile)
+        return tile
+
+    def iter_tiles(self, level: int, tiles: Iterable[Tuple[int, int]],
+                   is_cancelled: Optional[Callable[[], bool]] = None) -> Iterator[Tuple[Tuple[int, int], Image.Image]]:
+        """依次产出一批图块，底图在这一批内只获取一次（即使它大到无法缓存）
+
+        is_cancelled 返回 True 时在下一块开始前停止。
+        """
+        base = None
+        for column, row in tiles:
+            if is_cancelled is not None and is_cancelled():
+                return
+            if base is None and not self.is_tile_cached(level, column, row):
+                base = self.get_level(level)
+            yield (column, row), self.get_tile(level, column, row, base)
+
+    def get_level(self, level: int) -> Image.Image:
+        """获取指定层的底图（RGB），按需解码或由上一层缩小得到"""
+        with self._lock:
+            image = self.cache.get(self._level_key(level))
+            if image is not None:
+                return image
+            upper = self.cache.get(self._level_key(level - 1)) if level > 0 else None
+            if upper is not None:
+                image = upper.reduce(2)
+            else:
+                level_size = self.get_level_size(level)
+                with open_image(self.file_path) as img:
+                    if level > 0:
+                        img.draft('RGB', level_size)
+                    img.load()
+                    image = flatten_image(img)
+                    if image is img:
+                        image = img.copy()
+                if image.size != level_size:
+                    image = image.resize(level_size, Image.Resampling.LANCZOS)
+            # 超过缓存上限的层不会被缓存，由调用方在一批图块内持有
+            self.cache.put(self._level_key(level), image)
+        return image
+
+    def _get_watermark(self, level: int) -> Tuple[Optional[Image.Image], Tuple[int, int]]:
+        """获取按该层比例缩放并旋转后的水印及其位置"""
+        with self._lock:
+            if level in self._watermarks:
+                return self._watermarks[level]
+            watermark_config = self.watermark_config
+
+        config = scale_watermark_config(watermark_config, self.get_level_scale(level))
+        watermark, watermark_size = self.renderer.watermark_engine.prepare_watermark(config)
+        position = (0, 0)
+        if watermark is not None:
+            position = WatermarkGeometry.from_config(self.get_level_size(level), watermark_size, config).position
+        with self._lock:
+            if watermark_config is self.watermark_config:
+                self._watermarks[level] = (watermark, position)
+        return watermark, position
+
+    def _level_key(self, level: int) -> Tuple:
+        """层底图缓存键（与水印配置无关）"""
+        return ('tile_level', self.file_path, level)
+
+    def _tile_key(self, level: int, column: int, row: int) -> Tuple:
+        """图块缓存键（包含水印配置，配置变化后旧图块自然淘汰）"""
+        return ('tile', self.file_path, self._config_key, level, column, row)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取金字塔信息"""
+        return {
+            'size': self.size,
+            'levels': self.level_count,
+            'tile_size': self.tile_size,
+            'grid': [self.get_grid(level) for level in range(self.level_count)]
+        }
@@ -10,13 +10,14 @@ from PIL import Image, ImageDraw, ImageFont
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from config import SUPPORTED_FORMATS, DEFAULT_SETTINGS, CONFIG_FILE, TEMPLATES_DIR
+from archive_reader import open_image, open_source
 
 
 def get_file_hash(file_path: str) -> str:
     """获取文件的 MD5 哈希值"""
     hash_md5 = hashlib.md5()
     try:
-        with open(file_path, "rb") as f:
+        with open_source(file_path) as f:
             for chunk in iter(lambda: f.read(4096), b""):
                 hash_md5.update(chunk)
         return hash_md5.hexdigest()
@@ -56,7 +57,7 @@ def get_image_files_from_folder(folder_path: str, recursive: bool = False) -> Li
 def create_thumbnail(image_path: str, size: Tuple[int, int] = (120, 120)) -> Optional[Image.Image]:
     """创建图片缩略图"""
     try:
-        with Image.open(image_path) as img:
+        with open_image(image_path) as img:
             # 保持宽高比
             img.thumbnail(size, Image.Resampling.LANCZOS)
             return img.copy()
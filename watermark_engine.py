@@ -2,17 +2,86 @@
 水印处理引擎
 """
 
+import contextlib
+import io
 import os
-from typing import Tuple, Optional, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Tuple, Optional, Dict, Any, Union, BinaryIO
 from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+from archive_reader import open_image, source_exists
+from output_writer import atomic_write
 from utils import calculate_watermark_position, get_available_fonts
+from watermark_geometry import WatermarkGeometry
+
+
+# 只影响水印位置、不影响水印图层外观的配置项
+PLACEMENT_KEYS = ('position_preset', 'offset_x', 'offset_y', 'padding')
+
+# 引擎接受的图片来源：文件路径、内存中的编码数据、可读文件对象或 PIL 图片
+ImageSource = Union[str, bytes, bytearray, memoryview, BinaryIO, Image.Image]
+
+
+class BufferReader(io.RawIOBase):
+    """只读文件对象，直接读取调用方的缓冲区（bytearray、memoryview 等），不复制整个缓冲区"""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        count = min(len(target), len(self._view) - self._position)
+        if count <= 0:
+            return 0
+        target[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def open_source_image(source: ImageSource):
+    """以上下文管理器的形式打开图片来源；调用方传入的 PIL 图片和文件对象不会被关闭"""
+    if isinstance(source, Image.Image):
+        return contextlib.nullcontext(source)
+    if isinstance(source, str):
+        return open_image(source)
+    if isinstance(source, bytes):
+        # BytesIO 与 bytes 共享内存，只有写入时才复制
+        return Image.open(io.BytesIO(source))
+    if isinstance(source, (bytearray, memoryview)):
+        return Image.open(BufferReader(source))
+    # 可读文件对象，Image.open 不会关闭它
+    return Image.open(source)
 
 
 class WatermarkEngine:
     """水印处理引擎类"""
     
-    def __init__(self):
+    def __init__(self, watermark_cache_size: int = 8):
         self.font_cache = {}
+        # 外观配置 -> (已旋转的水印图层, 未旋转时的尺寸)
+        self.watermark_cache: "OrderedDict[str, Tuple[Optional[Image.Image], Tuple[int, int]]]" = OrderedDict()
+        self.watermark_cache_size = watermark_cache_size
+        self._watermark_lock = threading.Lock()
+        # 完整配置 -> 数组接口使用的预处理水印（PreparedArrayWatermark）
+        self.array_watermark_cache: "OrderedDict[str, Any]" = OrderedDict()
     
     def get_font(self, font_family: str, font_size: int, font_weight: str = 'normal', font_style: str = 'normal') -> Optional[ImageFont.FreeTypeFont]:
         """获取字体对象，带缓存"""
@@ -69,9 +138,12 @@ class WatermarkEngine:
             except Exception as e:
                 print(f"字体创建失败(通用): {font_file}, 大小: {font_size}, 错误: {e}")  # 调试信息
         
-        # 4. 最后的回退方案 - 使用默认字体
+        # 4. 最后的回退方案 - 使用默认字体（Pillow 10.1 起支持指定大小）
         try:
-            font = ImageFont.load_default()
+            try:
+                font = ImageFont.load_default(font_size)
+            except TypeError:
+                font = ImageFont.load_default()
             self.font_cache[cache_key] = font
             print(f"创建新字体(默认): 大小: {font_size}")  # 调试信息
             return font
@@ -172,6 +244,8 @@ class WatermarkEngine:
         """创建图片水印"""
         try:
             with Image.open(image_path) as img:
+                # 在文件关闭前读入像素，RGBA 且无需缩放和调整透明度时直接返回该图片
+                img.load()
                 # 转换为RGBA模式以支持透明度
                 if img.mode != 'RGBA':
                     img = img.convert('RGBA')
@@ -193,6 +267,131 @@ class WatermarkEngine:
             print(f"创建图片水印失败: {e}")
             return None
     
+    def create_watermark(self, watermark_config: Dict[str, Any]) -> Optional[Image.Image]:
+        """按配置创建（未旋转的）水印图像"""
+        if watermark_config.get('type') == 'text':
+            if not watermark_config.get('text_content'):
+                return None
+            return self.create_text_watermark(
+                watermark_config['text_content'],
+                watermark_config.get('font_family', 'Arial'),
+                watermark_config.get('font_size', 24),
+                watermark_config.get('color', '#000000'),
+                watermark_config.get('opacity', 80),
+                watermark_config.get('font_weight', 'normal'),
+                watermark_config.get('font_style', 'normal'),
+                watermark_config.get('shadow'),
+                watermark_config.get('stroke')
+            )
+        if watermark_config.get('type') == 'image':
+            image_watermark_path = watermark_config.get('image_path')
+            if image_watermark_path and os.path.exists(image_watermark_path):
+                return self.create_image_watermark(
+                    image_watermark_path,
+                    watermark_config.get('scale', 1.0),
+                    watermark_config.get('opacity', 80)
+                )
+            print(f"图片水印路径无效或不存在: {image_watermark_path}")
+        return None
+    
+    def prepare_watermark(self, watermark_config: Dict[str, Any]) -> Tuple[Optional[Image.Image], Tuple[int, int]]:
+        """获取已旋转的水印图层及其未旋转时的尺寸，同一外观配置只生成和旋转一次
+        
+        返回的图层会被多次复用，调用方不能修改它。
+        """
+        key = self._watermark_key(watermark_config)
+        with self._watermark_lock:
+            if key in self.watermark_cache:
+                self.watermark_cache.move_to_end(key)
+                return self.watermark_cache[key]
+        
+        watermark = self.create_watermark(watermark_config)
+        size = (0, 0)
+        if watermark is not None:
+            size = watermark.size
+            rotation = watermark_config.get('rotation', 0)
+            if rotation != 0:
+                watermark = watermark.rotate(rotation, expand=True, fillcolor=(0, 0, 0, 0))
+        
+        with self._watermark_lock:
+            self.watermark_cache[key] = (watermark, size)
+            while len(self.watermark_cache) > self.watermark_cache_size:
+                self.watermark_cache.popitem(last=False)
+        return watermark, size
+    
+    def prepare_array_watermark(self, watermark_config: Dict[str, Any]):
+        """获取数组接口使用的预处理水印（需要 numpy），没有水印时返回 None"""
+        from array_watermark import PreparedArrayWatermark
+        
+        key = self._watermark_key(watermark_config) + repr(
+            [(name, watermark_config.get(name)) for name in PLACEMENT_KEYS]
+        )
+        with self._watermark_lock:
+            prepared = self.array_watermark_cache.get(key)
+            if prepared is not None:
+                self.array_watermark_cache.move_to_end(key)
+                return prepared
+        
+        watermark, watermark_size = self.prepare_watermark(watermark_config)
+        if watermark is None:
+            return None
+        prepared = PreparedArrayWatermark(watermark, watermark_size, watermark_config)
+        with self._watermark_lock:
+            self.array_watermark_cache[key] = prepared
+            while len(self.array_watermark_cache) > self.watermark_cache_size:
+                self.array_watermark_cache.popitem(last=False)
+        return prepared
+    
+    def watermark_array(self, array, watermark_config, out=None):
+        """在 NumPy 数组上合成水印（需要 numpy）
+
+        array 为 HxWx3/4 的单帧或 NxHxWx3/4 的同尺寸批量帧（uint8）。
+        out 为 None 时原地修改 array，否则写入调用方提供的同形状数组。
+        watermark_config 可以是水印配置，也可以是 prepare_array_watermark 的返回值。
+        返回写入结果的数组。
+        """
+        from array_watermark import PreparedArrayWatermark, passthrough_array
+        
+        if isinstance(watermark_config, PreparedArrayWatermark):
+            prepared = watermark_config
+        else:
+            prepared = self.prepare_array_watermark(watermark_config)
+        if prepared is None:
+            return passthrough_array(array, out)
+        return prepared.apply(array, out)
+    
+    def _watermark_key(self, watermark_config: Dict[str, Any]) -> str:
+        """水印外观的缓存键（图片水印包含文件修改时间）"""
+        appearance = {k: v for k, v in watermark_config.items() if k not in PLACEMENT_KEYS}
+        if appearance.get('type') == 'image' and appearance.get('image_path'):
+            try:
+                appearance['image_mtime'] = os.path.getmtime(appearance['image_path'])
+            except OSError:
+                pass
+        return repr(sorted(appearance.items()))
+    
+    def paste_watermark(self, image: Image.Image, watermark: Image.Image, position: Tuple[int, int]) -> Image.Image:
+        """把（已旋转的）水印图层合成到指定位置，返回新图片"""
+        # 如果原图是RGBA模式，可以直接应用水印
+        if image.mode == 'RGBA':
+            output = image.copy()
+            output.paste(watermark, position, watermark)
+            return output
+        
+        # 如果原图是RGB模式，需要特殊处理
+        if image.mode == 'RGB':
+            # 创建一个临时的RGBA图像用于处理水印
+            temp_image = image.convert('RGBA')
+            temp_image.paste(watermark, position, watermark)
+            # 转换回RGB模式
+            return temp_image.convert('RGB')
+        
+        # 其他模式，转换为RGBA处理后再转回原模式
+        original_mode = image.mode
+        temp_image = image.convert('RGBA')
+        temp_image.paste(watermark, position, watermark)
+        return temp_image.convert(original_mode)
+    
     def apply_watermark(
         self, 
         image: Image.Image, 
@@ -216,30 +415,7 @@ class WatermarkEngine:
                 image.size, watermark.size, position_preset, offset_x, offset_y, padding
             )
             
-            # 如果原图是RGBA模式，可以直接应用水印
-            if image.mode == 'RGBA':
-                print("原图是RGBA模式，直接应用水印")
-                output = image.copy()
-                output.paste(watermark, position, watermark)
-                return output
-            
-            # 如果原图是RGB模式，需要特殊处理
-            if image.mode == 'RGB':
-                print("原图是RGB模式，使用RGB方式应用水印")
-                # 创建一个临时的RGBA图像用于处理水印
-                temp_image = image.convert('RGBA')
-                temp_image.paste(watermark, position, watermark)
-                # 转换回RGB模式
-                output = temp_image.convert('RGB')
-                return output
-            
-            # 其他模式，转换为RGBA处理后再转回原模式
-            print(f"原图是{image.mode}模式，转换为RGBA处理")
-            original_mode = image.mode
-            temp_image = image.convert('RGBA')
-            temp_image.paste(watermark, position, watermark)
-            output = temp_image.convert(original_mode)
-            return output
+            return self.paste_watermark(image, watermark, position)
             
         except Exception as e:
             print(f"应用水印失败: {e}")
@@ -247,129 +423,193 @@ class WatermarkEngine:
             traceback.print_exc()
             return image
     
+    def render_image(
+        self,
+        image: Image.Image,
+        watermark_config: Dict[str, Any],
+        export_config: Dict[str, Any]
+    ) -> Image.Image:
+        """按导出格式转换模式并合成水印，返回可直接编码的图片"""
+        # 转换为RGB模式（用于JPEG输出）
+        if export_config.get('format') == 'JPEG':
+            if image.mode in ('RGBA', 'LA'):
+                # 创建白色背景
+                print("转换RGBA图片为RGB模式用于JPEG输出")
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                if image.mode == 'RGBA':
+                    background.paste(image, mask=image.split()[-1])
+                else:
+                    background.paste(image)
+                image = background
+            elif image.mode != 'RGB':
+                print(f"转换{image.mode}图片为RGB模式用于JPEG输出")
+                image = image.convert('RGB')
+        elif export_config.get('format') == 'PNG':
+            if image.mode != 'RGBA':
+                print(f"转换{image.mode}图片为RGBA模式用于PNG输出")
+                image = image.convert('RGBA')
+        
+        # 获取已旋转的水印图层（批量导出时同一配置只生成一次）
+        watermark, watermark_size = self.prepare_watermark(watermark_config)
+        
+        # 应用水印
+        if watermark:
+            print("应用水印到图片")
+            geometry = WatermarkGeometry.from_config(image.size, watermark_size, watermark_config)
+            image = self.paste_watermark(image, watermark, geometry.position)
+            print(f"应用水印后图片模式: {image.mode}")
+        
+        # 保存图片前的模式转换
+        if export_config.get('format') == 'JPEG':
+            if image.mode in ('RGBA', 'LA'):
+                # 创建白色背景
+                print("转换RGBA图片为RGB模式用于JPEG输出")
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                if image.mode == 'RGBA':
+                    background.paste(image, mask=image.split()[-1])
+                else:
+                    background.paste(image)
+                image = background
+            elif image.mode != 'RGB':
+                print(f"转换{image.mode}图片为RGB模式用于JPEG输出")
+                image = image.convert('RGB')
+            print(f"最终图片模式: {image.mode}")
+        elif export_config.get('format') == 'PNG':
+            if image.mode != 'RGBA':
+                print(f"转换{image.mode}图片为RGBA模式用于PNG输出")
+                image = image.convert('RGBA')
+            print(f"最终图片模式: {image.mode}")
+        
+        return image
+    
+    def get_save_kwargs(self, export_config: Dict[str, Any]) -> Dict[str, Any]:
+        """获取保存图片时的编码参数"""
+        save_kwargs = {}
+        if export_config.get('format') == 'JPEG':
+            save_kwargs['quality'] = export_config.get('jpeg_quality', 85)
+            save_kwargs['optimize'] = True
+            print(f"保存为JPEG格式，质量: {save_kwargs['quality']}")
+        elif export_config.get('format') == 'PNG':
+            save_kwargs['optimize'] = True
+            print("保存为PNG格式")
+        return save_kwargs
+    
+    def encode(
+        self,
+        source: ImageSource,
+        watermark_config: Dict[str, Any],
+        export_config: Dict[str, Any]
+    ) -> Optional[bytes]:
+        """处理图片并编码到内存，返回文件内容（失败时返回 None）
+
+        source 可以是文件路径、编码数据（bytes/bytearray/memoryview）、
+        可读文件对象或 PIL 图片，全程在内存中完成，不读写临时文件。
+        """
+        try:
+            with open_source_image(source) as image:
+                image = self.render_image(image, watermark_config, export_config)
+                buffer = io.BytesIO()
+                image.save(buffer, export_config.get('format'), **self.get_save_kwargs(export_config))
+                return buffer.getvalue()
+        except Exception as e:
+            print(f"处理图片失败 {self._describe_source(source)}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def watermark(
+        self,
+        source: ImageSource,
+        watermark_config: Dict[str, Any],
+        export_config: Optional[Dict[str, Any]] = None
+    ) -> Optional[Image.Image]:
+        """处理图片并返回加好水印的 PIL 图片（失败时返回 None），不修改传入的图片
+
+        export_config 为 None 时不按输出格式转换模式。
+        """
+        try:
+            with open_source_image(source) as image:
+                image.load()
+                result = self.render_image(image, watermark_config, export_config or {})
+                if result is image and not isinstance(source, Image.Image):
+                    # 没有发生转换时复制一份，避免返回随文件一起关闭的图片
+                    result = image.copy()
+                return result
+        except Exception as e:
+            print(f"处理图片失败 {self._describe_source(source)}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def encode_image(
+        self,
+        image_path: str,
+        watermark_config: Dict[str, Any],
+        export_config: Dict[str, Any]
+    ) -> Optional[bytes]:
+        """处理单张图片文件并编码到内存，返回文件内容（失败时返回 None）"""
+        print(f"开始处理图片: {image_path}")
+        return self.encode(image_path, watermark_config, export_config)
+    
+    @staticmethod
+    def _describe_source(source: ImageSource) -> str:
+        """生成日志中显示的来源描述"""
+        if isinstance(source, str):
+            return source
+        if isinstance(source, Image.Image):
+            return f"<PIL图片 {source.mode} {source.size}>"
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return f"<内存数据 {len(source)} 字节>"
+        return f"<文件对象 {getattr(source, 'name', type(source).__name__)}>"
+    
     def process_image(
         self, 
         image_path: str, 
         watermark_config: Dict[str, Any], 
         output_path: str,
-        export_config: Dict[str, Any]
+        export_config: Dict[str, Any],
+        create_dirs: bool = True
     ) -> bool:
-        """处理单张图片"""
+        """处理单张图片
+
+        create_dirs 为 False 时调用方已确保输出目录存在（批量导出时每个目录只创建一次），
+        这里不再逐张创建和检查目录。
+        """
         try:
             print(f"开始处理图片: {image_path}")
             print(f"输出路径: {output_path}")
             
             # 检查输入文件是否存在
-            if not os.path.exists(image_path):
+            if not source_exists(image_path):
                 print(f"输入文件不存在: {image_path}")
                 return False
                 
             # 打开原始图片
-            with Image.open(image_path) as image:
+            with open_image(image_path) as image:
                 print(f"成功打开图片: {image_path}, 模式: {image.mode}, 尺寸: {image.size}")
                 
-                # 转换为RGB模式（用于JPEG输出）
-                if export_config.get('format') == 'JPEG':
-                    if image.mode in ('RGBA', 'LA'):
-                        # 创建白色背景
-                        print("转换RGBA图片为RGB模式用于JPEG输出")
-                        background = Image.new('RGB', image.size, (255, 255, 255))
-                        if image.mode == 'RGBA':
-                            background.paste(image, mask=image.split()[-1])
-                        else:
-                            background.paste(image)
-                        image = background
-                    elif image.mode != 'RGB':
-                        print(f"转换{image.mode}图片为RGB模式用于JPEG输出")
-                        image = image.convert('RGB')
-                elif export_config.get('format') == 'PNG':
-                    if image.mode != 'RGBA':
-                        print(f"转换{image.mode}图片为RGBA模式用于PNG输出")
-                        image = image.convert('RGBA')
-                
-                # 创建水印
-                watermark = None
-                if watermark_config.get('type') == 'text':
-                    print("创建文本水印")
-                    watermark = self.create_text_watermark(
-                        watermark_config.get('text_content', ''),
-                        watermark_config.get('font_family', 'Arial'),
-                        watermark_config.get('font_size', 24),
-                        watermark_config.get('color', '#000000'),
-                        watermark_config.get('opacity', 80),
-                        watermark_config.get('font_weight', 'normal'),
-                        watermark_config.get('font_style', 'normal'),
-                        watermark_config.get('shadow'),
-                        watermark_config.get('stroke')
-                    )
-                elif watermark_config.get('type') == 'image':
-                    image_watermark_path = watermark_config.get('image_path')
-                    if image_watermark_path and os.path.exists(image_watermark_path):
-                        print(f"创建图片水印: {image_watermark_path}")
-                        watermark = self.create_image_watermark(
-                            image_watermark_path,
-                            watermark_config.get('scale', 1.0),
-                            watermark_config.get('opacity', 80)
-                        )
-                    else:
-                        print(f"图片水印路径无效或不存在: {image_watermark_path}")
-                
-                # 应用水印
-                if watermark:
-                    print("应用水印到图片")
-                    image = self.apply_watermark(
-                        image, watermark,
-                        watermark_config.get('position_preset', 'bottom_right'),
-                        watermark_config.get('offset_x', 20),
-                        watermark_config.get('offset_y', 20),
-                        watermark_config.get('padding', 10),
-                        watermark_config.get('rotation', 0)
-                    )
-                    print(f"应用水印后图片模式: {image.mode}")
-                
-                # 保存图片前的模式转换
-                if export_config.get('format') == 'JPEG':
-                    if image.mode in ('RGBA', 'LA'):
-                        # 创建白色背景
-                        print("转换RGBA图片为RGB模式用于JPEG输出")
-                        background = Image.new('RGB', image.size, (255, 255, 255))
-                        if image.mode == 'RGBA':
-                            background.paste(image, mask=image.split()[-1])
-                        else:
-                            background.paste(image)
-                        image = background
-                    elif image.mode != 'RGB':
-                        print(f"转换{image.mode}图片为RGB模式用于JPEG输出")
-                        image = image.convert('RGB')
-                    print(f"最终图片模式: {image.mode}")
-                elif export_config.get('format') == 'PNG':
-                    if image.mode != 'RGBA':
-                        print(f"转换{image.mode}图片为RGBA模式用于PNG输出")
-                        image = image.convert('RGBA')
-                    print(f"最终图片模式: {image.mode}")
+                image = self.render_image(image, watermark_config, export_config)
                 
                 # 保存图片
-                save_kwargs = {}
-                if export_config.get('format') == 'JPEG':
-                    save_kwargs['quality'] = export_config.get('jpeg_quality', 85)
-                    save_kwargs['optimize'] = True
-                    print(f"保存为JPEG格式，质量: {save_kwargs['quality']}")
-                elif export_config.get('format') == 'PNG':
-                    save_kwargs['optimize'] = True
-                    print("保存为PNG格式")
-                
-                # 确保输出目录存在
-                output_dir = os.path.dirname(output_path)
-                print(f"确保输出目录存在: {output_dir}")
-                os.makedirs(output_dir, exist_ok=True)
+                save_kwargs = self.get_save_kwargs(export_config)
                 
-                # 检查输出目录是否有写权限
-                if not os.access(output_dir, os.W_OK):
-                    print(f"输出目录没有写权限: {output_dir}")
-                    return False
+                if create_dirs:
+                    # 确保输出目录存在
+                    output_dir = os.path.dirname(output_path)
+                    print(f"确保输出目录存在: {output_dir}")
+                    os.makedirs(output_dir, exist_ok=True)
+                    
+                    # 检查输出目录是否有写权限
+                    if not os.access(output_dir, os.W_OK):
+                        print(f"输出目录没有写权限: {output_dir}")
+                        return False
                 
+                # 先编码到内存，再经临时文件改名写入，中途失败不会留下不完整的文件
                 print(f"保存图片到: {output_path}")
-                image.save(output_path, export_config.get('format'), **save_kwargs)
+                buffer = io.BytesIO()
+                image.save(buffer, export_config.get('format'), **save_kwargs)
+                atomic_write(output_path, buffer.getvalue(),
+                             fsync=export_config.get('durability', 'none') != 'none')
                 print(f"图片保存成功: {output_path}")
                 return True
                 
@@ -0,0 +1,131 @@
+"""
+水印几何模块 - 解析计算旋转后的尺寸、放置位置和命中检测多边形
+"""
+
+import math
+from typing import Any, Dict, List, Tuple
+from utils import calculate_watermark_position
+
+
+def _rotation_matrix(size: Tuple[int, int], angle: float) -> List[float]:
+    """与 PIL Image.rotate 相同的仿射矩阵（从目标坐标映射到源坐标，未做 expand 平移）"""
+    width, height = size
+    radians = -math.radians(angle)
+    matrix = [
+        round(math.cos(radians), 15),
+        round(math.sin(radians), 15),
+        0.0,
+        round(-math.sin(radians), 15),
+        round(math.cos(radians), 15),
+        0.0
+    ]
+    center_x, center_y = width / 2, height / 2
+    matrix[2], matrix[5] = _transform(-center_x, -center_y, matrix)
+    matrix[2] += center_x
+    matrix[5] += center_y
+    return matrix
+
+
+def _transform(x: float, y: float, matrix: List[float]) -> Tuple[float, float]:
+    """应用仿射矩阵"""
+    a, b, c, d, e, f = matrix
+    return a * x + b * y + c, d * x + e * y + f
+
+
+def rotated_size(size: Tuple[int, int], angle: float) -> Tuple[int, int]:
+    """计算 rotate(angle, expand=True) 后的图层尺寸，与 PIL 结果一致"""
+    width, height = size
+    angle = angle % 360.0
+    if angle in (0, 180):
+        return width, height
+    if angle in (90, 270):
+        return height, width
+
+    matrix = _rotation_matrix(size, angle)
+    xs = []
+    ys = []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        tx, ty = _transform(x, y, matrix)
+        xs.append(tx)
+        ys.append(ty)
+    return math.ceil(max(xs)) - math.floor(min(xs)), math.ceil(max(ys)) - math.floor(min(ys))
+
+
+def rotated_corners(size: Tuple[int, int], angle: float) -> List[Tuple[float, float]]:
+    """计算原水印四个角在旋转后图层中的坐标（顺时针，从左上角开始）"""
+    width, height = size
+    layer_width, layer_height = rotated_size(size, angle)
+    # PIL 逆时针旋转，屏幕坐标 y 轴向下
+    radians = math.radians(angle)
+    cos_a = math.cos(radians)
+    sin_a = math.sin(radians)
+    corners = []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        dx = x - width / 2
+        dy = y - height / 2
+        corners.append((layer_width / 2 + dx * cos_a + dy * sin_a,
+                        layer_height / 2 - dx * sin_a + dy * cos_a))
+    return corners
+
+
+class WatermarkGeometry:
+    """已放置水印的几何信息
+
+    由未旋转的水印尺寸和配置直接算出旋转后图层的尺寸、在图片中的位置
+    以及水印实际覆盖的四边形，不需要为了测量而生成或旋转图像。
+    """
+
+    def __init__(self, image_size: Tuple[int, int], watermark_size: Tuple[int, int],
+                 rotation: float = 0, position_preset: str = 'bottom_right',
+                 offset_x: int = 20, offset_y: int = 20, padding: int = 10):
+        self.image_size = image_size
+        self.watermark_size = watermark_size
+        self.rotation = rotation
+        self.position_preset = position_preset
+        self.padding = padding
+        self.layer_size = rotated_size(watermark_size, rotation)
+        self.position = calculate_watermark_position(
+            image_size, self.layer_size, position_preset, offset_x, offset_y, padding
+        )
+        x, y = self.position
+        self.polygon = [(x + cx, y + cy) for cx, cy in rotated_corners(watermark_size, rotation)]
+
+    @classmethod
+    def from_config(cls, image_size: Tuple[int, int], watermark_size: Tuple[int, int],
+                    watermark_config: Dict[str, Any]) -> 'WatermarkGeometry':
+        """按水印配置计算几何信息"""
+        return cls(
+            image_size, watermark_size,
+            watermark_config.get('rotation', 0),
+            watermark_config.get('position_preset', 'bottom_right'),
+            watermark_config.get('offset_x', 20),
+            watermark_config.get('offset_y', 20),
+            watermark_config.get('padding', 10)
+        )
+
+    @property
+    def rect(self) -> Tuple[int, int, int, int]:
+        """旋转后图层的外接矩形 (x, y, w, h)"""
+        return self.position + self.layer_size
+
+    def moved(self, offset_x: int, offset_y: int) -> 'WatermarkGeometry':
+        """以新的偏移重新放置（尺寸和旋转不变）"""
+        return WatermarkGeometry(self.image_size, self.watermark_size, self.rotation,
+                                 self.position_preset, offset_x, offset_y, self.padding)
+
+    def contains(self, x: float, y: float, margin: float = 0) -> bool:
+        """点是否落在水印四边形内（或距其边缘不超过 margin）"""
+        inside = True
+        for i, (x1, y1) in enumerate(self.polygon):
+            x2, y2 = self.polygon[(i + 1) % len(self.polygon)]
+            edge_x = x2 - x1
+            edge_y = y2 - y1
+            length = math.hypot(edge_x, edge_y)
+            if length == 0:
+                continue
+            # 顺时针多边形内部在每条边的右侧，叉积为有符号距离
+            distance = (edge_x * (y - y1) - edge_y * (x - x1)) / length
+            if distance < -margin:
+                inside = False
+                break
+        return inside
@@ -0,0 +1,410 @@
+"""
+水印 HTTP 服务 - 只依赖标准库，供其他工具在本机调用水印引擎
+
+用法:
+    python watermark_server.py [--host 127.0.0.1] [--port 8765] [--workers N]
+                               [--max-pending N] [--max-mb N]
+
+接口:
+    POST /watermark?template=名称
+        请求体为原始图片数据，返回加好水印的图片。
+        不指定模板时可在 X-Watermark-Config 头中传入 JSON：
+        {"watermark_config": {...}, "export_config": {"format": "PNG"}}
+        （与模板同时使用时覆盖模板中的对应项）
+    GET /stats
+        返回请求计数、排队情况和延迟统计（JSON）
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import DEFAULT_SETTINGS, TEMPLATES_DIR
+from preview_stats import percentile
+
+
+# 输出格式对应的 Content-Type
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png'
+}
+
+# 工作进程中的水印引擎，进程内复用字体和已生成的水印图层
+_worker_engine = None
+
+
+def _init_worker():
+    """工作进程初始化"""
+    global _worker_engine
+    from watermark_engine import WatermarkEngine
+    _worker_engine = WatermarkEngine(watermark_cache_size=32)
+
+
+def _process_upload(data: bytes, watermark_config: Dict[str, Any], export_config: Dict[str, Any]) -> Optional[bytes]:
+    """在工作进程中处理一张上传的图片"""
+    if _worker_engine is None:
+        _init_worker()
+    return _worker_engine.encode(data, watermark_config, export_config)
+
+
+def _exit_worker(*args) -> None:
+    """立即结束工作进程（仅用于测试进程池崩溃后的恢复）"""
+    os._exit(1)
+
+
+class TemplateCache:
+    """模板缓存类
+
+    按模板名称（或文件名）查找模板，解析结果按文件修改时间缓存，
+    模板文件未变化时不重复读取和解析。
+    """
+
+    def __init__(self, templates_dir: str = TEMPLATES_DIR):
+        self.templates_dir = templates_dir
+        # 模板名称/文件名 -> 文件名
+        self._index: Dict[str, str] = {}
+        self._index_mtime = None
+        # 文件名 -> (修改时间, 水印配置, 导出配置)
+        self._templates: Dict[str, Tuple[float, Dict[str, Any], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def _refresh_index(self):
+        """模板目录有变化时重建名称索引（调用方持有锁）"""
+        try:
+            mtime = os.path.getmtime(self.templates_dir)
+        except OSError:
+            self._index = {}
+            return
+        if mtime == self._index_mtime:
+            return
+        index = {}
+        for filename in os.listdir(self.templates_dir):
+            if not filename.endswith('.json'):
+                continue
+            index[filename[:-5]] = filename
+            try:
+                with open(os.path.join(self.templates_dir, filename), 'r', encoding='utf-8') as f:
+                    name = json.load(f).get('name')
+                if name:
+                    index.setdefault(name, filename)
+            except Exception as e:
+                print(f"读取模板文件失败 {filename}: {e}")
+        self._index = index
+        self._index_mtime = mtime
+
+    def get(self, name: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """获取模板的 (水印配置, 导出配置)，不存在时返回 None"""
+        with self._lock:
+            self._refresh_index()
+            filename = self._index.get(name)
+            if filename is None:
+                return None
+            path = os.path.join(self.templates_dir, filename)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                return None
+            cached = self._templates.get(filename)
+            if cached is not None and cached[0] == mtime:
+                self.hits += 1
+                return cached[1], cached[2]
+
+            with open(path, 'r', encoding='utf-8') as f:
+                template_data = json.load(f)
+            watermark_config = template_data.get('watermark_config')
+            export_config = template_data.get('export_config')
+            if not isinstance(watermark_config, dict) or not isinstance(export_config, dict):
+                return None
+            self._templates[filename] = (mtime, watermark_config, export_config)
+            self.loads += 1
+            return watermark_config, export_config
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP 请求处理"""
+
+    server_version = "WatermarkServer/1.0"
+    # HTTP/1.1：支持长连接和 Expect: 100-continue（超限的上传在发送请求体前就被拒绝）
+    protocol_version = "HTTP/1.1"
+
+    def handle_expect_100(self):
+        length = self.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > self.server.app.max_bytes:
+            self.server.app._count('requests')
+            self.server.app._count('rejected_size')
+            self.close_connection = True
+            self._send_json(413, {'error': f'请求体超过上限 {self.server.app.max_bytes} 字节'})
+            return False
+        return super().handle_expect_100()
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self._send_json(200, self.server.app.get_statistics())
+        else:
+            self._send_json(404, {'error': '未知的路径'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/watermark':
+            self._send_json(404, {'error': '未知的路径'})
+            return
+        self.server.app.handle_watermark(self, parse_qs(url.query))
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        """发送 JSON 响应"""
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self._send(status, body, 'application/json; charset=utf-8', headers)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        """发送响应"""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """请求日志只在出错时打印"""
+        pass
+
+
+class WatermarkServer:
+    """水印 HTTP 服务类
+
+    请求线程负责收发数据，图片在进程池中处理（每个工作进程复用自己的
+    水印引擎和水印图层缓存）。正在处理和排队的请求超过 max_pending 时
+    直接返回 503 和 Retry-After，不在内存中无限堆积；请求体超过 max_bytes
+    时返回 413，不读取请求体。工作进程意外退出时重建进程池，当次请求返回 503。
+    默认只监听 127.0.0.1。
+
+    process_func 是在工作进程中处理上传的函数（需为模块级函数，可在进程间
+    传递），测试时可换成 _exit_worker 模拟工作进程崩溃。
+    """
+
+    process_func = staticmethod(_process_upload)
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, max_bytes: int = 50 * 1024 * 1024,
+                 templates_dir: str = TEMPLATES_DIR, executor: Optional[Executor] = None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_pending = max_pending or self.workers * 2
+        self.max_bytes = max_bytes
+        self.templates = TemplateCache(templates_dir)
+        self._owns_executor = executor is None
+        self.executor = executor or self._create_executor()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=1000)
+        self.counters = dict.fromkeys(
+            ('requests', 'completed', 'rejected_busy', 'rejected_size', 'bad_request', 'failed',
+             'pool_restarts', 'bytes_in', 'bytes_out'), 0
+        )
+        self.in_flight = 0
+        self.started_at = time.time()
+
+        self.httpd = ThreadingHTTPServer((host, port), _RequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.app = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """服务地址"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程中开始服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        """在当前线程中服务，直到被中断"""
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """停止服务并关闭进程池"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+        if self._owns_executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """创建工作进程池"""
+        return ProcessPoolExecutor(self.workers, initializer=_init_worker)
+
+    def _restart_executor(self, broken: Executor):
+        """工作进程意外退出后进程池不再可用，换成新的进程池（只重建一次）"""
+        with self._lock:
+            if self.executor is not broken or not self._owns_executor:
+                return
+            self.executor = self._create_executor()
+            self.counters['pool_restarts'] += 1
+        print("工作进程异常退出，已重建进程池")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, key: str, value: int = 1):
+        """更新计数"""
+        with self._lock:
+            self.counters[key] += value
+
+    def resolve_config(self, query: Dict[str, Any], header: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """根据模板名和内联配置得到 (水印配置, 导出配置)，无效时抛出 ValueError"""
+        watermark_config = dict(DEFAULT_SETTINGS['watermark'])
+        export_config = {'format': 'PNG', 'jpeg_quality': DEFAULT_SETTINGS['export']['jpeg_quality']}
+
+        template_name = query.get('template', [None])[0]
+        if template_name:
+            template = self.templates.get(template_name)
+            if template is None:
+                raise ValueError(f"模板不存在: {template_name}")
+            watermark_config.update(template[0])
+            export_config.update(template[1])
+
+        if header:
+            try:
+                inline = json.loads(header)
+            except ValueError:
+                raise ValueError("X-Watermark-Config 不是有效的 JSON")
+            if not isinstance(inline, dict):
+                raise ValueError("X-Watermark-Config 必须是 JSON 对象")
+            watermark_config.update(inline.get('watermark_config') or {})
+            export_config.update(inline.get('export_config') or {})
+        elif not template_name:
+            raise ValueError("需要指定 template 参数或 X-Watermark-Config 头")
+
+        if export_config.get('format') not in CONTENT_TYPES:
+            raise ValueError(f"不支持的输出格式: {export_config.get('format')}")
+        return watermark_config, export_config
+
+    def handle_watermark(self, handler: _RequestHandler, query: Dict[str, Any]):
+        """处理一次水印请求"""
+        self._count('requests')
+        length = handler.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            self._count('bad_request')
+            handler._send_json(411, {'error': '需要 Content-Length'})
+            return
+        length = int(length)
+        if length > self.max_bytes:
+            self._count('rejected_size')
+            handler.close_connection = True
+            handler._send_json(413, {'error': f'请求体超过上限 {self.max_bytes} 字节'})
+            return
+
+        try:
+            watermark_config, export_config = self.resolve_config(query, handler.headers.get('X-Watermark-Config'))
+        except ValueError as e:
+            self._count('bad_request')
+            handler.rfile.read(length)
+            handler._send_json(400, {'error': str(e)})
+            return
+
+        # 背压：排队已满时立即拒绝，由调用方稍后重试
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected_busy')
+            # 读完（已限制大小的）请求体再响应，避免客户端在发送途中连接被重置
+            handler.rfile.read(length)
+            handler._send_json(503, {'error': '服务繁忙'}, {'Retry-After': '1'})
+            return
+
+        start = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+            executor = self.executor
+        pool_broken = False
+        try:
+            data = handler.rfile.read(length)
+            self._count('bytes_in', len(data))
+            result = executor.submit(self.process_func, data, watermark_config, export_config).result()
+        except BrokenProcessPool:
+            # 不是图片的问题：重建进程池，由调用方重试
+            pool_broken = True
+            result = None
+            self._restart_executor(executor)
+        except Exception as e:
+            print(f"处理请求失败: {e}")
+            result = None
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+        if pool_broken:
+            handler._send_json(503, {'error': '工作进程异常退出，请重试'}, {'Retry-After': '1'})
+            return
+        if result is None:
+            self._count('failed')
+            handler._send_json(422, {'error': '无法处理该图片'})
+            return
+
+        with self._lock:
+            self.counters['completed'] += 1
+            self.counters['bytes_out'] += len(result)
+            self._latencies.append((time.perf_counter() - start) * 1000)
+        handler._send(200, result, CONTENT_TYPES[export_config['format']])
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取服务统计"""
+        with self._lock:
+            latencies = list(self._latencies)
+            stats = dict(self.counters)
+            stats['in_flight'] = self.in_flight
+        stats.update({
+            'uptime': time.time() - self.started_at,
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'max_bytes': self.max_bytes,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'max': max(latencies) if latencies else 0.0
+            },
+            'templates': {'loads': self.templates.loads, 'hits': self.templates.hits}
+        })
+        return stats
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Watermark Studio 本机水印服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址（默认只允许本机访问）")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, help="工作进程数，默认 CPU 数减一")
+    parser.add_argument('--max-pending', type=int, help="同时处理和排队的请求上限，默认工作进程数的两倍")
+    parser.add_argument('--max-mb', type=float, default=50, help="单个请求体的大小上限（MB）")
+    args = parser.parse_args()
+
+    server = WatermarkServer(args.host, args.port, args.workers, args.max_pending,
+                             int(args.max_mb * 1024 * 1024))
+    print(f"水印服务已启动: {server.url}（工作进程 {server.workers}，排队上限 {server.max_pending}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("正在停止服务...")
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())